@@ -1,5 +1,8 @@
 from __future__ import unicode_literals
 
+import os
+import unittest
+
 from six.moves import configparser
 from os.path import join, dirname
 
@@ -37,3 +40,10 @@ def get_config():
     except configparser.NoSectionError:
         # In case there is no file at all
         return defaults
+
+
+# Speed comparisons depend on the load of the machine running them, they are
+# skipped unless ZIMSOAP_BENCHMARKS is set.
+benchmark = unittest.skipUnless(
+    os.environ.get('ZIMSOAP_BENCHMARKS'),
+    'benchmark, set ZIMSOAP_BENCHMARKS=1 to run it')
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" A local fake SOAP server, for unit-testing clients and transport without
+a zimbra server.
+"""
+
+import gzip
+import io
+import socket
+import struct
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+
+from zimsoap import transport
+
+
+SOAP_ENVELOPE = (
+    '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+    '<soap:Header><context xmlns="urn:zimbra"/></soap:Header>'
+    '<soap:Body>{0}</soap:Body></soap:Envelope>')
+
+SOAP_RESPONSE = SOAP_ENVELOPE.format(
+    '<NoOpResponse xmlns="urn:zimbraAdmin"/>')
+
+FAULT = (
+    '<soap:Fault{0}>'
+    '<soap:Code><soap:Value>soap:Sender</soap:Value></soap:Code>'
+    '<soap:Reason><soap:Text>{1}</soap:Text></soap:Reason>'
+    '<soap:Detail><Error xmlns="urn:zimbra">'
+    '<Code>{2}</Code><Trace>t</Trace></Error>'
+    '</soap:Detail></soap:Fault>')
+
+# queued in place of a response to reset the connection without answering
+RESET = (None, None)
+
+SOAP_FAULT = SOAP_ENVELOPE.format(
+    FAULT.format('', 'no such account', 'account.NO_SUCH_ACCOUNT'))
+
+
+def fault(msg, code, request_id=None):
+    """ A soap:Fault tag, to be used in a BatchResponse if request_id is set
+    """
+    if request_id is None:
+        attrs = ''
+    else:
+        attrs = ' requestId="{0}"'.format(request_id)
+    return FAULT.format(attrs, msg, code)
+
+
+class FakeSOAPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        request = self.rfile.read(length)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            request = gzip.GzipFile(fileobj=io.BytesIO(request)).read()
+        with self.server.lock:
+            self.server.requests.append(request)
+            self.server.headers.append(self.headers)
+            queued = self.server.responses and self.server.responses.pop(0)
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(
+                self.server.max_in_flight, self.server.in_flight)
+        try:
+            response = self._response(request, queued)
+        finally:
+            # before answering: the client may send another one right after
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+        if response == RESET:
+            self.connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.connection.close()
+            self.close_connection = True
+        else:
+            self._send(*response)
+
+    def _response(self, request, queued):
+        """ :returns: a (code, body, headers) tuple, or RESET
+        """
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if queued == RESET:
+            return RESET
+        elif queued:
+            return queued[0], queued[1], queued[2:] and queued[2]
+        elif self.server.responder:
+            return 200, SOAP_ENVELOPE.format(
+                self.server.responder(request)), ()
+        elif self.path == '/fault':
+            return 500, SOAP_FAULT, ()
+        elif self.path == '/missing':
+            return 404, 'not found', ()
+        else:
+            return 200, SOAP_RESPONSE, ()
+
+    def do_GET(self):
+        # the path is recorded as the request
+        with self.server.lock:
+            self.server.requests.append(self.path.encode('utf-8'))
+            self.server.headers.append(self.headers)
+            queued = self.server.responses and self.server.responses.pop(0)
+        self._send(*(queued or (200, '', ())))
+
+    def _send(self, code, body, headers):
+        body = body.encode('utf-8')
+        self.send_response(code)
+        if (self.server.compress and
+                'gzip' in self.headers.get('Accept-Encoding', '')):
+            body = transport.gzip_compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/soap+xml')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSOAPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Answers the queued responses (see reply()) in order, or a
+    NoOpResponse when there is none.
+
+    If set, `responder` is called with the request body to build the
+    content of the soap:Body of the response when there is no queued one.
+
+    The received request bodies (the paths of GET requests) are stored in
+    self.requests, and their headers in self.headers. Each connection is
+    handled in its own thread, and each response is delayed by `delay`
+    seconds, the highest number of requests handled at the same time
+    being kept in self.max_in_flight. Responses are gzipped if `compress` is
+    set and the client accepts it.
+    """
+    daemon_threads = True
+    # many concurrent clients connect at once
+    request_queue_size = 64
+
+    def __init__(self, delay=0, compress=False):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), FakeSOAPHandler)
+        self.requests = []
+        self.headers = []
+        self.responses = []
+        self.compress = compress
+        self.delay = delay
+        self.responder = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path='/service/admin/soap'):
+        return 'http://127.0.0.1:{0}{1}'.format(self.server_port, path)
+
+    def reply(self, body, code=200):
+        """ Queues a response, body is the content of the soap:Body tag
+        """
+        self.responses.append((code, SOAP_ENVELOPE.format(body)))
+
+    def reply_raw(self, body='', code=200, headers=()):
+        """ Queues a response, not wrapped in a SOAP envelope
+
+        :param headers: additional headers, as (name, value) tuples
+        """
+        self.responses.append((code, body, headers))
+
+    def reset(self):
+        """ Queues the reset of the connection once the request is read,
+        without answering it
+        """
+        self.responses.append(RESET)
+
+    def client(self, cls, **kwargs):
+        """ Builds a client of the given class, talking to that server
+        """
+        zc = cls('127.0.0.1', self.server_port, **kwargs)
+        zc.com = zc.COMMUNICATION(
+            self.url('/'+zc.LOCATION), zc.pool_manager)
+        return zc
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
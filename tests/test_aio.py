@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+""" Unittests for zimsoap.aio, against a local fake SOAP server """
+
+import asyncio
+import datetime
+import unittest
+
+from zimsoap.aio import (
+    AsyncZimbraAccountClient, AsyncZimbraAdminClient, AsyncZimbraMailClient)
+from zimsoap.client import (
+    AccountRESTClient, ZimbraAdminClient, ZimbraSoapServerError)
+from zimsoap.ratelimit import RateLimiter
+from zimsoap.routing import MailboxRouter
+from zimsoap.transport import HTTPError, URLError
+from . import fakeserver
+
+
+AUTH_RESPONSE = (
+    '<AuthResponse xmlns="{0}">'
+    '<authToken>0_1234</authToken><lifetime>3600000</lifetime>'
+    '</AuthResponse>')
+
+
+class HttpAccountRESTClient(AccountRESTClient):
+    def __init__(self, *args, **kwargs):
+        super(HttpAccountRESTClient, self).__init__(*args, **kwargs)
+        self.preauth_url = self.preauth_url.replace('https:', 'http:')
+
+
+class HttpAccountClient(AsyncZimbraAccountClient):
+    """ Gets its preauth tokens from the (http) fake server
+    """
+    REST_PREAUTH = HttpAccountRESTClient
+
+
+class AsyncTestCase(unittest.TestCase):
+    """ Runs each test within a single event loop, the pooled connections
+    being bound to it.
+    """
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+
+class AsyncClientTests(AsyncTestCase):
+    def setUp(self):
+        super(AsyncClientTests, self).setUp()
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(AsyncZimbraAdminClient)
+
+    def tearDown(self):
+        self.zc.close()
+        self.server.stop()
+        super(AsyncClientTests, self).tearDown()
+
+    def test_request(self):
+        resp = self.run_async(self.zc.request('NoOp'))
+        self.assertEqual(resp, {})
+
+    def test_request_single_and_list(self):
+        body = ('<GetAllDomainsResponse xmlns="urn:zimbraAdmin">'
+                '<domain id="1" name="a.example.com"/>'
+                '<domain id="2" name="b.example.com"/>'
+                '</GetAllDomainsResponse>')
+        self.server.reply(body)
+        self.server.reply(body)
+
+        async def run():
+            return (await self.zc.request_single('GetAllDomains'),
+                    await self.zc.request_list('GetAllDomains'))
+
+        single, domains = self.run_async(run())
+        self.assertEqual(single['name'], 'a.example.com')
+        self.assertEqual([d['id'] for d in domains], ['1', '2'])
+
+    def test_login(self):
+        self.server.reply(AUTH_RESPONSE.format('urn:zimbraAdmin'))
+        self.run_async(self.zc.login('admin@example.com', 'secret'))
+        self.assertTrue(self.zc._session.is_logged_in())
+
+        self.run_async(self.zc.request('NoOp'))
+        self.assertIn(b'<authToken>0_1234</authToken>',
+                      self.server.requests[1])
+
+    def test_mail_client_authenticates_with_account_namespace(self):
+        zc = self.server.client(AsyncZimbraMailClient)
+        self.server.reply(AUTH_RESPONSE.format('urn:zimbraAccount'))
+        self.run_async(zc.login('user@example.com', 'secret'))
+        self.assertIn(b'urn:zimbraAccount', self.server.requests[0])
+        zc.close()
+
+    def test_login_is_routed(self):
+        admin_server = fakeserver.FakeSOAPServer()
+        admin_server.responder = lambda req: (
+            '<GetAccountResponse xmlns="urn:zimbraAdmin">'
+            '<account id="1" name="user@example.com">'
+            '<a n="zimbraMailHost">127.0.0.1</a>'
+            '</account></GetAccountResponse>')
+        store = fakeserver.FakeSOAPServer()
+        router = MailboxRouter(admin_server.client(ZimbraAdminClient),
+                               port=store.server_port, scheme='http')
+
+        zc = self.server.client(AsyncZimbraMailClient, router=router)
+        store.reply(AUTH_RESPONSE.format('urn:zimbraAccount'))
+        self.run_async(zc.login('user@example.com', 'secret'))
+        self.run_async(zc.request('NoOp'))
+        zc.close()
+        admin_server.stop()
+        store.stop()
+
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(len(store.requests), 2)
+        self.assertEqual(zc.login_account, 'user@example.com')
+
+    def test_fault(self):
+        self.server.reply(
+            fakeserver.fault('no such account', 'account.NO_SUCH_ACCOUNT'),
+            code=500)
+        with self.assertRaises(ZimbraSoapServerError) as cm:
+            self.run_async(self.zc.request('GetAccount'))
+        self.assertEqual(cm.exception.code, 'account.NO_SUCH_ACCOUNT')
+
+    def test_session_invalid(self):
+        self.server.reply(
+            fakeserver.fault('auth expired', 'service.AUTH_EXPIRED'),
+            code=500)
+        self.zc._session.import_session('0_1234')
+        self.assertFalse(self.run_async(self.zc.is_session_valid()))
+
+    def test_http_error(self):
+        zc = self.server.client(AsyncZimbraAccountClient)
+        zc.com.path = '/missing'
+        with self.assertRaises(HTTPError):
+            self.run_async(zc.request('NoOp'))
+        zc.close()
+
+    def test_json_wire_format(self):
+        zc = self.server.client(AsyncZimbraAdminClient, wire_format='json')
+        self.server.responses.append(
+            (200, '{"Body": {"NoOpResponse": {"_jsns": "urn:zimbraAdmin"}}}'))
+        self.assertEqual(self.run_async(zc.request('NoOp')), {})
+        self.assertIn(b'"NoOpRequest"', self.server.requests[0])
+        zc.close()
+
+    def test_request_many(self):
+        self.server.reply('<NoOpResponse xmlns="urn:zimbraAdmin"/>')
+        self.server.reply(
+            fakeserver.fault('no such account', 'account.NO_SUCH_ACCOUNT'),
+            code=500)
+        res = self.run_async(self.zc.request_many(
+            [('NoOp', {}), ('GetAccount', {})], return_exceptions=True))
+        self.assertEqual(len(res), 2)
+        self.assertEqual(
+            sum(isinstance(r, ZimbraSoapServerError) for r in res), 1)
+
+    def test_compressed_response(self):
+        self.server.compress = True
+        self.assertEqual(self.run_async(self.zc.request('NoOp')), {})
+        stats = self.zc.get_transfer_stats()['NoOpRequest']
+        self.assertNotEqual(stats['response_bytes'],
+                            stats['response_wire_bytes'])
+
+    def test_processed_request_is_not_sent_again(self):
+        self.run_async(self.zc.request('NoOp'))
+        self.server.reset()
+        with self.assertRaises(URLError):
+            self.run_async(self.zc.request('NoOp'))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_batch(self):
+        self.server.reply(
+            '<BatchResponse xmlns="urn:zimbra">'
+            '<NoOpResponse requestId="1" xmlns="urn:zimbraAdmin"/>'
+            + fakeserver.fault('no such account', 'account.NO_SUCH_ACCOUNT',
+                               request_id=2) +
+            '</BatchResponse>')
+
+        async def batch():
+            async with self.zc.batch() as b:
+                await b.request('NoOp')
+                await b.request('ModifyAccount', {'id': 'x'})
+            return b
+
+        b = self.run_async(batch())
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn(b'BatchRequest', self.server.requests[0])
+        self.assertEqual(b.items[0].result(), {})
+        with self.assertRaises(ZimbraSoapServerError):
+            b.items[1].result()
+
+    def test_iter_request(self):
+        self.server.reply(
+            '<GetAllDomainsResponse xmlns="urn:zimbraAdmin">'
+            '<domain id="1" name="a.example.com"/>'
+            '<domain id="2" name="b.example.com"/>'
+            '</GetAllDomainsResponse>')
+
+        async def names():
+            return [d['name']
+                    async for tag, d in self.zc.iter_request('GetAllDomains')]
+
+        self.assertEqual(self.run_async(names()),
+                         ['a.example.com', 'b.example.com'])
+
+    def test_get_logged_in_by(self):
+        self.server.reply(
+            '<GetDomainResponse xmlns="urn:zimbraAdmin">'
+            '<domain id="1" name="example.com">'
+            '<a n="zimbraPreAuthKey">abcd</a>'
+            '</domain></GetDomainResponse>')
+        self.server.reply_raw(code=302, headers=[
+            ('Location', '/'),
+            ('Set-Cookie', 'ZM_AUTH_TOKEN=0_token; Path=/')])
+
+        zc = self.server.client(HttpAccountClient)
+        self.run_async(zc.get_logged_in_by('foo@example.com', self.zc, 600))
+        self.assertEqual(zc._session.authToken, '0_token')
+        self.assertLess(
+            zc._session.end_date,
+            datetime.datetime.now() + datetime.timedelta(seconds=600))
+        self.assertIn(b'attrs="zimbraPreAuthKey"', self.server.requests[0])
+        self.assertTrue(
+            self.server.requests[1].startswith(b'/service/preauth'))
+        zc.close()
+
+
+class AsyncConcurrencyTests(AsyncTestCase):
+    def setUp(self):
+        super(AsyncConcurrencyTests, self).setUp()
+        self.server = fakeserver.FakeSOAPServer(delay=0.1)
+
+    def tearDown(self):
+        self.server.stop()
+        super(AsyncConcurrencyTests, self).tearDown()
+
+    def send_noops(self, zc, count):
+        async def run():
+            return await asyncio.gather(
+                *(zc.request('NoOp') for i in range(count)))
+
+        self.run_async(run())
+        zc.close()
+
+    def test_requests_are_concurrent(self):
+        zc = self.server.client(AsyncZimbraAdminClient, max_concurrency=10)
+        self.send_noops(zc, 10)
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_concurrency_is_bounded(self):
+        zc = self.server.client(AsyncZimbraAdminClient, max_concurrency=2)
+        self.send_noops(zc, 6)
+        self.assertEqual(self.server.max_in_flight, 2)
+
+        stats = zc.get_pool_stats()[('127.0.0.1', self.server.server_port)]
+        self.assertEqual(stats['new_connections'], 2)
+        self.assertEqual(stats['hits'], 4)
+
+
+class AsyncCoalescingTests(AsyncTestCase):
+    def setUp(self):
+        super(AsyncCoalescingTests, self).setUp()
+        self.server = fakeserver.FakeSOAPServer(delay=0.05)
+        self.zc = self.server.client(AsyncZimbraAdminClient,
+                                     coalesce_reads=True)
+
+    def tearDown(self):
+        self.zc.close()
+        self.server.stop()
+        super(AsyncCoalescingTests, self).tearDown()
+
+    def gather(self, *requests):
+        async def run():
+            return await asyncio.gather(
+                *(self.zc.request(*i) for i in requests),
+                return_exceptions=True)
+        return self.run_async(run())
+
+    def test_identical_reads_share_a_call(self):
+        self.server.reply('<GetVersionInfoResponse xmlns="urn:zimbraAdmin">'
+                          '<info version="8"/></GetVersionInfoResponse>')
+        results = self.gather(*[('GetVersionInfo',)] * 3)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(results[0], {'info': {'version': '8'}})
+        self.assertEqual(results[0], results[1])
+        self.assertIsNot(results[0], results[1])
+        self.assertEqual(self.zc.single_flight.stats(),
+                         {'calls': 1, 'shared': 2})
+
+    def test_errors_are_shared(self):
+        self.server.reply(fakeserver.fault(
+            'no such account', 'account.NO_SUCH_ACCOUNT'), code=500)
+        results = self.gather(*[('GetAccount', {'account': 'x'})] * 2)
+        self.assertEqual(len(self.server.requests), 1)
+        for e in results:
+            self.assertIsInstance(e, ZimbraSoapServerError)
+
+    def test_writes_are_not_coalesced(self):
+        self.gather(*[('ModifyAccount', {'id': 'x'})] * 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class AsyncRateLimitTests(AsyncTestCase):
+    def setUp(self):
+        super(AsyncRateLimitTests, self).setUp()
+        self.server = fakeserver.FakeSOAPServer()
+        self.limiter = RateLimiter(rate=1000, max_in_flight=2, backoff=0.01)
+        self.zc = self.server.client(AsyncZimbraAdminClient,
+                                     rate_limiter=self.limiter)
+        self.key = ('127.0.0.1', self.server.server_port)
+
+    def tearDown(self):
+        self.zc.close()
+        self.server.stop()
+        super(AsyncRateLimitTests, self).tearDown()
+
+    def test_throttled_requests_are_retried(self):
+        self.server.responses.append((503, 'Service Unavailable'))
+        self.server.reply(fakeserver.fault(
+            'try again', 'service.TEMPORARILY_UNAVAILABLE'), code=500)
+        self.assertEqual(self.run_async(self.zc.request('NoOp')), {})
+        self.assertEqual(len(self.server.requests), 3)
+
+        stats = self.limiter.stats()[self.key]
+        self.assertEqual(stats['throttled'], 2)
+        self.assertLess(stats['rate'], 1000)
+
+    def test_in_flight_limit(self):
+        self.server.delay = 0.02
+        self.run_async(self.zc.request_many([('NoOp', {})] * 8))
+        self.assertEqual(len(self.server.requests), 8)
+        self.assertEqual(self.server.max_in_flight, 2)
+        self.assertEqual(self.limiter.stats()[self.key]['in_flight'], 0)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.attrtypes """
+
+import io
+import re
+import timeit
+import unittest
+
+from zimsoap import attrtypes, utils
+from zimsoap.zobjects import Account
+from . import benchmark, samples
+
+
+ATTRS_XML = b'''<attrs group="ZimbraAttrType">
+<attr id="1" name="zimbraTestFlag" type="boolean" cardinality="single"/>
+<attr id="2" name="zimbraTestCount" type="integer" cardinality="single"/>
+<attr id="3" name="zimbraTestCode" type="string" cardinality="single"/>
+</attrs>'''
+
+
+def sample_attrs():
+    """ (name, value) of all the <a> tags of the samples
+    """
+    attrs = []
+    for name in dir(samples):
+        if name.isupper():
+            attrs.extend(re.findall(
+                r'<a n="([^"]+)"[^>]*>([^<]*)</a>', getattr(samples, name)))
+    return attrs
+
+
+class AttrTypesTests(unittest.TestCase):
+    def tearDown(self):
+        for name in ('zimbraTestFlag', 'zimbraTestCount', 'zimbraTestCode'):
+            attrtypes.ATTR_TYPES.pop(name, None)
+            attrtypes._converters.pop(name, None)
+
+    def test_known_types(self):
+        self.assertIs(attrtypes.convert('zimbraIsAdminAccount', 'TRUE'), True)
+        self.assertEqual(attrtypes.convert('zimbraMailQuota', '1024'), 1024)
+        self.assertEqual(
+            attrtypes.convert('zimbraPrefTrashLifetime', '0'), '0')
+
+    def test_strings_are_not_guessed(self):
+        self.assertEqual(attrtypes.convert('postalCode', '01234'), '01234')
+        self.assertEqual(
+            attrtypes.convert('telephoneNumber', '0612345678'), '0612345678')
+
+    def test_unknown_attribute_falls_back_to_auto_type(self):
+        self.assertEqual(attrtypes.convert('unknownAttr', '4.2'), 4.2)
+        self.assertIs(attrtypes.get_converter('unknownAttr'), utils.auto_type)
+
+    def test_load_attrs_xml(self):
+        attrtypes.load_attrs_xml(io.BytesIO(ATTRS_XML))
+        self.assertEqual(attrtypes.ATTR_TYPES['zimbraTestCount'], 'integer')
+        self.assertIs(attrtypes.convert('zimbraTestFlag', 'FALSE'), False)
+        self.assertEqual(attrtypes.convert('zimbraTestCount', '3'), 3)
+        self.assertEqual(attrtypes.convert('zimbraTestCode', '3'), '3')
+
+    def test_a_tags_are_typed_by_name(self):
+        acc = Account.from_dict({'a': [
+            {'n': 'postalCode', '_content': '01234'},
+            {'n': 'zimbraMailQuota', '_content': '1024'}]})
+        self.assertEqual(acc['postalCode'], '01234')
+        self.assertEqual(acc['zimbraMailQuota'], 1024)
+
+    @benchmark
+    def test_speed(self):
+        attrs = sample_attrs()
+        guess = utils.auto_type.__wrapped__
+        ref = min(timeit.repeat(
+            lambda: [guess(v) for n, v in attrs],
+            number=200, repeat=5))
+        new = min(timeit.repeat(
+            lambda: [attrtypes.convert(n, v) for n, v in attrs],
+            number=200, repeat=5))
+        # measured 3.5-4x
+        self.assertLess(new * 3, ref)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.cache """
+
+import unittest
+
+from zimsoap import cache
+from zimsoap.cache import DirectoryCache
+from zimsoap.client import ZimbraAdminClient
+from zimsoap.zobjects import Account, Domain
+from . import fakeserver
+
+
+ACCOUNT_ID = 'd78fd9c9-f000-440b-bce6-ea938d40fa2d'
+GET_ACCOUNT_RESPONSE = (
+    '<GetAccountResponse xmlns="urn:zimbraAdmin">'
+    '<account id="{0}" name="foo@example.com">'
+    '<a n="zimbraMailAlias">alias@example.com</a>'
+    '<a n="zimbraMailQuota">{1}</a>'
+    '</account></GetAccountResponse>')
+
+
+class DirectoryCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.orig_clock = cache.clock
+        cache.clock = lambda: self.now
+        self.cache = DirectoryCache(maxsize=2, ttl=60)
+
+    def tearDown(self):
+        cache.clock = self.orig_clock
+
+    def account(self, zid, name):
+        account = Account(id=zid, name=name)
+        account['zimbraMailAlias'] = ['a-' + name, 'b-' + name]
+        return account
+
+    def test_found_by_any_selector(self):
+        account = self.account('1', 'foo@example.com')
+        self.cache.put(Account, account)
+        for selector in (Account(id='1'), Account(name='FOO@example.com'),
+                         Account(name='b-foo@example.com')):
+            self.assertIs(self.cache.get(Account, selector), account)
+        self.assertIsNone(self.cache.get(Account, Account(name='x')))
+        # cached by class
+        self.assertIsNone(self.cache.get(Domain, Domain(id='1')))
+        self.assertEqual(self.cache.stats(), {
+            'hits': 3, 'misses': 2, 'evictions': 0, 'size': 1})
+
+    def test_expiry(self):
+        self.cache.put(Account, self.account('1', 'foo@example.com'))
+        self.now += 59
+        self.assertIsNotNone(self.cache.get(Account, Account(id='1')))
+        self.now += 1
+        self.assertIsNone(self.cache.get(Account, Account(id='1')))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_evicted(self):
+        self.cache.put(Account, self.account('1', 'a@example.com'))
+        self.cache.put(Account, self.account('2', 'b@example.com'))
+        self.cache.get(Account, Account(id='1'))
+        self.cache.put(Account, self.account('3', 'c@example.com'))
+
+        self.assertIsNone(self.cache.get(Account, Account(id='2')))
+        self.assertIsNone(
+            self.cache.get(Account, Account(name='b@example.com')))
+        self.assertIsNotNone(self.cache.get(Account, Account(id='1')))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        self.cache.put(Account, self.account('1', 'foo@example.com'))
+        self.cache.invalidate(Account, Account(name='a-foo@example.com'))
+        self.assertIsNone(self.cache.get(Account, Account(id='1')))
+        self.assertEqual(self.cache._ids, {})
+
+
+class CachingClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient, cache=True)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_fetched_once(self):
+        self.server.reply(GET_ACCOUNT_RESPONSE.format(ACCOUNT_ID, 1))
+        first = self.zc.get_account(Account(name='foo@example.com'))
+        second = self.zc.get_account(Account(name='alias@example.com'))
+        self.zc.get_account(Account(id=ACCOUNT_ID))
+        self.assertIs(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.zc.cache.stats()['hits'], 2)
+
+    def test_projections_not_cached(self):
+        self.server.reply(GET_ACCOUNT_RESPONSE.format(ACCOUNT_ID, 1))
+        self.server.reply(GET_ACCOUNT_RESPONSE.format(ACCOUNT_ID, 1))
+        self.zc.get_account(Account(name='foo@example.com'),
+                            attrs=['zimbraMailQuota'])
+        self.zc.get_account(Account(name='foo@example.com'))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_modified_objects_dropped(self):
+        self.server.reply(GET_ACCOUNT_RESPONSE.format(ACCOUNT_ID, 1))
+        self.server.reply('<ModifyAccountResponse xmlns="urn:zimbraAdmin"/>')
+        self.server.reply(GET_ACCOUNT_RESPONSE.format(ACCOUNT_ID, 2))
+
+        # the id is fetched through the cache
+        self.zc.modify_account(Account(name='foo@example.com'),
+                               {'zimbraMailQuota': 2})
+        account = self.zc.get_account(Account(name='foo@example.com'))
+
+        self.assertEqual(account['zimbraMailQuota'], 2)
+        self.assertIn(b'GetAccountRequest', self.server.requests[2])
+        self.assertEqual(len(self.zc.cache), 1)
+
+    def test_modified_in_batch(self):
+        self.server.reply(GET_ACCOUNT_RESPONSE.format(ACCOUNT_ID, 1))
+        self.server.reply(
+            '<BatchResponse xmlns="urn:zimbra">'
+            '<ModifyAccountResponse requestId="1" xmlns="urn:zimbraAdmin"/>'
+            '</BatchResponse>')
+        self.server.reply(GET_ACCOUNT_RESPONSE.format(ACCOUNT_ID, 2))
+
+        with self.zc.batch():
+            self.zc.modify_account(Account(id=ACCOUNT_ID),
+                                   {'zimbraMailQuota': 2})
+            # read (and cached) before the modification is sent
+            account = self.zc.get_account(Account(id=ACCOUNT_ID))
+            self.assertEqual(account['zimbraMailQuota'], 1)
+
+        account = self.zc.get_account(Account(id=ACCOUNT_ID))
+        self.assertEqual(account['zimbraMailQuota'], 2)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_disabled_by_default(self):
+        zc = self.server.client(ZimbraAdminClient)
+        self.assertIsNone(zc.cache)
+        zc.pool_manager.close()
@@ -0,0 +1,741 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.client, against a local fake SOAP server """
+
+import json
+import re
+import time
+import unittest
+
+from six.moves.urllib.parse import parse_qsl, urlparse
+
+from zimsoap import utils
+from zimsoap.client import (
+    AccountRESTClient, AdminRESTClient, BatchItem, DomainHasNoPreAuthKey,
+    ZimbraAccountClient, ZimbraAdminClient, ZimbraMailClient,
+    ZimbraSoapServerError, ZimbraSoapUnexpectedResponse, ZimSOAPException)
+from zimsoap.ratelimit import RateLimiter
+from zimsoap.zobjects import Account, CompactAccount, Domain, Server
+from . import fakeserver
+
+
+ACCOUNT_ID_1 = 'd78fd9c9-f000-440b-bce6-ea938d40fa2d'
+ACCOUNT_ID_2 = 'dddddddd-f000-440b-bce6-dddddddddddd'
+
+
+class BatchTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_batch_sends_one_request(self):
+        self.server.reply(
+            '<BatchResponse xmlns="urn:zimbra">'
+            '<ModifyAccountResponse requestId="1" xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com"/>'
+            '</ModifyAccountResponse>'
+            '<AddAccountAliasResponse requestId="2" xmlns="urn:zimbraAdmin"/>'
+            '</BatchResponse>'.format(ACCOUNT_ID_1))
+
+        with self.zc.batch() as b:
+            ret = b.modify_account(Account(id=ACCOUNT_ID_1),
+                                   {'displayName': 'Foo'})
+            self.zc.add_account_alias(Account(id=ACCOUNT_ID_1),
+                                      'bar@example.com')
+
+        self.assertIsNone(ret)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn(b'<BatchRequest', self.server.requests[0])
+        self.assertIn(b'onerror="continue"', self.server.requests[0])
+
+        res = b.results()
+        self.assertEqual(res[0]['account']['id'], ACCOUNT_ID_1)
+        self.assertEqual(res[1], {})
+
+    def test_batch_item_fault(self):
+        self.server.reply(
+            '<BatchResponse xmlns="urn:zimbra">'
+            '<ModifyAccountResponse requestId="1" xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com"/>'
+            '</ModifyAccountResponse>{1}'
+            '</BatchResponse>'.format(
+                ACCOUNT_ID_1,
+                fakeserver.fault('no such account',
+                                 'account.NO_SUCH_ACCOUNT', 2)))
+
+        with self.zc.batch() as b:
+            self.zc.modify_account(Account(id=ACCOUNT_ID_1), {'sn': 'Foo'})
+            self.zc.modify_account(Account(id=ACCOUNT_ID_2), {'sn': 'Foo'})
+
+        self.assertEqual(b.items[0].result()['account']['id'], ACCOUNT_ID_1)
+        with self.assertRaises(ZimbraSoapServerError) as cm:
+            b.items[1].result()
+        self.assertEqual(cm.exception.code, 'account.NO_SUCH_ACCOUNT')
+        self.assertIsInstance(b.results()[1], ZimbraSoapServerError)
+
+    def test_batch_stop_on_error(self):
+        self.server.reply(
+            '<BatchResponse xmlns="urn:zimbra">{0}</BatchResponse>'.format(
+                fakeserver.fault('no such account',
+                                 'account.NO_SUCH_ACCOUNT', 1)))
+
+        with self.zc.batch(onerror='stop') as b:
+            self.zc.modify_account(Account(id=ACCOUNT_ID_2), {'sn': 'Foo'})
+            self.zc.modify_account(Account(id=ACCOUNT_ID_1), {'sn': 'Foo'})
+
+        self.assertIn(b'onerror="stop"', self.server.requests[0])
+        with self.assertRaises(ZimbraSoapServerError):
+            b.items[0].result()
+        with self.assertRaises(ZimbraSoapUnexpectedResponse):
+            b.items[1].result()
+
+    def test_batch_max_size(self):
+        for i in range(3):
+            self.server.reply(
+                '<BatchResponse xmlns="urn:zimbra">'
+                '<ModifyAccountResponse requestId="1" xmlns="urn:zimbraAdmin">'
+                '<account id="{0}" name="foo@example.com"/>'
+                '</ModifyAccountResponse></BatchResponse>'.format(
+                    ACCOUNT_ID_1))
+
+        with self.zc.batch(max_size=1) as b:
+            for i in range(3):
+                self.zc.modify_account(Account(id=ACCOUNT_ID_1), {'sn': i})
+
+        self.assertEqual(len(self.server.requests), 3)
+        for item in b.items:
+            self.assertEqual(item.result()['account']['id'], ACCOUNT_ID_1)
+
+    def test_batch_read_requests_are_not_queued(self):
+        self.server.reply(
+            '<GetAccountResponse xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com"/>'
+            '</GetAccountResponse>'.format(ACCOUNT_ID_1))
+        self.server.reply(
+            '<BatchResponse xmlns="urn:zimbra">'
+            '<ModifyAccountResponse requestId="1" xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com"/>'
+            '</ModifyAccountResponse></BatchResponse>'.format(ACCOUNT_ID_1))
+
+        with self.zc.batch() as b:
+            # needs a GetAccount to find out the account id
+            self.zc.modify_account(Account(name='foo@example.com'),
+                                   {'sn': 'Foo'})
+            self.assertEqual(len(self.server.requests), 1)
+            self.assertIn(b'GetAccountRequest', self.server.requests[0])
+
+        self.assertIn(b'BatchRequest', self.server.requests[1])
+        self.assertIn(ACCOUNT_ID_1.encode('utf-8'), self.server.requests[1])
+        self.assertEqual(b.items[0].result()['account']['id'], ACCOUNT_ID_1)
+
+    def test_batch_not_sent_on_exception(self):
+        with self.assertRaises(KeyError):
+            with self.zc.batch() as b:
+                self.zc.modify_account(Account(id=ACCOUNT_ID_1), {'sn': 'F'})
+                raise KeyError
+
+        self.assertEqual(self.server.requests, [])
+        self.assertIsInstance(b.items[0], BatchItem)
+        with self.assertRaises(ZimSOAPException):
+            b.items[0].result()
+
+        # the client is back to normal
+        self.zc.request('NoOp')
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class JsonWireFormatTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient, wire_format='json')
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_invalid_wire_format(self):
+        with self.assertRaises(ValueError):
+            ZimbraAdminClient('127.0.0.1', wire_format='yaml')
+
+    def test_get_account(self):
+        self.server.responses.append((200, json.dumps({
+            'Header': {'context': {'_jsns': 'urn:zimbra'}},
+            'Body': {'GetAccountResponse': {
+                '_jsns': 'urn:zimbraAdmin',
+                'account': [{
+                    'id': ACCOUNT_ID_1, 'name': 'foo@example.com',
+                    'a': [{'n': 'zimbraMailQuota', '_content': '0'},
+                          {'n': 'zimbraIsAdminAccount', '_content': 'TRUE'}]
+                }]}}})))
+
+        content = {'account': {'by': 'name', '_content': 'foo@example.com'}}
+        account = self.zc.get_account(Account(name='foo@example.com'))
+
+        sent = json.loads(self.server.requests[0].decode('utf-8'))
+        self.assertEqual(sent['Body']['GetAccountRequest']['account'],
+                         content['account'])
+        self.assertEqual(account.id, ACCOUNT_ID_1)
+        self.assertEqual(account['zimbraMailQuota'], 0)
+        self.assertTrue(account.is_admin())
+
+    def test_fault(self):
+        self.server.responses.append((500, json.dumps({
+            'Body': {'Fault': {
+                'Code': {'Value': 'soap:Sender'},
+                'Reason': {'Text': 'no such account: foo@example.com'},
+                'Detail': {'Error': {
+                    'Code': 'account.NO_SUCH_ACCOUNT', 'Trace': 't',
+                    '_jsns': 'urn:zimbra'}},
+                '_jsns': 'urn:zimbraSoap'}}})))
+
+        with self.assertRaises(ZimbraSoapServerError) as cm:
+            self.zc.get_account(Account(name='foo@example.com'))
+        self.assertEqual(cm.exception.code, 'account.NO_SUCH_ACCOUNT')
+
+    def test_batch(self):
+        self.server.responses.append((200, json.dumps({
+            'Body': {'BatchResponse': {
+                '_jsns': 'urn:zimbra',
+                'ModifyAccountResponse': [
+                    {'requestId': '1', '_jsns': 'urn:zimbraAdmin',
+                     'account': [{'id': ACCOUNT_ID_1}]},
+                    {'requestId': '2', '_jsns': 'urn:zimbraAdmin',
+                     'account': [{'id': ACCOUNT_ID_2}]}]}}})))
+
+        with self.zc.batch() as b:
+            self.zc.modify_account(Account(id=ACCOUNT_ID_1), {'sn': 'Foo'})
+            self.zc.modify_account(Account(id=ACCOUNT_ID_2), {'sn': 'Foo'})
+
+        self.assertEqual(
+            [r['account']['id'] for r in b.results()],
+            [ACCOUNT_ID_1, ACCOUNT_ID_2])
+
+
+class RequestManyTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer(delay=0.05)
+        self.zc = self.server.client(ZimbraAdminClient)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def count_request(self, i):
+        return ('CountAccount', {'domain': {'by': 'name',
+                                            '_content': 'd{0}.com'.format(i)}})
+
+    def count_response(self, request):
+        # answers each request with the number in its domain name
+        i = re.search(br'd(\d+)\.com', request).group(1).decode()
+        return ('<CountAccountResponse xmlns="urn:zimbraAdmin">'
+                '<cos id="{0}" name="default">{0}</cos>'
+                '</CountAccountResponse>'.format(i))
+
+    def test_results_in_input_order(self):
+        self.server.responder = self.count_response
+        self.zc.login_with_authToken('0_1234')
+
+        res = self.zc.request_many(
+            [self.count_request(i) for i in range(20)], max_workers=10)
+
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 10)
+        self.assertEqual([int(r['cos']['_content']) for r in res],
+                         list(range(20)))
+        for req in self.server.requests:
+            self.assertIn(b'<authToken>0_1234</authToken>', req)
+
+        stats = self.zc.get_pool_stats()[
+            ('127.0.0.1', self.server.server_port)]
+        self.assertLessEqual(stats['new_connections'], 10)
+
+    def test_error_is_raised(self):
+        self.server.reply(
+            fakeserver.fault('no such domain', 'account.NO_SUCH_DOMAIN'),
+            code=500)
+        with self.assertRaises(ZimbraSoapServerError):
+            self.zc.request_many([('NoOp', {})] * 3, max_workers=1)
+
+    def test_return_exceptions(self):
+        self.server.reply('<NoOpResponse xmlns="urn:zimbraAdmin"/>')
+        self.server.reply(
+            fakeserver.fault('no such domain', 'account.NO_SUCH_DOMAIN'),
+            code=500)
+        res = self.zc.request_many(
+            [('NoOp', {}), ('NoOp', {}, 'urn:zimbraAdmin')], max_workers=1,
+            return_exceptions=True)
+        self.assertEqual(res[0], {})
+        self.assertIsInstance(res[1], ZimbraSoapServerError)
+
+    def test_batches_are_per_thread(self):
+        self.server.reply('<ModifyAccountResponse xmlns="urn:zimbraAdmin"/>')
+        with self.zc.batch() as b:
+            self.zc.request_many([('ModifyAccount', {'id': ACCOUNT_ID_1})])
+        self.assertEqual(b.items, [])
+        self.assertNotIn(b'BatchRequest', self.server.requests[0])
+
+
+class StreamingTests(unittest.TestCase):
+    ACCOUNTS = (
+        '<GetAllAccountsResponse xmlns="urn:zimbraAdmin">'
+        '<account id="{0}" name="foo@example.com">'
+        '<a n="zimbraMailQuota">0</a><a n="zimbraIsAdminAccount">TRUE</a>'
+        '</account>'
+        '<account id="{1}" name="bar@example.com">'
+        '<a n="zimbraMailQuota">10</a><a n="zimbraIsSystemAccount">TRUE</a>'
+        '</account>'
+        '</GetAllAccountsResponse>'.format(ACCOUNT_ID_1, ACCOUNT_ID_2))
+
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def pool_stats(self):
+        return self.zc.get_pool_stats()[
+            ('127.0.0.1', self.server.server_port)]
+
+    def test_iter_request(self):
+        self.server.reply(self.ACCOUNTS)
+        self.server.reply(self.ACCOUNTS)
+        streamed = list(self.zc.iter_request('GetAllAccounts'))
+        self.assertEqual(
+            streamed,
+            [('account', i) for i in self.zc.request_list('GetAllAccounts')])
+        # the connection is given back once the response is read
+        self.assertEqual(self.pool_stats()['hits'], 1)
+
+    def test_iter_all_accounts(self):
+        self.server.reply(self.ACCOUNTS)
+        accounts = self.zc.iter_all_accounts()
+        self.assertNotIsInstance(accounts, list)
+
+        accounts = list(accounts)
+        self.assertEqual([a.id for a in accounts], [ACCOUNT_ID_1])
+        self.assertEqual(accounts[0]['zimbraMailQuota'], 0)
+        self.assertTrue(accounts[0].is_admin())
+
+    def test_get_all_accounts(self):
+        self.server.reply(self.ACCOUNTS)
+        accounts = self.zc.get_all_accounts(include_system_accounts=True)
+        self.assertEqual([a.id for a in accounts],
+                         [ACCOUNT_ID_1, ACCOUNT_ID_2])
+
+    def test_compact_listing(self):
+        self.zc.compact = True
+        self.server.reply(self.ACCOUNTS)
+        accounts = self.zc.get_all_accounts(include_system_accounts=True)
+        self.assertIsInstance(accounts[0], CompactAccount)
+        self.assertEqual([a.id for a in accounts],
+                         [ACCOUNT_ID_1, ACCOUNT_ID_2])
+        self.assertEqual(accounts[1]['zimbraMailQuota'], 10)
+        self.assertTrue(accounts[1].is_system())
+
+    def test_iter_search_directory(self):
+        self.server.reply(
+            '<SearchDirectoryResponse more="0" searchTotal="2" '
+            'xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com"/>'
+            '<dl id="{1}" name="list@example.com"/>'
+            '<alias id="x" name="alias@example.com"/>'
+            '</SearchDirectoryResponse>'.format(ACCOUNT_ID_1, ACCOUNT_ID_2))
+        found = list(self.zc.iter_search_directory(query='(uid=*)'))
+        self.assertEqual([type(i).__name__ for i in found],
+                         ['Account', 'DistributionList'])
+
+    def test_interrupted_stream(self):
+        self.server.reply(
+            '<GetAllAccountsResponse xmlns="urn:zimbraAdmin">{0}'
+            '</GetAllAccountsResponse>'.format(
+                '<account id="{0}" name="foo@example.com"/>'.format(
+                    ACCOUNT_ID_1) * 5000))
+        for tag, account in self.zc.iter_request('GetAllAccounts'):
+            break
+        # the partially read response cannot be reused
+        self.zc.request('NoOp')
+        self.assertEqual(self.pool_stats()['new_connections'], 2)
+
+    def test_fault(self):
+        self.server.reply(
+            fakeserver.fault('no such domain', 'account.NO_SUCH_DOMAIN'),
+            code=500)
+        with self.assertRaises(ZimbraSoapServerError) as cm:
+            list(self.zc.iter_all_accounts())
+        self.assertEqual(cm.exception.code, 'account.NO_SUCH_DOMAIN')
+
+    def test_unexpected_response(self):
+        self.server.reply(self.ACCOUNTS)
+        with self.assertRaises(ZimbraSoapUnexpectedResponse):
+            list(self.zc.iter_all_domains())
+
+    def test_header_notifications_skipped(self):
+        self.server.reply_raw(fakeserver.SOAP_ENVELOPE.format(
+            self.ACCOUNTS).replace(
+                '<context xmlns="urn:zimbra"/>',
+                '<context xmlns="urn:zimbra"><change token="42"/></context>'))
+        self.assertEqual([a.id for a in self.zc.iter_all_accounts()],
+                         [ACCOUNT_ID_1])
+
+    def test_unavailable_fault_is_retried(self):
+        zc = self.server.client(
+            ZimbraAdminClient,
+            rate_limiter=RateLimiter(rate=100, backoff=0.01))
+        self.server.reply(fakeserver.fault(
+            'try again', 'service.TEMPORARILY_UNAVAILABLE'), code=500)
+        self.server.reply(self.ACCOUNTS)
+        self.assertEqual([a.id for a in zc.iter_all_accounts()],
+                         [ACCOUNT_ID_1])
+        self.assertEqual(len(self.server.requests), 2)
+        zc.pool_manager.close()
+
+    def test_coalesced_reads(self):
+        zc = self.server.client(ZimbraAdminClient, coalesce_reads=True)
+        self.server.reply(self.ACCOUNTS)
+        self.assertEqual([a.id for a in zc.iter_all_accounts()],
+                         [ACCOUNT_ID_1])
+        self.assertEqual(zc.single_flight.stats()['calls'], 1)
+        zc.pool_manager.close()
+
+    def test_json_wire_format(self):
+        zc = self.server.client(ZimbraAdminClient, wire_format='json')
+        self.server.responses.append((200, json.dumps({
+            'Body': {'GetAllDomainsResponse': {
+                '_jsns': 'urn:zimbraAdmin',
+                'domain': [{'id': '1', 'name': 'a.example.com'},
+                           {'id': '2', 'name': 'b.example.com'}]}}})))
+        self.assertEqual([d.name for d in zc.iter_all_domains()],
+                         ['a.example.com', 'b.example.com'])
+
+
+class AttrsProjectionTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_get_account(self):
+        self.server.reply(
+            '<GetAccountResponse xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com">'
+            '<a n="zimbraMailHost">mbox1.example.com</a>'
+            '</account></GetAccountResponse>'.format(ACCOUNT_ID_1))
+        account = self.zc.get_account(
+            Account(name='foo@example.com'),
+            attrs=['zimbraMailHost', 'zimbraAccountStatus'])
+        self.assertIn(b'attrs="zimbraMailHost,zimbraAccountStatus"',
+                      self.server.requests[0])
+        self.assertEqual(account['zimbraMailHost'], 'mbox1.example.com')
+
+    def test_get_all_accounts_searches(self):
+        self.server.reply(
+            '<SearchDirectoryResponse more="0" searchTotal="2" '
+            'xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com">'
+            '<a n="zimbraMailHost">mbox1.example.com</a>'
+            '</account>'
+            '<account id="{1}" name="bar@example.com">'
+            '<a n="zimbraMailHost">mbox1.example.com</a>'
+            '<a n="zimbraIsSystemAccount">TRUE</a>'
+            '</account>'
+            '</SearchDirectoryResponse>'.format(ACCOUNT_ID_1, ACCOUNT_ID_2))
+        accounts = self.zc.get_all_accounts(
+            domain=Domain(name='example.com'), attrs='zimbraMailHost')
+
+        request = self.server.requests[0]
+        self.assertIn(b'SearchDirectoryRequest', request)
+        self.assertIn(b'domain="example.com"', request)
+        self.assertIn(b'types="accounts"', request)
+        self.assertIn(b'maxResults="0"', request)
+        # with what is needed to skip the system accounts
+        self.assertIn(b'attrs="zimbraMailHost,zimbraIsSystemAccount"',
+                      request)
+        self.assertEqual([a.id for a in accounts], [ACCOUNT_ID_1])
+
+    def test_server_filter(self):
+        self.server.reply(
+            '<SearchDirectoryResponse xmlns="urn:zimbraAdmin"/>')
+        self.zc.get_all_calendar_resources(
+            server=Server(name='mbox1.example.com'), attrs=['cn'])
+        self.assertIn(b'query="(zimbraMailHost=mbox1.example.com)"',
+                      self.server.requests[0])
+
+    def test_server_filter_by_id(self):
+        self.server.reply(
+            '<GetServerResponse xmlns="urn:zimbraAdmin">'
+            '<server id="x" name="mbox1.example.com"/>'
+            '</GetServerResponse>')
+        self.server.reply(
+            '<SearchDirectoryResponse xmlns="urn:zimbraAdmin"/>')
+        self.zc.get_all_calendar_resources(
+            server=Server(id='x'), attrs=['cn'])
+        self.assertIn(b'GetServerRequest', self.server.requests[0])
+        self.assertIn(b'query="(zimbraMailHost=mbox1.example.com)"',
+                      self.server.requests[1])
+
+
+class IdentityMapTests(unittest.TestCase):
+    ACCOUNTS = StreamingTests.ACCOUNTS
+
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient, identity_map=True)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_objects_are_materialized_once(self):
+        self.server.reply(self.ACCOUNTS)
+        self.server.reply(
+            '<GetAccountResponse xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="renamed@example.com">'
+            '<a n="zimbraMailQuota">42</a>'
+            '</account></GetAccountResponse>'.format(ACCOUNT_ID_1))
+        listed = self.zc.get_all_accounts(include_system_accounts=True)
+        fetched = self.zc.get_account(Account(id=ACCOUNT_ID_1))
+
+        self.assertIs(fetched, listed[0])
+        # updated in place
+        self.assertEqual(listed[0].name, 'renamed@example.com')
+        self.assertEqual(listed[0]['zimbraMailQuota'], 42)
+        self.assertFalse(listed[0].has_property('zimbraIsAdminAccount'))
+
+    def test_projections_are_merged(self):
+        self.server.reply(self.ACCOUNTS)
+        self.server.reply(
+            '<GetAccountResponse xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com">'
+            '<a n="zimbraMailQuota">42</a>'
+            '</account></GetAccountResponse>'.format(ACCOUNT_ID_1))
+        listed = self.zc.get_all_accounts(include_system_accounts=True)
+        fetched = self.zc.get_account(Account(id=ACCOUNT_ID_1),
+                                      attrs=['zimbraMailQuota'])
+
+        self.assertIs(fetched, listed[0])
+        self.assertEqual(listed[0]['zimbraMailQuota'], 42)
+        self.assertTrue(listed[0]['zimbraIsAdminAccount'])
+        self.assertEqual(
+            sorted(a['n'] for a in listed[0].get_full_data()['a']),
+            ['zimbraIsAdminAccount', 'zimbraMailQuota'])
+
+    def test_projected_searches_are_merged(self):
+        search_response = (
+            '<SearchDirectoryResponse xmlns="urn:zimbraAdmin">'
+            '<account id="{0}" name="foo@example.com">'
+            '<a n="zimbraMailHost">mail.example.com</a>'
+            '</account></SearchDirectoryResponse>'.format(ACCOUNT_ID_1))
+        self.server.reply(self.ACCOUNTS)
+        self.server.reply(search_response)
+        self.server.reply(search_response)
+        listed = self.zc.get_all_accounts(include_system_accounts=True)
+
+        found = self.zc.search_directory(
+            query='(uid=foo)', attrs=['zimbraMailHost'])['account']
+        self.assertIs(found, listed[0])
+        found = list(self.zc.iter_search_directory(
+            query='(uid=foo)', attrs=['zimbraMailHost']))
+        self.assertIs(found[0], listed[0])
+        self.assertEqual(listed[0]['zimbraMailHost'], 'mail.example.com')
+        self.assertTrue(listed[0]['zimbraIsAdminAccount'])
+
+    def test_unused_objects_are_dropped(self):
+        self.server.reply(self.ACCOUNTS)
+        self.zc.get_all_accounts(include_system_accounts=True)
+        self.assertEqual(len(self.zc.identity_map), 0)
+
+    def test_disabled_by_default(self):
+        zc = self.server.client(ZimbraAdminClient)
+        self.server.reply(self.ACCOUNTS)
+        self.server.reply(self.ACCOUNTS)
+        first = zc.get_all_accounts()
+        second = zc.get_all_accounts()
+        self.assertIsNot(first[0], second[0])
+        self.assertEqual(first[0], second[0])
+        zc.pool_manager.close()
+
+
+class PreauthTests(unittest.TestCase):
+    GET_DOMAIN_RESPONSE = (
+        '<GetDomainResponse xmlns="urn:zimbraAdmin">'
+        '<domain id="b37d6b98-dc8c-474a-9243-f5dfc3ecf6ac" name="example.com">'
+        '<a n="zimbraPreAuthKey">{0}</a>'
+        '</domain></GetDomainResponse>')
+    TOKEN_HEADERS = [('Location', '/'),
+                     ('Set-Cookie', 'JSESSIONID=abc; Path=/'),
+                     ('Set-Cookie', 'ZM_AUTH_TOKEN=0_token; Path=/')]
+
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_preauth_key_fetched_once(self):
+        self.server.reply(self.GET_DOMAIN_RESPONSE.format('1234'))
+        for i in range(2):
+            self.assertEqual(
+                self.zc.get_preauth_key(Domain(name='Example.com')), '1234')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn(b'attrs="zimbraPreAuthKey"', self.server.requests[0])
+
+    def test_no_preauth_key(self):
+        self.server.reply(
+            '<GetDomainResponse xmlns="urn:zimbraAdmin">'
+            '<domain id="b37d6b98-dc8c-474a-9243-f5dfc3ecf6ac" '
+            'name="example.com"/></GetDomainResponse>')
+        with self.assertRaises(DomainHasNoPreAuthKey):
+            self.zc.get_preauth_key(Domain(name='example.com'))
+
+    def test_rest_preauth_token(self):
+        rc = AccountRESTClient('127.0.0.1', preauth_key='abcd')
+        rc.preauth_url = self.server.url('/service/preauth?')
+        for i in range(2):
+            self.server.reply_raw(code=302, headers=self.TOKEN_HEADERS)
+            self.assertEqual(rc.get_preauth_token('foo@example.com'),
+                             '0_token')
+        self.assertIn(b'account=foo%40example.com', self.server.requests[0])
+        stats = rc.pool_manager.stats()[('127.0.0.1', self.server.server_port)]
+        self.assertEqual(stats['hits'], 1)
+        rc.pool_manager.close()
+
+    def test_preauth_url_is_signed(self):
+        for cls in (AccountRESTClient, AdminRESTClient):
+            rc = cls('127.0.0.1')
+            url = rc.get_preauth_url('foo@example.com', 600, 'abcd')
+            args = dict(parse_qsl(urlparse(url).query))
+            self.assertEqual(args['expires'], '600000')
+            self.assertEqual(
+                utils.build_preauth_str(
+                    'abcd', args['account'], args['timestamp'],
+                    args['expires'], admin=args['admin'] == '1'),
+                args['preauth'])
+            rc.pool_manager.close()
+
+    def test_get_logged_in_by(self):
+        self.server.reply(self.GET_DOMAIN_RESPONSE.format('abcd'))
+        rc = self.zc.get_rest_preauth_client(AccountRESTClient, '127.0.0.1')
+        rc.preauth_url = self.server.url('/service/preauth?')
+
+        for i in range(2):
+            self.server.reply_raw(code=302, headers=self.TOKEN_HEADERS)
+            zc = self.server.client(ZimbraAccountClient)
+            zc.get_logged_in_by('foo@example.com', self.zc)
+            self.assertEqual(zc._session.authToken, '0_token')
+            zc.pool_manager.close()
+
+        self.assertIs(
+            self.zc.get_rest_preauth_client(AccountRESTClient, '127.0.0.1'),
+            rc)
+        # a single GetDomain
+        self.assertEqual(
+            [r.startswith(b'/service/preauth') for r in self.server.requests],
+            [False, True, True])
+
+
+class SessionValidityTests(unittest.TestCase):
+    AUTH_RESPONSE = (
+        '<AuthResponse xmlns="urn:zimbraAccount">'
+        '<authToken>0_1234</authToken><lifetime>3600000</lifetime>'
+        '</AuthResponse>')
+
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAccountClient)
+        self.zc.login_with_authToken('0_1234')
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_checked_once(self):
+        self.server.reply(self.AUTH_RESPONSE)
+        for i in range(3):
+            self.assertTrue(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn(b'AuthRequest', self.server.requests[0])
+
+    def test_last_request_trusted(self):
+        self.server.reply('<GetInfoResponse xmlns="urn:zimbraAccount"/>')
+        self.zc.request('GetInfo')
+        self.assertTrue(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.zc._session.validity_check_interval = 0
+        self.server.reply(self.AUTH_RESPONSE)
+        self.assertTrue(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_refused_token(self):
+        self.server.reply(
+            fakeserver.fault('auth expired', 'service.AUTH_EXPIRED'),
+            code=500)
+        with self.assertRaises(ZimbraSoapServerError):
+            self.zc.request('GetInfo')
+        self.assertFalse(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 1)
+
+        # a new token is checked again
+        self.zc.login_with_authToken('0_5678')
+        self.server.reply(self.AUTH_RESPONSE)
+        self.assertTrue(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_refused_by_validity_check(self):
+        self.server.reply(
+            fakeserver.fault('auth failed', 'account.AUTH_FAILED'),
+            code=500)
+        self.assertFalse(self.zc.is_session_valid())
+        self.assertFalse(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_other_auth_failures_keep_token(self):
+        # ex: a wrong old password
+        self.server.reply('<GetInfoResponse xmlns="urn:zimbraAccount"/>')
+        self.server.reply(
+            fakeserver.fault('auth failed', 'account.AUTH_FAILED'),
+            code=500)
+        self.zc.request('GetInfo')
+        with self.assertRaises(ZimbraSoapServerError):
+            self.zc.request('ChangePassword')
+        self.assertTrue(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_refused_in_batch(self):
+        self.server.reply(
+            '<BatchResponse xmlns="urn:zimbra">{0}</BatchResponse>'.format(
+                fakeserver.fault('auth expired', 'service.AUTH_EXPIRED', 1)))
+        with self.zc.batch():
+            self.zc.request('ModifyPrefs')
+        self.assertFalse(self.zc.is_session_valid())
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_expired_token(self):
+        self.zc.login_with_authToken('0_1234', lifetime=1)
+        time.sleep(0.01)
+        self.assertFalse(self.zc.is_session_valid())
+        self.assertEqual(self.server.requests, [])
+
+    def test_mail_client(self):
+        zc = self.server.client(ZimbraMailClient)
+        zc.login_with_authToken('0_1234')
+        self.server.reply(self.AUTH_RESPONSE)
+        self.server.reply(self.AUTH_RESPONSE)
+        self.assertTrue(zc.is_session_valid())
+        self.assertTrue(zc.is_session_valid(force_check=True))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIn(b'urn:zimbraAccount', self.server.requests[0])
+        zc.pool_manager.close()
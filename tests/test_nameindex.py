@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.nameindex """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from zimsoap.client import ZimbraAdminClient
+from zimsoap.nameindex import NameIndex, SQLiteNameIndex
+from zimsoap.zobjects import Account
+from . import fakeserver
+
+
+ACCOUNT_ID = 'd78fd9c9-f000-440b-bce6-ea938d40fa2d'
+GET_ALL_ACCOUNTS_RESPONSE = (
+    '<GetAllAccountsResponse xmlns="urn:zimbraAdmin">'
+    '<account id="{0}" name="foo@example.com"/>'
+    '</GetAllAccountsResponse>'.format(ACCOUNT_ID))
+
+
+class NameIndexTests(unittest.TestCase):
+    def get_index(self):
+        return NameIndex()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.index = self.get_index()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get(self):
+        self.index.put('account', 'Foo@example.com', '1')
+        self.assertEqual(self.index.get('account', 'foo@example.com'), '1')
+        self.assertIsNone(self.index.get('dl', 'foo@example.com'))
+        self.assertEqual(self.index.stats(),
+                         {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_forget(self):
+        self.index.put('account', 'foo@example.com', '1')
+        self.index.put('account', 'bar@example.com', '1')
+        self.index.put('account', 'baz@example.com', '2')
+        self.index.put('dl', 'foo@example.com', '1')
+        self.index.forget('account', '1')
+        self.assertIsNone(self.index.get('account', 'foo@example.com'))
+        self.assertIsNone(self.index.get('account', 'bar@example.com'))
+        self.assertEqual(self.index.get('account', 'baz@example.com'), '2')
+        self.assertEqual(self.index.get('dl', 'foo@example.com'), '1')
+
+    def test_name_reused(self):
+        self.index.put('account', 'foo@example.com', '1')
+        self.index.put('account', 'foo@example.com', '2')
+        self.index.forget('account', '1')
+        self.assertEqual(self.index.get('account', 'foo@example.com'), '2')
+
+
+class SQLiteNameIndexTests(NameIndexTests):
+    def get_index(self):
+        self.path = os.path.join(self.dir, 'ids.sqlite')
+        return SQLiteNameIndex(self.path, commit_every=2)
+
+    def tearDown(self):
+        self.index.close()
+        super(SQLiteNameIndexTests, self).tearDown()
+
+    def test_persistent(self):
+        self.index.put('account', 'foo@example.com', '1')
+        self.index.close()
+        self.index = SQLiteNameIndex(self.path)
+        self.assertEqual(self.index.get('account', 'foo@example.com'), '1')
+
+
+class IndexingClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient, name_index=True)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_ids_of_listed_objects_used(self):
+        self.server.reply(GET_ALL_ACCOUNTS_RESPONSE)
+        self.server.reply('<ModifyAccountResponse xmlns="urn:zimbraAdmin"/>')
+        self.zc.get_all_accounts()
+        self.zc.modify_account(Account(name='foo@example.com'),
+                               {'zimbraMailQuota': 2})
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIn(b'ModifyAccountRequest', self.server.requests[1])
+        self.assertIn(ACCOUNT_ID.encode(), self.server.requests[1])
+
+    def test_renamed_objects_forgotten(self):
+        self.server.reply(GET_ALL_ACCOUNTS_RESPONSE)
+        self.server.reply('<RenameAccountResponse xmlns="urn:zimbraAdmin"/>')
+        self.zc.get_all_accounts()
+        self.zc.rename_account(Account(name='foo@example.com'),
+                               'bar@example.com')
+        self.assertIsNone(
+            self.zc.name_index.get('account', 'foo@example.com'))
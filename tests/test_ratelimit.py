@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.ratelimit """
+
+import time
+import unittest
+
+from zimsoap.client import ZimbraAdminClient, ZimbraSoapServerError
+from zimsoap.ratelimit import HostLimiter, RateLimiter
+from zimsoap.transport import HTTPError
+from . import fakeserver
+
+
+class HostLimiterTests(unittest.TestCase):
+    def new_limiter(self, rate=10, max_in_flight=8, increase=1):
+        return HostLimiter(rate, max_in_flight, min_rate=1,
+                           increase=increase, decrease=0.5, burst=1)
+
+    def test_multiplicative_decrease(self):
+        limiter = self.new_limiter()
+        limiter.release(limiter.acquire(), throttled=True)
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(limiter.as_dict()['max_in_flight'], 4)
+        self.assertEqual(limiter.as_dict()['throttled'], 1)
+
+    def test_decrease_once_per_congestion(self):
+        limiter = self.new_limiter()
+        started = [limiter.acquire() for i in range(3)]
+        for i in started:
+            limiter.release(i, throttled=True)
+        self.assertEqual(limiter.rate, 5)
+
+    def test_additive_increase(self):
+        limiter = self.new_limiter(rate=10000, increase=100)
+        limiter.release(limiter.acquire(), throttled=True)
+        for i in range(50):
+            limiter.release(limiter.acquire())
+        self.assertAlmostEqual(limiter.rate, 5001, places=0)
+
+    def test_limits_are_not_exceeded(self):
+        limiter = self.new_limiter(rate=1000, max_in_flight=2)
+        for i in range(50):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.rate, 1000)
+        self.assertEqual(limiter.as_dict()['max_in_flight'], 2)
+        self.assertEqual(limiter.as_dict()['in_flight'], 0)
+
+    def test_rate(self):
+        limiter = self.new_limiter(rate=50)
+        start = time.time()
+        for i in range(6):
+            limiter.release(limiter.acquire())
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+class RateLimitedClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.limiter = RateLimiter(rate=100, max_in_flight=4, backoff=0.01)
+        self.zc = self.server.client(ZimbraAdminClient,
+                                     rate_limiter=self.limiter)
+        self.key = ('127.0.0.1', self.server.server_port)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_http_503_is_retried(self):
+        self.server.responses.append((503, 'Service Unavailable'))
+        self.assertEqual(self.zc.request('NoOp'), {})
+        self.assertEqual(len(self.server.requests), 2)
+
+        stats = self.limiter.stats()[self.key]
+        self.assertEqual(stats['throttled'], 1)
+        self.assertLess(stats['rate'], 100)
+
+    def test_unavailable_fault_is_retried(self):
+        self.server.reply(fakeserver.fault(
+            'try again', 'service.TEMPORARILY_UNAVAILABLE'), code=500)
+        self.assertEqual(self.zc.request('NoOp'), {})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_retries_are_bounded(self):
+        for i in range(4):
+            self.server.responses.append((503, 'Service Unavailable'))
+        with self.assertRaises(HTTPError) as cm:
+            self.zc.request('NoOp')
+        self.assertEqual(cm.exception.code, 503)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_other_faults_are_not_retried(self):
+        self.server.reply(fakeserver.fault(
+            'no such account', 'account.NO_SUCH_ACCOUNT'), code=500)
+        with self.assertRaises(ZimbraSoapServerError):
+            self.zc.request('GetAccount')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.limiter.stats()[self.key]['throttled'], 0)
+
+    def test_in_flight_limit(self):
+        self.server.delay = 0.05
+        start = time.time()
+        self.zc.request_many([('NoOp', {})] * 8, max_workers=8)
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        self.assertEqual(self.limiter.stats()[self.key]['in_flight'], 0)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.routing, against local fake SOAP servers """
+
+import unittest
+
+from zimsoap.client import (
+    ZimbraAccountClient, ZimbraAdminClient, ZimbraMailClient)
+from zimsoap.routing import MailboxRouter
+from . import fakeserver
+
+
+GET_ACCOUNT_RESPONSE = (
+    '<GetAccountResponse xmlns="urn:zimbraAdmin">'
+    '<account id="d78fd9c9-f000-440b-bce6-ea938d40fa2d" name="{0}">'
+    '<a n="zimbraMailHost">127.0.0.1</a>'
+    '</account></GetAccountResponse>')
+
+AUTH_RESPONSE = (
+    '<AuthResponse xmlns="urn:zimbraAccount">'
+    '<authToken>0_1234</authToken><lifetime>3600000</lifetime>'
+    '</AuthResponse>')
+
+
+class MailboxRouterTests(unittest.TestCase):
+    def setUp(self):
+        self.admin_server = fakeserver.FakeSOAPServer()
+        self.admin_server.responder = (
+            lambda req: GET_ACCOUNT_RESPONSE.format('user@example.com'))
+        self.proxy = fakeserver.FakeSOAPServer()
+        self.store = fakeserver.FakeSOAPServer()
+
+        self.admin_zc = self.admin_server.client(ZimbraAdminClient)
+        self.router = MailboxRouter(
+            self.admin_zc, port=self.store.server_port, scheme='http')
+
+    def tearDown(self):
+        for server in (self.admin_server, self.proxy, self.store):
+            server.stop()
+
+    def test_url(self):
+        self.assertEqual(
+            self.router.url('user@example.com', 'service/soap', 443),
+            'http://127.0.0.1:{0}/service/soap'.format(self.store.server_port))
+        router = MailboxRouter(self.admin_zc)
+        self.assertEqual(
+            router.url('user@example.com', 'service/soap', 443),
+            'https://127.0.0.1:443/service/soap')
+
+    def test_mail_host_is_cached(self):
+        for i in range(3):
+            self.assertEqual(self.router.get_mail_host('user@example.com'),
+                             '127.0.0.1')
+        self.assertEqual(len(self.admin_server.requests), 1)
+
+        self.router.forget('user@example.com')
+        self.router.get_mail_host('user@example.com')
+        self.assertEqual(len(self.admin_server.requests), 2)
+
+    def test_login_is_routed(self):
+        zc = self.proxy.client(ZimbraMailClient, router=self.router)
+        self.store.reply(AUTH_RESPONSE)
+        zc.login('user@example.com', 'secret')
+        zc.request('NoOp')
+
+        self.assertEqual(self.proxy.requests, [])
+        self.assertEqual(len(self.store.requests), 2)
+        self.assertIn(b'<authToken>0_1234</authToken>',
+                      self.store.requests[1])
+        self.assertEqual(zc.login_account, 'user@example.com')
+
+    def test_clients_share_store_connections(self):
+        pm = self.admin_zc.pool_manager
+        for cls in (ZimbraAccountClient, ZimbraMailClient):
+            zc = self.proxy.client(cls, router=self.router, pool_manager=pm)
+            self.store.reply(AUTH_RESPONSE)
+            zc.login('user@example.com', 'secret')
+
+        stats = pm.stats()[('127.0.0.1', self.store.server_port)]
+        self.assertEqual(stats['new_connections'], 1)
+        self.assertEqual(len(self.admin_server.requests), 1)
+        pm.close()
+
+    def test_no_router(self):
+        zc = self.proxy.client(ZimbraMailClient)
+        self.proxy.reply(AUTH_RESPONSE)
+        zc.login('user@example.com', 'secret')
+        self.assertEqual(len(self.proxy.requests), 1)
+        self.assertEqual(self.store.requests, [])
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.singleflight """
+
+import threading
+import time
+import unittest
+
+from zimsoap.client import ZimbraAdminClient, ZimbraSoapServerError
+from zimsoap.singleflight import SingleFlight, request_key
+from . import fakeserver
+
+
+GET_DOMAIN_RESPONSE = (
+    '<GetDomainResponse xmlns="urn:zimbraAdmin">'
+    '<domain id="b37d6b98-dc8c-474a-9243-f5dfc3ecf6ac" name="example.com">'
+    '<a n="zimbraPreAuthKey">abcd</a>'
+    '</domain></GetDomainResponse>')
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_request_key(self):
+        self.assertEqual(
+            request_key('GetDomain', {'domain': {'by': 'name', '_content':
+                                                 'example.com'}}, 'ns'),
+            request_key('GetDomain', {'domain': {'_content': 'example.com',
+                                                 'by': 'name'}}, 'ns'))
+        self.assertNotEqual(
+            request_key('GetDomain', {}, 'ns'),
+            request_key('GetAccount', {}, 'ns'))
+        self.assertNotEqual(
+            request_key('GetDomain', {}, 'ns'),
+            request_key('GetDomain', {}, 'other_ns'))
+
+    def test_concurrent_calls_are_shared(self):
+        sf = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow_call():
+            started.set()
+            release.wait()
+            return {'a': []}
+
+        leader = threading.Thread(
+            target=lambda: results.append(sf.do('k', slow_call)))
+        leader.start()
+        started.wait()
+        followers = [
+            threading.Thread(
+                target=lambda: results.append(sf.do('k', slow_call)))
+            for i in range(3)]
+        for t in followers:
+            t.start()
+        # let the followers wait on the in-flight call
+        while sf.shared < 3:
+            time.sleep(0.001)
+        release.set()
+        for t in [leader] + followers:
+            t.join()
+
+        self.assertEqual(sf.stats(), {'calls': 1, 'shared': 3})
+        self.assertEqual(results, [{'a': []}] * 4)
+        # each caller can modify its own copy
+        self.assertEqual(len(set(id(r) for r in results)), 4)
+
+        # not in flight anymore
+        self.assertEqual(sf.do('k', lambda: 42), 42)
+        self.assertEqual(sf.stats()['calls'], 2)
+
+    def test_error_is_raised(self):
+        sf = SingleFlight()
+        with self.assertRaises(KeyError):
+            sf.do('k', lambda: {}['missing'])
+        self.assertEqual(sf.do('k', lambda: 1), 1)
+
+
+class CoalescedClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer(delay=0.1)
+        self.zc = self.server.client(ZimbraAdminClient, coalesce_reads=True)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_identical_reads_share_a_call(self):
+        self.server.responder = lambda req: GET_DOMAIN_RESPONSE
+        selector = {'domain': {'by': 'name', '_content': 'example.com'}}
+        res = self.zc.request_many([('GetDomain', selector)] * 5,
+                                   max_workers=5)
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.zc.single_flight.stats(),
+                         {'calls': 1, 'shared': 4})
+        self.assertEqual(len(res), 5)
+        for domain in res:
+            self.assertEqual(domain['domain']['name'], 'example.com')
+
+    def test_writes_are_not_coalesced(self):
+        self.zc.request_many([('NoOp', {})] * 3, max_workers=3)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_shared_fault(self):
+        self.server.reply(fakeserver.fault(
+            'no such domain', 'account.NO_SUCH_DOMAIN'), code=500)
+        res = self.zc.request_many([('GetDomain', {})] * 3, max_workers=3,
+                                   return_exceptions=True)
+        self.assertEqual(len(self.server.requests), 1)
+        for e in res:
+            self.assertIsInstance(e, ZimbraSoapServerError)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.table """
+
+import unittest
+
+from zimsoap.client import ZimbraAdminClient
+from zimsoap.table import (
+    AccountTable, BoolColumn, CategoryColumn, IntColumn, ListColumn)
+from . import fakeserver
+
+
+COS_1 = 'e00428a1-0c00-11d9-836a-000d93afea2a'
+COS_2 = 'dddddddd-0c00-11d9-836a-000d93afea2a'
+
+
+def account(i, cos, status, quota, admin=False):
+    a = [{'n': 'zimbraAccountStatus', '_content': status},
+         {'n': 'zimbraMailQuota', '_content': str(quota)},
+         {'n': 'zimbraMailAlias', '_content': 'alias1-{0}'.format(i)},
+         {'n': 'zimbraMailAlias', '_content': 'alias2-{0}'.format(i)},
+         {'n': 'displayName', '_content': 'Account {0}'.format(i)}]
+    if cos:
+        a.append({'n': 'zimbraCOSId', '_content': cos})
+    if admin:
+        a.append({'n': 'zimbraIsAdminAccount', '_content': 'TRUE'})
+    return {'id': str(i), 'name': 'user{0}@example.com'.format(i), 'a': a}
+
+
+class AccountTableTests(unittest.TestCase):
+    ATTRS = ['zimbraCOSId', 'zimbraAccountStatus', 'zimbraMailQuota',
+             'zimbraIsAdminAccount', 'zimbraMailAlias']
+
+    def setUp(self):
+        self.table = AccountTable(self.ATTRS)
+        self.table.append(account(1, COS_1, 'active', 100, admin=True))
+        self.table.append(account(2, COS_2, 'locked', 200))
+        self.table.append(account(3, COS_1, 'active', 300))
+        self.table.append(account(4, None, 'active', 400))
+
+    def test_column_types(self):
+        columns = self.table.columns
+        self.assertIsInstance(columns['name'], ListColumn)
+        self.assertIsInstance(columns['zimbraCOSId'], CategoryColumn)
+        self.assertIsInstance(columns['zimbraMailQuota'], IntColumn)
+        self.assertIsInstance(columns['zimbraIsAdminAccount'], BoolColumn)
+
+    def test_values(self):
+        self.assertEqual(len(self.table), 4)
+        self.assertEqual(self.table['zimbraMailQuota'], [100, 200, 300, 400])
+        self.assertEqual(self.table['zimbraCOSId'],
+                         [COS_1, COS_2, COS_1, None])
+        self.assertEqual(self.table['zimbraIsAdminAccount'],
+                         [True, False, False, False])
+        self.assertEqual(self.table['zimbraMailAlias'][0],
+                         ('alias1-1', 'alias2-1'))
+        # not asked for
+        self.assertNotIn('displayName', self.table.columns)
+
+    def test_dictionary_encoding(self):
+        column = self.table.columns['zimbraAccountStatus']
+        self.assertEqual(column.categories, [None, 'active', 'locked'])
+        self.assertEqual(list(column.codes), [1, 2, 1, 1])
+
+    def test_filter(self):
+        active = self.table.filter('zimbraAccountStatus', 'active')
+        self.assertEqual(active['name'], [
+            'user1@example.com', 'user3@example.com', 'user4@example.com'])
+        big = active.filter('zimbraMailQuota', lambda q: q > 100)
+        self.assertEqual(big['id'], ['3', '4'])
+        self.assertEqual(len(self.table), 4)
+
+    def test_group_by(self):
+        self.assertEqual(self.table.group_by('zimbraCOSId'),
+                         {COS_1: 2, COS_2: 1, None: 1})
+        self.assertEqual(
+            self.table.group_by('zimbraCOSId', 'zimbraMailQuota'),
+            {COS_1: 400, COS_2: 200, None: 400})
+        self.assertEqual(
+            self.table.group_by('zimbraIsAdminAccount', 'zimbraMailQuota'),
+            {True: 100, False: 900})
+
+    def test_missing_numbers(self):
+        table = AccountTable(['zimbraMailQuota'])
+        table.append(account(1, None, 'active', 0))
+        table.append(account(2, None, 'active', 'none'))
+        table.append({'id': '3', 'name': 'user3@example.com', 'a': [
+            {'n': 'zimbraMailQuota', '_content': '1'},
+            {'n': 'zimbraMailQuota', '_content': '2'}]})
+        table.append({'id': '4', 'name': 'user4@example.com'})
+
+        column = table.columns['zimbraMailQuota']
+        self.assertEqual(column.values(), [0, None, None, None])
+        self.assertEqual(list(column.mask), [0, 1, 1, 1])
+        self.assertIsNone(column[3])
+        self.assertEqual(table.filter('zimbraMailQuota', None)['id'],
+                         ['2', '3', '4'])
+        self.assertEqual(table.group_by('name', 'zimbraMailQuota')[
+            'user4@example.com'], 0)
+
+    def test_rows(self):
+        row = next(self.table.rows())
+        self.assertEqual(row['name'], 'user1@example.com')
+        self.assertEqual(row['zimbraCOSId'], COS_1)
+        self.assertEqual(row['zimbraMailQuota'], 100)
+
+
+class AccountTableClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.zc = self.server.client(ZimbraAdminClient)
+
+    def tearDown(self):
+        self.zc.pool_manager.close()
+        self.server.stop()
+
+    def test_account_table(self):
+        self.server.reply(
+            '<SearchDirectoryResponse more="0" searchTotal="2" '
+            'xmlns="urn:zimbraAdmin">'
+            '<account id="1" name="foo@example.com">'
+            '<a n="zimbraCOSId">{0}</a><a n="zimbraMailQuota">10</a>'
+            '</account>'
+            '<account id="2" name="bar@example.com">'
+            '<a n="zimbraMailQuota">20</a>'
+            '</account>'
+            '</SearchDirectoryResponse>'.format(COS_1))
+        table = self.zc.account_table('zimbraCOSId,zimbraMailQuota')
+        self.assertIn(b'attrs="zimbraCOSId,zimbraMailQuota"',
+                      self.server.requests[0])
+        self.assertIn(b'maxResults="0"', self.server.requests[0])
+        self.assertEqual(table['name'],
+                         ['foo@example.com', 'bar@example.com'])
+        self.assertEqual(table.group_by('zimbraCOSId', 'zimbraMailQuota'),
+                         {COS_1: 10, None: 20})
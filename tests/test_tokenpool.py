@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.tokenpool """
+
+import datetime
+import unittest
+
+from six.moves.urllib.parse import parse_qsl, urlparse
+
+from zimsoap import tokenpool, utils
+from zimsoap.client import (
+    AccountRESTClient, ZimbraAccountClient, ZimbraAdminClient)
+from zimsoap.tokenpool import TokenPool
+from zimsoap.zobjects import Account
+from . import fakeserver
+
+
+DELEGATE_AUTH_RESPONSE = (
+    '<DelegateAuthResponse xmlns="urn:zimbraAdmin">'
+    '<authToken>{0}</authToken><lifetime>3600000</lifetime>'
+    '</DelegateAuthResponse>')
+
+
+class TokenPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.orig_clock = tokenpool.clock
+        tokenpool.clock = lambda: self.now
+        self.pool = TokenPool(refresh_margin=60, maxsize=2)
+        self.fetched = []
+
+    def tearDown(self):
+        tokenpool.clock = self.orig_clock
+
+    def fetch(self):
+        token = 'token{0}'.format(len(self.fetched))
+        self.fetched.append(token)
+        return token, 3600
+
+    def test_reused_while_valid(self):
+        self.assertEqual(self.pool.get('foo', self.fetch), ('token0', 3600))
+        self.now += 3000
+        self.assertEqual(self.pool.get('foo', self.fetch), ('token0', 600))
+        self.assertEqual(self.pool.stats(),
+                         {'hits': 1, 'fetches': 1, 'size': 1})
+
+    def test_refreshed_before_expiry(self):
+        self.pool.get('foo', self.fetch)
+        self.now += 3540
+        self.assertEqual(self.pool.get('foo', self.fetch)[0], 'token1')
+
+    def test_oldest_dropped(self):
+        for key in ('foo', 'bar', 'baz'):
+            self.pool.get(key, self.fetch)
+        self.assertEqual(len(self.pool), 2)
+        self.assertEqual(self.pool.get('foo', self.fetch)[0], 'token3')
+
+
+class TokenPoolClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeSOAPServer()
+        self.admin_zc = self.server.client(ZimbraAdminClient, token_pool=True)
+
+    def tearDown(self):
+        self.admin_zc.pool_manager.close()
+        self.server.stop()
+
+    def test_delegated_logins_share_tokens(self):
+        self.server.reply(DELEGATE_AUTH_RESPONSE.format('foo_token'))
+        for i in range(3):
+            zc = self.server.client(ZimbraAccountClient)
+            zc.delegated_login('foo@example.com', self.admin_zc)
+            self.assertEqual(zc._session.authToken, 'foo_token')
+            zc.pool_manager.close()
+
+        self.assertEqual(len(self.server.requests), 1)
+        token, lifetime = self.admin_zc.get_account_authToken(
+            Account(name='FOO@example.com'))
+        self.assertEqual(token, 'foo_token')
+        # what is left of it
+        self.assertTrue(3500000 < lifetime <= 3600000)
+
+    def test_delegated_tokens_by_server(self):
+        self.server.reply(DELEGATE_AUTH_RESPONSE.format('1'))
+        self.server.reply(DELEGATE_AUTH_RESPONSE.format('2'))
+        # another server, with the same pool
+        other_zc = ZimbraAdminClient(
+            'localhost', self.server.server_port,
+            token_pool=self.admin_zc.token_pool)
+        other_zc.com = other_zc.COMMUNICATION(
+            self.server.url('/'+other_zc.LOCATION), other_zc.pool_manager)
+
+        for zc, token in ((self.admin_zc, '1'), (other_zc, '2')):
+            self.assertEqual(
+                zc.get_delegated_auth_token(
+                    Account(name='foo@example.com'))[0],
+                token)
+        self.assertEqual(len(self.server.requests), 2)
+        other_zc.pool_manager.close()
+
+    def test_preauth_logins_share_tokens(self):
+        self.server.reply(
+            '<GetDomainResponse xmlns="urn:zimbraAdmin">'
+            '<domain id="1" name="example.com">'
+            '<a n="zimbraPreAuthKey">abcd</a>'
+            '</domain></GetDomainResponse>')
+        self.server.reply_raw(code=302, headers=[
+            ('Location', '/'),
+            ('Set-Cookie', 'ZM_AUTH_TOKEN=0_token; Path=/')])
+        rc = self.admin_zc.get_rest_preauth_client(
+            AccountRESTClient, '127.0.0.1')
+        rc.preauth_url = self.server.url('/service/preauth?')
+
+        end_dates = []
+        for i in range(2):
+            zc = self.server.client(ZimbraAccountClient)
+            zc.get_logged_in_by('foo@example.com', self.admin_zc, 600)
+            self.assertEqual(zc._session.authToken, '0_token')
+            end_dates.append(zc._session.end_date)
+            zc.pool_manager.close()
+
+        self.assertEqual(len(self.server.requests), 2)
+        args = dict(parse_qsl(
+            urlparse(self.server.requests[1].decode('utf-8')).query))
+        self.assertEqual(args['expires'], '600000')
+        self.assertEqual(
+            utils.build_preauth_str('abcd', args['account'],
+                                    args['timestamp'], args['expires']),
+            args['preauth'])
+        # the end date of the pooled token, not a new one
+        self.assertLessEqual(end_dates[1], end_dates[0])
+        self.assertLess(
+            end_dates[0], datetime.datetime.now() +
+            datetime.timedelta(seconds=600))
+
+    def test_disabled_by_default(self):
+        zc = self.server.client(ZimbraAdminClient)
+        self.server.reply(DELEGATE_AUTH_RESPONSE.format('1'))
+        self.server.reply(DELEGATE_AUTH_RESPONSE.format('2'))
+        for token in ('1', '2'):
+            self.assertEqual(
+                zc.get_delegated_auth_token(Account(name='foo@example.com')),
+                (token, 3600000))
+        zc.pool_manager.close()
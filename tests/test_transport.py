@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Unittests for zimsoap.transport, against a local fake SOAP server """
+
+import json
+import re
+import socket
+import unittest
+import zlib
+from xml.dom import minidom
+
+import pythonzimbra.request_xml
+import pythonzimbra.response_xml
+
+from zimsoap import transport
+from . import samples
+from . import fakeserver
+from .fakeserver import FakeSOAPServer, SOAP_ENVELOPE
+
+try:
+    from urllib2 import HTTPError, URLError
+except ImportError:
+    from urllib.error import HTTPError, URLError
+
+
+def noop_request():
+    req = pythonzimbra.request_xml.RequestXml()
+    req.add_request('NoOpRequest', {}, 'urn:zimbraAdmin')
+    return req
+
+
+class PooledCommunicationTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSOAPServer()
+        self.pm = transport.PoolManager(maxsize=2)
+
+    def tearDown(self):
+        self.pm.close()
+        self.server.stop()
+
+    def test_connection_is_reused(self):
+        com = transport.PooledCommunication(self.server.url(), self.pm)
+        for i in range(3):
+            resp = pythonzimbra.response_xml.ResponseXml()
+            com.send_request(noop_request(), resp)
+            self.assertIn('NoOpResponse', resp.get_response())
+
+        stats = self.pm.stats()[('127.0.0.1', self.server.server_port)]
+        self.assertEqual(stats['new_connections'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['idle_evictions'], 0)
+
+    def test_idle_connections_are_evicted(self):
+        pm = transport.PoolManager(idle_timeout=-1)
+        com = transport.PooledCommunication(self.server.url(), pm)
+        com.send_request(noop_request(),
+                         pythonzimbra.response_xml.ResponseXml())
+        com.send_request(noop_request(),
+                         pythonzimbra.response_xml.ResponseXml())
+
+        stats = pm.stats()[('127.0.0.1', self.server.server_port)]
+        self.assertEqual(stats['new_connections'], 2)
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['idle_evictions'], 1)
+        pm.close()
+
+    def test_same_host_shares_pool(self):
+        com1 = transport.PooledCommunication(self.server.url(), self.pm)
+        com2 = transport.PooledCommunication(
+            self.server.url('/service/soap'), self.pm)
+        self.assertIs(com1.pool, com2.pool)
+
+    def test_returns_response_when_none_given(self):
+        com = transport.PooledCommunication(self.server.url(), self.pm)
+        resp = com.send_request(noop_request())
+        self.assertIn('NoOpResponse', resp.get_response())
+
+    def test_fault_is_parsed(self):
+        com = transport.PooledCommunication(self.server.url('/fault'),
+                                            self.pm)
+        resp = pythonzimbra.response_xml.ResponseXml()
+        com.send_request(noop_request(), resp)
+        self.assertTrue(resp.is_fault())
+        self.assertEqual(resp.get_fault_code(), 'account.NO_SUCH_ACCOUNT')
+
+    def test_http_error(self):
+        com = transport.PooledCommunication(self.server.url('/missing'),
+                                            self.pm)
+        with self.assertRaises(HTTPError) as cm:
+            com.send_request(noop_request(),
+                             pythonzimbra.response_xml.ResponseXml())
+        self.assertEqual(cm.exception.code, 404)
+
+    def test_unreachable_server(self):
+        port = self.server.server_port
+        self.server.stop()
+        com = transport.PooledCommunication(
+            'http://127.0.0.1:{0}/'.format(port), self.pm)
+        with self.assertRaises(URLError):
+            com.send_request(noop_request(),
+                             pythonzimbra.response_xml.ResponseXml())
+        # avoid a second stop() in tearDown
+        self.server = FakeSOAPServer()
+
+    def test_closed_idle_connection_is_replaced(self):
+        com = transport.PooledCommunication(self.server.url(), self.pm)
+        com.send_request(noop_request())
+        conn, since = com.pool._idle[0]
+        conn.sock.shutdown(socket.SHUT_RDWR)
+        com.send_request(noop_request())
+
+        stats = self.pm.stats()[('127.0.0.1', self.server.server_port)]
+        self.assertEqual(stats['new_connections'], 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_processed_request_is_not_sent_again(self):
+        com = transport.PooledCommunication(self.server.url(), self.pm)
+        com.send_request(noop_request())
+        self.server.reset()
+        with self.assertRaises(URLError):
+            com.send_request(noop_request())
+        self.assertEqual(len(self.server.requests), 2)
+
+
+def strip_blanks(node):
+    """ Removes indentation, zimbra sends compact XML """
+    for child in list(node.childNodes):
+        if child.nodeType == child.TEXT_NODE:
+            if not child.data.strip():
+                node.removeChild(child)
+        else:
+            strip_blanks(child)
+    return node
+
+
+def dom_to_zimbra_json(node):
+    """ Mimics the JSON zimbra would send for a compact XML node """
+    out = {}
+    for k, v in node.attributes.items():
+        if k == 'xmlns':
+            out['_jsns'] = v
+        elif k.startswith('xmlns:'):
+            continue
+        elif re.match(r'^(0|-?[1-9][0-9]{0,8})$', v):
+            # zimbra sends numbers when the value is typed as such
+            out[k] = int(v)
+        else:
+            out[k] = v
+    for child in node.childNodes:
+        if child.nodeType == child.TEXT_NODE:
+            out['_content'] = child.data
+        else:
+            tag = child.tagName.split(':')[-1]
+            out.setdefault(tag, []).append(dom_to_zimbra_json(child))
+    return out
+
+
+class JsonWireFormatTests(unittest.TestCase):
+    SAMPLES = ('SIMPLE_DOMAIN', 'MISNAMED_DOMAIN', 'MBOX',
+               'DISTRIBUTION_LIST', 'XML_MULTIPLE_RESPONSE_TAGS',
+               'XML_EMPTY_RESPONSE_TAGS', 'SIGNATURE', 'IDENTITY',
+               'ADMIN_ACCOUNT', 'SYSTEM_ACCOUNT', 'NORMAL_ACCOUNT')
+
+    def response_element(self, sample):
+        doc = minidom.parseString(sample.strip())
+        root = strip_blanks(doc.documentElement)
+        if root.tagName.endswith('Envelope'):
+            body = root.getElementsByTagNameNS('*', 'Body').item(0)
+            return body.firstChild
+
+        resp = doc.createElement('GetSampleResponse')
+        resp.setAttribute('xmlns', 'urn:zimbraAdmin')
+        resp.appendChild(root)
+        return resp
+
+    def assertSameResponses(self, xml_body, json_body):
+        resp_xml = pythonzimbra.response_xml.ResponseXml()
+        resp_xml.set_response(SOAP_ENVELOPE.format(xml_body))
+
+        resp_json = transport.ResponseJson()
+        resp_json.set_response(json.dumps({
+            'Header': {'context': {'_jsns': 'urn:zimbra'}},
+            'Body': json_body,
+            '_jsns': 'urn:zimbraSoap'}))
+
+        self.assertEqual(resp_json.get_response(), resp_xml.get_response())
+        self.assertEqual(resp_json.get_body(), resp_xml.get_body())
+        self.assertEqual(resp_json.get_header(), resp_xml.get_header())
+
+    def test_samples_parity(self):
+        for name in self.SAMPLES:
+            element = self.response_element(getattr(samples, name))
+            tag = element.tagName.split(':')[-1]
+            self.assertSameResponses(
+                element.toxml(), {tag: dom_to_zimbra_json(element)})
+
+    def test_attrs_parity(self):
+        self.assertSameResponses(
+            '<GetPrefsResponse xmlns="urn:zimbraAccount">'
+            '<pref name="zimbraPrefSkin">harmony</pref>'
+            '<pref name="zimbraPrefMailPollingInterval">300</pref>'
+            '<pref name="zimbraPrefMailLocalDeliveryDisabled">FALSE</pref>'
+            '<pref name="zimbraPrefOutOfOfficeDirectAddress">a@x</pref>'
+            '<pref name="zimbraPrefOutOfOfficeDirectAddress">b@x</pref>'
+            '</GetPrefsResponse>',
+            {'GetPrefsResponse': {
+                '_jsns': 'urn:zimbraAccount',
+                '_attrs': {
+                    'zimbraPrefSkin': 'harmony',
+                    'zimbraPrefMailPollingInterval': '300',
+                    'zimbraPrefMailLocalDeliveryDisabled': 'FALSE',
+                    'zimbraPrefOutOfOfficeDirectAddress': ['a@x', 'b@x'],
+                }}})
+
+    def test_booleans_parity(self):
+        self.assertSameResponses(
+            '<GetFolderResponse xmlns="urn:zimbraMail">'
+            '<folder id="2" name="Inbox" activesyncdisabled="0"/>'
+            '</GetFolderResponse>',
+            {'GetFolderResponse': {
+                '_jsns': 'urn:zimbraMail',
+                'folder': [{'id': '2', 'name': 'Inbox',
+                            'activesyncdisabled': False}]}})
+
+    def test_fault_parity(self):
+        element = strip_blanks(minidom.parseString(
+            SOAP_ENVELOPE.format(fakeserver.fault(
+                'no such account', 'account.NO_SUCH_ACCOUNT')))
+            .documentElement).getElementsByTagNameNS(
+                '*', 'Body').item(0).firstChild
+        self.assertSameResponses(
+            element.toxml(), {'Fault': dom_to_zimbra_json(element)})
+
+    def test_json_batch_request(self):
+        req = transport.RequestJson()
+        req.enable_batch('continue')
+        for i in range(3):
+            req.add_request('ModifyAccountRequest', {'id': str(i)},
+                            'urn:zimbraAdmin')
+        batch = json.loads(req.get_request())['Body']['BatchRequest']
+        self.assertEqual(
+            [r['requestId'] for r in batch['ModifyAccountRequest']],
+            [1, 2, 3])
+
+
+class CompressionTests(unittest.TestCase):
+    BIG_RESPONSE = (
+        '<GetAllAccountsResponse xmlns="urn:zimbraAdmin">{0}'
+        '</GetAllAccountsResponse>'.format(
+            '<account id="d78fd9c9-f000-440b-bce6-ea938d40fa2d" '
+            'name="foo@example.com"><a n="zimbraMailQuota">0</a>'
+            '</account>' * 1000))
+
+    def setUp(self):
+        self.server = FakeSOAPServer(compress=True)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def communication(self, **kwargs):
+        self.pm = transport.PoolManager(**kwargs)
+        self.addCleanup(self.pm.close)
+        return transport.PooledCommunication(self.server.url(), self.pm)
+
+    def test_compressed_response(self):
+        com = self.communication()
+        self.server.reply(self.BIG_RESPONSE)
+        resp = com.send_request(noop_request())
+        self.assertEqual(
+            self.server.headers[0]['Accept-Encoding'], 'gzip, deflate')
+        self.assertEqual(len(resp.get_response()['GetAllAccountsResponse']
+                             ['account']), 1000)
+
+        stats = self.pm.transfer_stats.as_dict()['NoOpRequest']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['request_bytes'], stats['request_wire_bytes'])
+        self.assertLess(stats['response_wire_bytes'] * 10,
+                        stats['response_bytes'])
+
+    def test_compressed_streamed_response(self):
+        com = self.communication()
+        self.server.reply(self.BIG_RESPONSE)
+        resp = pythonzimbra.response_xml.ResponseXml()
+        items = list(com.iter_response(noop_request(), resp))
+        self.assertEqual(len(items), 1000)
+        self.assertEqual(items[0][2]['a'],
+                         {'n': 'zimbraMailQuota', '_content': '0'})
+
+        stats = self.pm.transfer_stats.as_dict()['NoOpRequest']
+        self.assertLess(stats['response_wire_bytes'] * 10,
+                        stats['response_bytes'])
+        # fully read, the connection is reused
+        com.send_request(noop_request())
+        self.assertEqual(
+            self.pm.stats()[('127.0.0.1', self.server.server_port)]['hits'],
+            1)
+
+    def test_no_compression(self):
+        com = self.communication(compression=False)
+        com.send_request(noop_request())
+        self.assertNotIn('gzip',
+                         self.server.headers[0].get('Accept-Encoding', ''))
+        stats = self.pm.transfer_stats.as_dict()['NoOpRequest']
+        self.assertEqual(stats['response_bytes'],
+                         stats['response_wire_bytes'])
+
+    def test_compressed_request(self):
+        com = self.communication(compress_min_size=1000)
+        req = pythonzimbra.request_xml.RequestXml()
+        req.add_request('AddMsgRequest', {'m': {'content': {
+            '_content': 'Subject: foo\r\n\r\n' + 'bar ' * 1000}}},
+            'urn:zimbraMail')
+        com.send_request(req)
+
+        self.assertEqual(self.server.headers[0]['Content-Encoding'], 'gzip')
+        self.assertIn(b'bar bar', self.server.requests[0])
+        stats = self.pm.transfer_stats.as_dict()['AddMsgRequest']
+        self.assertLess(stats['request_wire_bytes'] * 10,
+                        stats['request_bytes'])
+
+        # small requests are left as is
+        com.send_request(noop_request())
+        self.assertNotIn('Content-Encoding', self.server.headers[1])
+
+    def test_deflate(self):
+        data = b'<a>' + b'foo' * 100 + b'</a>'
+        self.assertEqual(
+            transport.decompress(zlib.compress(data), 'deflate'), data)
+        raw = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        raw = raw.compress(data) + raw.flush()
+        self.assertEqual(transport.decompress(raw, 'deflate'), data)
+        self.assertEqual(transport.decompress(data, None), data)
@@ -4,12 +4,22 @@ from __future__ import unicode_literals
 
 """ Unittests for zimsoap.utils """
 
+import io
+import timeit
 import unittest
+from xml.dom import minidom
 
+from pythonzimbra.tools.xmlserializer import dom_to_dict
 from six import text_type
 
 import zimsoap
 from zimsoap import utils
+from . import benchmark, samples
+
+
+def minidom_xml_str_to_dict(s):
+    """ The reference implementation of xml_str_to_dict """
+    return dom_to_dict(minidom.parseString(s).firstChild)
 
 
 class ZimsoapUtilsTests(unittest.TestCase):
@@ -80,3 +90,110 @@ class ZimsoapUtilsTests(unittest.TestCase):
             self.assertEqual(
                 utils.xml_str_to_dict(xml[i]),
                 dicts[i])
+
+    def test_xml_str_to_dict_samples_parity(self):
+        for name in dir(samples):
+            sample = getattr(samples, name)
+            if not name.isupper() or not isinstance(sample, text_type):
+                continue
+            for s in (sample, sample.encode('utf-8')):
+                ref = minidom_xml_str_to_dict(s)
+                self.assertEqual(utils.xml_str_to_dict(s), ref)
+                # down to the keys order
+                self.assertEqual(repr(utils.xml_str_to_dict(s)), repr(ref))
+
+    def test_xml_str_to_dict_quirks_parity(self):
+        xml = (
+            # the last text node is kept
+            '<a>foo<b/>bar<c/></a>',
+            '<a>foo<b/>bar<c/>  </a>',
+            # adjacent text is merged
+            '<a>foo&amp;bar&#233;<![CDATA[]]></a>',
+            '<a>{0}</a>'.format('x' * 200000),
+            # prefixes are stripped from tags, not from attributes
+            '<s:a xmlns:s="urn:s" s:x="1" xmlns="urn:d"><s:b/><b/></s:a>',
+            # single tag vs list
+            '<a><b x="1"/><c/><b x="2"><b/></b></a>',
+            '<a><b/><b/><b/></a>',
+        )
+        for s in xml:
+            self.assertEqual(repr(utils.xml_str_to_dict(s)),
+                             repr(minidom_xml_str_to_dict(s)))
+
+    @benchmark
+    def test_xml_str_to_dict_speed(self):
+        s = samples.ADMIN_ACCOUNT
+        ref = min(timeit.repeat(
+            lambda: minidom_xml_str_to_dict(s), number=50, repeat=3))
+        new = min(timeit.repeat(
+            lambda: utils.xml_str_to_dict(s), number=50, repeat=3))
+        # measured 3.6-5.2x, expat itself taking ~40% of the time
+        self.assertLess(new * 3.5, ref)
+
+    def test_iter_xml_elements(self):
+        xml = (b'<r xmlns="urn:r"><h><x/></h><b><l>'
+               b'<i id="1"><a n="k">v</a></i>'
+               b'<i id="2" xmlns:z="urn:z">t<sub/>u</i>'
+               b'</l></b></r>')
+        items = list(utils.iter_xml_elements(io.BytesIO(xml), 3))
+        self.assertEqual(items, [
+            (('r', 'b', 'l'), 'i', {'id': '1',
+                                    'a': {'n': 'k', '_content': 'v'}}),
+            (('r', 'b', 'l'), 'i', {'id': '2', 'xmlns:z': 'urn:z',
+                                    'sub': {}, '_content': 'u'}),
+        ])
+
+    def test_iter_xml_elements_is_incremental(self):
+        class Source(object):
+            """ Counts the read bytes """
+            def __init__(self, data):
+                self.f = io.BytesIO(data)
+                self.read_bytes = 0
+
+            def read(self, size=-1):
+                data = self.f.read(min(size, 1024))
+                self.read_bytes += len(data)
+                return data
+
+        xml = b'<r><b><l>' + b'<i id="1"/>' * 100000 + b'</l></b></r>'
+        source = Source(xml)
+        items = utils.iter_xml_elements(source, 3)
+        next(items)
+        self.assertLess(source.read_bytes, len(xml) / 10)
+        self.assertEqual(sum(1 for i in items), 99999)
+
+    def test_auto_type_is_memoized(self):
+        utils.auto_type.clear()
+        before = utils.auto_type.stats()
+        self.assertEqual(utils.auto_type('1234'), 1234)
+        self.assertEqual(utils.auto_type('1234'), 1234)
+        after = utils.auto_type.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['size'], 1)
+
+    def test_memoized_is_bounded(self):
+        @utils.memoized(maxsize=2)
+        def upper(s):
+            return s.upper()
+
+        for s in ('a', 'b', 'a', 'c', 'a', 'b'):
+            self.assertEqual(upper(s), s.upper())
+        # 'b' was the least recently used when 'c' came
+        self.assertEqual(upper.stats(), {'hits': 2, 'misses': 4, 'size': 2})
+
+    def test_memoized_skips_non_strings(self):
+        @utils.memoized()
+        def kind(v):
+            return type(v)
+
+        # True == 1, they should not share a cache entry
+        self.assertEqual(kind(True), bool)
+        self.assertEqual(kind(1), int)
+        self.assertEqual(kind.stats()['size'], 0)
+
+    def test_share(self):
+        a = ''.join(['ena', 'bled'])
+        b = ''.join(['enab', 'led'])
+        self.assertIsNot(a, b)
+        self.assertIs(utils.share(a), utils.share(b))
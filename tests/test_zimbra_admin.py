@@ -536,6 +536,29 @@ class PythonicAdminAPITests(unittest.TestCase):
 
         self.zc.delete_account(ac)
 
+    def test_batch_modify_account_and_add_alias(self):
+        ac_name = 'test-{}@zimbratest.example.com'.format(
+            random.randint(0, 10**9))
+        ac = self.zc.create_account(ac_name, 'pass1234')
+        alias_name = 'test-{}@zimbratest.example.com'.format(
+            random.randint(0, 10**9))
+
+        with self.zc.batch() as b:
+            b.modify_account(ac, {'displayName': 'batched'})
+            b.add_account_alias(ac, alias_name)
+            b.add_account_alias(ac, 'not-an-address')
+
+        results = b.results()
+        self.assertIsInstance(results[0], dict)
+        self.assertEqual(results[1], {})
+        self.assertIsInstance(results[2], ZimbraSoapServerError)
+
+        ac_got = self.zc.get_account(Account(name=ac_name))
+        self.assertEqual(ac_got['displayName'], 'batched')
+        self.assertIn(alias_name, ac_got['mail'])
+
+        self.zc.delete_account(ac)
+
     def test_get_mailbox_stats(self):
         stats = self.zc.get_mailbox_stats()
         self.assertIsInstance(stats, dict)
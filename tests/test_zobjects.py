@@ -4,14 +4,40 @@ from __future__ import unicode_literals
 
 """ Unittests for zimsoap.zobjects """
 
+import gc
+import os
+import shutil
+import tempfile
+import timeit
 import unittest
+import uuid
 
 from six import text_type, binary_type
 
 import zimsoap.utils
 from zimsoap.zobjects import (
-    Account, Domain, Identity, Mailbox, Signature, ZObject)
-from . import samples
+    Account, CompactAccount, CompactDistributionList, DistributionList,
+    Domain, Identity, Mailbox, Signature, ZObject, dump_snapshot,
+    load_snapshot)
+from . import benchmark, samples
+
+
+class ReferenceAccount(Account):
+    """ Account with the former hashing and equality, for benchmarks
+    """
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            raise TypeError()
+        try:
+            if (not zimsoap.utils.is_zuuid(self.id) or
+                    not zimsoap.utils.is_zuuid(other.id)):
+                raise AttributeError()
+        except AttributeError:
+            raise ValueError()
+        return self.id == other.id
 
 
 class ZObjectsTests(unittest.TestCase):
@@ -204,3 +230,183 @@ class ZObjectsTests(unittest.TestCase):
     def test_property(self):
         norm = Account.from_dict(self.normal_account_dict['account'])
         self.assertEqual(norm.property('zimbraFeatureSignaturesEnabled'), True)
+
+    def test_a_tags_are_parsed_lazily(self):
+        acc = Account.from_dict(self.normal_account_dict['account'])
+        self.assertIsNone(acc._a_raw)
+
+        self.assertEqual(acc['zimbraFeatureSignaturesEnabled'], True)
+        # only the requested tag is typed
+        self.assertEqual(
+            list(acc._a_typed), ['zimbraFeatureSignaturesEnabled'])
+        self.assertTrue(acc.has_property('zimbraId'))
+        self.assertFalse(acc.has_property('nonExistant'))
+        self.assertEqual(acc.property_as_list('nonExistant'), [])
+
+        self.assertEqual(
+            acc._a_tags,
+            Account._parse_a_tags(self.normal_account_dict['account']))
+
+    def test_a_tags_set_before_parsing(self):
+        acc = Account.from_dict(self.normal_account_dict['account'])
+        acc['zimbraFeatureSignaturesEnabled'] = 'FALSE'
+        self.assertEqual(acc.property('zimbraFeatureSignaturesEnabled'), False)
+        self.assertEqual(acc._a_tags['zimbraFeatureSignaturesEnabled'], False)
+
+    def test_compact_account(self):
+        data = self.normal_account_dict['account']
+        acc = CompactAccount.from_dict(data)
+        self.assertIsInstance(acc, Account)
+        # no instance dict was allocated, only the slots are used
+        self.assertEqual(
+            [r for r in gc.get_referents(acc)
+             if isinstance(r, dict) and r is not acc._a_keys], [])
+        self.assertEqual(acc.name, data['name'])
+        self.assertEqual(acc._a_tags, Account._parse_a_tags(data))
+        self.assertEqual(acc.property('zimbraFeatureSignaturesEnabled'), True)
+        self.assertFalse(acc.is_admin())
+
+        acc['zimbraIsAdminAccount'] = True
+        self.assertTrue(acc.is_admin())
+
+    def test_compact_objects_share_key_tables(self):
+        data = self.normal_account_dict['account']
+        acc1 = CompactAccount.from_dict(data)
+        acc2 = CompactAccount.from_dict(data)
+        self.assertIs(acc1._a_keys, acc2._a_keys)
+
+    def test_compact_full_data(self):
+        data = self.normal_account_dict['account']
+        acc = CompactAccount.from_dict(data)
+        self.assertIsNone(acc._full_data)
+        self.assertEqual(acc.get_full_data()['id'], data['id'])
+        self.assertEqual(Account._parse_a_tags(acc.get_full_data()),
+                         Account._parse_a_tags(data))
+
+        acc = CompactAccount.from_dict(data, keep_full_data=True)
+        self.assertIs(acc.get_full_data(), data)
+
+    def test_compact_merge(self):
+        data = self.normal_account_dict['account']
+        acc = CompactAccount.from_dict(data)
+        acc._update_from(CompactAccount.from_dict(
+            {'id': data['id'], 'name': 'new@example.com',
+             'a': [{'n': 'zimbraIsAdminAccount', '_content': 'TRUE'}]}),
+            merge=True)
+        self.assertEqual(acc.name, 'new@example.com')
+        self.assertTrue(acc.is_admin())
+        self.assertEqual(acc.property('zimbraFeatureSignaturesEnabled'), True)
+
+    def test_compact_distribution_list(self):
+        dl = CompactDistributionList.from_dict(
+            {'id': 'x', 'name': 'dl@example.com',
+             'dlm': [{'_content': 'a@example.com'}, 'b@example.com']})
+        self.assertEqual(dl.members, ['a@example.com', 'b@example.com'])
+
+    def test_ZObjects_id_checked_once(self):
+        d1 = Domain(id='d78fd9c9-f000-440b-bce6-ea938d40fa2d')
+        d2 = Domain(id='d78fd9c9-f000-440b-bce6-ea938d40fa2d')
+        self.assertEqual(d1, d2)
+        self.assertIs(d1._cmp_key[0], d1.id)
+
+        d1.id = 'not-an-uuid'
+        with self.assertRaises(ValueError):
+            d1 == d2
+
+    def test_ZObjects_hash_by_id(self):
+        d1 = Domain(id='d78fd9c9-f000-440b-bce6-ea938d40fa2d', name='a.com')
+        d2 = Domain(id='d78fd9c9-f000-440b-bce6-ea938d40fa2d', name='b.com')
+        self.assertEqual(len({d1, d2}), 1)
+        # no valid id, still hashable
+        self.assertEqual(len({Domain(name='a.com'), Domain(name='b.com')}), 2)
+
+    def test_ZObjects_compared_by_name_without_id(self):
+        a1 = Account(name='foo@example.com')
+        a2 = Account(name='Foo@example.com')
+        self.assertEqual(a1, a2)
+        self.assertEqual(len({a1, a2}), 1)
+        self.assertNotEqual(a1, Account(name='bar@example.com'))
+        # the id comes first
+        self.assertNotEqual(
+            a1, Account(id='d78fd9c9-f000-440b-bce6-ea938d40fa2d',
+                        name='foo@example.com'))
+        with self.assertRaises(ValueError):
+            Account() == a1
+
+    @benchmark
+    def test_ZObjects_set_building_speed(self):
+        ids = [str(uuid.uuid4()) for i in range(5000)]
+
+        def set_building(cls):
+            accounts = [cls(id=i, name=i + '@example.com') for i in ids]
+            fetched = [cls(id=i, name=i + '@example.com') for i in ids]
+
+            def run():
+                known = set(accounts)
+                return [a for a in fetched if a in known]
+            return min(timeit.repeat(run, number=3, repeat=3))
+
+        ref = set_building(ReferenceAccount)
+        new = set_building(Account)
+        # measured 2.6-3.3x
+        self.assertLess(new * 2, ref)
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'snapshot')
+        xml2dict = zimsoap.utils.xml_str_to_dict
+        self.account = Account.from_dict(
+            xml2dict(samples.NORMAL_ACCOUNT)['account'])
+        self.objs = [
+            self.account,
+            CompactAccount.from_dict(
+                xml2dict(samples.ADMIN_ACCOUNT)['account']),
+            DistributionList.from_dict(
+                {'id': 'x', 'name': 'dl@example.com',
+                 'dlm': ['a@example.com', 'b@example.com']}),
+            Mailbox.from_dict(xml2dict(samples.MBOX)['mbox']),
+            Domain(name='example.com'),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_snapshot_round_trip(self):
+        self.account['zimbraMailQuota'] = 42
+        dump_snapshot(self.objs, self.path)
+
+        with load_snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot), len(self.objs))
+            for orig, loaded in zip(self.objs, snapshot):
+                self.assertIs(type(loaded), type(orig))
+                self.assertEqual(loaded._a_tags, orig._a_tags)
+            self.assertEqual(snapshot[0]['zimbraMailQuota'], 42)
+            self.assertEqual(snapshot[0].name, self.account.name)
+            self.assertEqual(snapshot[2].members,
+                             ['a@example.com', 'b@example.com'])
+            self.assertEqual(snapshot[3].newMessages, '0')
+            self.assertEqual(snapshot[-1].name, 'example.com')
+            with self.assertRaises(IndexError):
+                snapshot[len(self.objs)]
+
+    def test_snapshot_not_lazy(self):
+        dump_snapshot(self.objs, self.path)
+        objs = load_snapshot(self.path, lazy=False)
+        self.assertEqual([o.id for o in objs[:4]],
+                         [o.id for o in self.objs[:4]])
+
+    def test_snapshot_shares_strings(self):
+        dump_snapshot([self.account, self.account], self.path)
+        with load_snapshot(self.path) as snapshot:
+            self.assertIs(snapshot[0].id, snapshot[1].id)
+
+    def test_snapshot_unsupported(self):
+        with self.assertRaises(ValueError):
+            dump_snapshot([ZObjectsTests.NullZObject()], self.path)
+
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot')
+        with self.assertRaises(ValueError):
+            load_snapshot(self.path)
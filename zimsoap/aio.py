@@ -0,0 +1,664 @@
+# -*- coding: utf-8 -*-
+""" asyncio SOAP clients (python >= 3.5 only)
+
+The clients here expose the low-level API of the regular clients (request(),
+request_single(), request_list(), request_many(), login(), delegated_login(),
+get_logged_in_by(), is_session_valid()) as coroutines, batch() as an
+asynchronous context manager and iter_request() as an asynchronous iterator,
+so that a lot of requests can be in flight at the same time from a single
+thread:
+
+    async def main():
+        zc = AsyncZimbraAdminClient('zimbra.example.com')
+        await zc.login('admin@example.com', 'secret')
+        accounts = await asyncio.gather(*(
+            zc.request_single('GetAccount', {'account': Account(
+                name=name).to_selector()})
+            for name in names))
+        zc.close()
+
+Requests are built and responses unwrapped by the very same code as the
+regular clients, only the network I/O differs. The number of requests in
+flight at the same time is bounded by `max_concurrency`. As its kept-alive
+connections, a client is bound to the event loop it is first used in.
+A `rate_limiter` (see ratelimit) is applied without blocking the loop, and
+can be shared with regular clients.
+
+The high-level helpers of the regular clients (get_account()...) are
+blocking and are not available here, but for
+AsyncZimbraAdminClient.get_preauth_key(), used by get_logged_in_by().
+"""
+
+import asyncio
+import copy
+import io
+import socket
+
+from six.moves import http_client
+
+from zimsoap import client
+from zimsoap import ratelimit
+from zimsoap import singleflight
+from zimsoap import transport
+from zimsoap import utils
+from zimsoap import zobjects
+from zimsoap.transport import URLError
+
+
+# Errors raised as URLError
+NETWORK_ERRORS = (socket.error, http_client.HTTPException,
+                  asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+# Errors meaning, while sending a request on a kept-alive connection, that it
+# was closed by the server while it was sitting in the pool.
+STALE_CONNECTION_ERRORS = (ConnectionError,)
+
+
+class AsyncConnection(object):
+    """ A minimal HTTP/1.1 client connection over asyncio streams
+    """
+    def __init__(self, host, port, reader, writer):
+        self.host = host
+        self.port = port
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port, context=None, timeout=None):
+        if context is not None:
+            coro = asyncio.open_connection(
+                host, port, ssl=context, server_hostname=host)
+        else:
+            coro = asyncio.open_connection(host, port)
+        reader, writer = await asyncio.wait_for(coro, timeout)
+        return cls(host, port, reader, writer)
+
+    def close(self):
+        self.writer.close()
+
+    async def request(self, method, path, body=b'', headers={}):
+        """ Sends a request and reads the whole response
+
+        :returns: a (status, reason, headers, body, will_close) tuple
+        """
+        await self.send(method, path, body, headers)
+        return await self.read_response()
+
+    async def send(self, method, path, body=b'', headers={}):
+        lines = ['{0} {1} HTTP/1.1'.format(method, path),
+                 'Host: {0}:{1}'.format(self.host, self.port),
+                 'Content-Length: {0}'.format(len(body))]
+        lines.extend('{0}: {1}'.format(k, v) for k, v in headers.items())
+        head = '\r\n'.join(lines) + '\r\n\r\n'
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+    async def read_response(self):
+        """ :returns: a (status, reason, headers, body, will_close) tuple
+        :raises http_client.RemoteDisconnected: if the server closed the
+                                                connection without answering
+        """
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise http_client.RemoteDisconnected(
+                'Remote end closed connection without response')
+        try:
+            version, status, reason = status_line.decode(
+                'latin-1').rstrip('\r\n').split(' ', 2)
+            status = int(status)
+        except ValueError:
+            raise http_client.BadStatusLine(status_line)
+
+        raw_headers = b''
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            raw_headers += line
+        resp_headers = http_client.parse_headers(io.BytesIO(raw_headers))
+
+        connection = resp_headers.get('Connection', '').lower()
+        will_close = (connection == 'close' or
+                      (version == 'HTTP/1.0' and connection != 'keep-alive'))
+
+        if 'chunked' in resp_headers.get('Transfer-Encoding', '').lower():
+            data = await self._read_chunked()
+        elif resp_headers.get('Content-Length') is not None:
+            data = await self.reader.readexactly(
+                int(resp_headers['Content-Length']))
+        else:
+            data = await self.reader.read()
+            will_close = True
+
+        return status, reason, resp_headers, data, will_close
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = await self.reader.readline()
+            size = int(size.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                break
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+        # trailers
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+        return b''.join(chunks)
+
+
+class AsyncConnectionPool(transport.ConnectionPool):
+    """ Keep-alive asyncio connections to a single (host, port)
+
+    Same as transport.ConnectionPool, at most `maxsize` idle connections are
+    kept. The number of requests in flight is bounded by the semaphore of
+    the `manager`, shared between all its pools.
+    """
+    def __init__(self, host, port, scheme='https', maxsize=10, timeout=None,
+                 context=None, idle_timeout=60, manager=None):
+        super(AsyncConnectionPool, self).__init__(
+            host, port, scheme, maxsize, timeout, context, idle_timeout)
+        self.manager = manager
+
+    async def _new_connection(self):
+        return await AsyncConnection.open(
+            self.host, self.port,
+            self.context if self.scheme == 'https' else None,
+            self.timeout)
+
+    async def get(self):
+        """ Get a connection, reusing an idle one if possible
+
+        :returns: a (connection, reused) tuple
+        """
+        conn = self._get_idle()
+        if conn is None:
+            return await self._new_connection(), False
+        else:
+            return conn, True
+
+    async def urlopen(self, method, path, body=b'', headers={}):
+        """ Sends a request and reads the whole response
+
+        A connection found closed by the server while idle is transparently
+        replaced by a new one.
+
+        :returns: a (status, reason, headers, body) tuple
+        """
+        if self.manager is None:
+            return await self._urlopen(method, path, body, headers)
+        async with self.manager.semaphore:
+            return await self._urlopen(method, path, body, headers)
+
+    async def _urlopen(self, method, path, body, headers):
+        # sent again only if it cannot have been processed, see
+        # transport.ConnectionPool.stream()
+        while True:
+            conn, reused = await self.get()
+            try:
+                await asyncio.wait_for(
+                    conn.send(method, path, body, headers), self.timeout)
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            try:
+                status, reason, resp_headers, data, will_close = \
+                    await asyncio.wait_for(
+                        conn.read_response(), self.timeout)
+            except http_client.RemoteDisconnected:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            if will_close:
+                conn.close()
+            else:
+                self.put(conn)
+
+            return status, reason, resp_headers, data
+
+
+class AsyncPoolManager(transport.PoolManager):
+    """ Holds one AsyncConnectionPool per (scheme, host, port)
+
+    :param max_concurrency: maximum number of requests in flight, all
+                            servers included.
+    """
+    POOL_CLASS = AsyncConnectionPool
+
+    def __init__(self, maxsize=10, timeout=None, context=None,
+                 idle_timeout=60, max_concurrency=10, **kwargs):
+        super(AsyncPoolManager, self).__init__(
+            maxsize, timeout, context, idle_timeout, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # created lazily, older pythons bind it to the current event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def connection_pool(self, scheme, host, port):
+        pool = super(AsyncPoolManager, self).connection_pool(
+            scheme, host, port)
+        pool.manager = self
+        return pool
+
+    async def urlopen(self, method, url, body=b'', headers={}):
+        """ Same as transport.PoolManager.urlopen(), as a coroutine
+        """
+        pool, path = self._pool_and_path(url)
+        try:
+            return await pool.urlopen(method, path, body, headers)
+        except NETWORK_ERRORS as e:
+            raise URLError(e)
+
+
+class AsyncCommunication(transport.PooledCommunication):
+    """ Same as transport.PooledCommunication, but send_request() is a
+    coroutine.
+    """
+    POOL_MANAGER = AsyncPoolManager
+
+    async def send_request(self, request, response=None):
+        """ Same contract as PooledCommunication.send_request()
+        """
+        headers, body = self._prepare_request(request)
+        try:
+            status, reason, resp_headers, data = await self.pool.urlopen(
+                'POST', self.path, body, headers)
+        except NETWORK_ERRORS as e:
+            raise URLError(e)
+
+        return self._feed_response(
+            request, response, status, reason, resp_headers, data)
+
+
+class AsyncSingleFlight(singleflight.SingleFlight):
+    """ Same as singleflight.SingleFlight, for coroutine functions called
+    from a single event loop: the callers asking for a key in flight wait
+    for the future of the first one.
+    """
+    async def do(self, key, func):
+        call = self._calls.get(key)
+        if call is not None:
+            self.shared += 1
+            # cancelling a caller does not cancel the shared call
+            return copy.deepcopy(await asyncio.shield(call))
+
+        self.calls += 1
+        call = self._calls[key] = asyncio.get_event_loop().create_future()
+        try:
+            result = await func()
+        except Exception as e:
+            call.set_exception(e)
+            # raised to the first caller, whether others wait or not
+            call.exception()
+            raise
+        except BaseException:
+            call.cancel()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+async def acquire_slot(limiter):
+    """ Same as ratelimit.HostLimiter.acquire(), without blocking the loop
+
+    :returns: the time the request was allowed
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        freed = asyncio.Event()
+
+        def waiter():
+            try:
+                loop.call_soon_threadsafe(freed.set)
+            except RuntimeError:
+                pass  # the loop is closed
+
+        slot = limiter.try_acquire(waiter)
+        if slot is not None:
+            break
+        await freed.wait()
+
+    started, wait = slot
+    if wait:
+        await asyncio.sleep(wait)
+    return started
+
+
+async def limited_call(rate_limiter, host, func):
+    """ Same as ratelimit.RateLimiter.call(), for a coroutine function
+    """
+    limiter = rate_limiter.host_limiter(host)
+    attempt = 0
+    while True:
+        started = await acquire_slot(limiter)
+        try:
+            ret = await func()
+        except Exception as e:
+            throttled = ratelimit.is_throttling_error(e)
+            limiter.release(started, throttled)
+            if not throttled or attempt >= rate_limiter.retries:
+                raise
+        except BaseException:
+            limiter.release(started)
+            raise
+        else:
+            limiter.release(started)
+            return ret
+
+        await asyncio.sleep(rate_limiter.backoff_delay(attempt))
+        attempt += 1
+
+
+class AsyncZimbraAPISession(client.ZimbraAPISession):
+    """ ZimbraAPISession, with login() and is_session_valid() coroutines
+    """
+    async def login(self, username, password, namespace=None):
+        if namespace is None:
+            namespace = self.client.NAMESPACE
+
+        data = await self.client.request(
+            'Auth', self._auth_content(username, password), namespace)
+        self._import_auth(data)
+
+    async def is_session_valid(self, namespace=None, force_check=False):
+        if not force_check:
+            valid = self._known_validity()
+            if valid is not None:
+                return valid
+        try:
+            await self.client.request(
+                'Auth', self._validity_check_content(), namespace)
+            return True
+        except client.ZimbraSoapServerError as e:
+            self.note_fault(e.code, validity_check=True)
+            return False
+
+
+class AsyncBatch(client.Batch):
+    """ Same as client.Batch, for asyncio clients: the requests are queued
+    with its request() coroutine, within an `async with` block, see
+    AsyncZimbraAbstractClient.batch().
+    """
+    def __enter__(self):
+        raise TypeError('asyncio batches are used with "async with"')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.send()
+        return False
+
+    async def request(self, name, content={}, namespace=None):
+        """ Queues a request
+
+        :returns: a BatchItem
+        """
+        return self.add(name, content, namespace or self.client.NAMESPACE)
+
+    async def send(self):
+        """ Sends the queued requests, max_size requests per BatchRequest
+        """
+        pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.max_size):
+            await self._send_chunk(pending[i:i+self.max_size])
+
+    async def _send_chunk(self, items):
+        req, resp = self._build_chunk(items)
+        await self.client._send(req, resp)
+        self._read_chunk(req, resp, items)
+
+
+class ResponseIterator(object):
+    """ An asynchronous iterator over the (tag name, dict) children of a
+    response, see AsyncZimbraAbstractClient.iter_request()
+    """
+    def __init__(self, response):
+        # a coroutine giving the response dict
+        self._response = response
+        self._children = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._children is None:
+            self._children = iter([
+                (tag, i)
+                for tag, value in (await self._response).items()
+                if isinstance(value, (dict, list))
+                for i in utils.as_list(value)])
+        try:
+            return next(self._children)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncZimbraAbstractClient(client.ZimbraAbstractClient):
+    """ Factorized code for asyncio SOAP API access.
+
+    :param max_concurrency: maximum number of requests in flight (ignored if
+                            a pool_manager is given)
+    """
+    POOL_MANAGER = AsyncPoolManager
+    COMMUNICATION = AsyncCommunication
+    SINGLE_FLIGHT = AsyncSingleFlight
+
+    def __init__(self, server_host, server_port, max_concurrency=10,
+                 *args, **kwargs):
+        self.max_concurrency = max_concurrency
+        super(AsyncZimbraAbstractClient, self).__init__(
+            server_host, server_port, *args, **kwargs)
+
+    def _new_pool_manager(self, **kwargs):
+        return self.POOL_MANAGER(max_concurrency=self.max_concurrency,
+                                 **kwargs)
+
+    def _new_session(self):
+        return AsyncZimbraAPISession(self)
+
+    async def _send(self, req, resp):
+        if self.rate_limiter is None:
+            await self.com.send_request(req, resp)
+        else:
+            pool = self.com.pool
+            await limited_call(
+                self.rate_limiter, (pool.host, pool.port),
+                lambda: self._send_once(req, resp))
+
+    async def _send_once(self, req, resp):
+        await self.com.send_request(req, resp)
+        self._raise_if_unavailable(req, resp)
+
+    def batch(self, onerror='continue', max_size=100):
+        """ Same as ZimbraAbstractClient.batch(), the requests being queued
+        through the request() coroutine of the batch:
+
+            async with zc.batch() as b:
+                for account in accounts:
+                    await b.request('ModifyAccount', {...})
+            for res in b.results():
+                ...
+
+        :returns: an AsyncBatch
+        """
+        return AsyncBatch(self, onerror, max_size)
+
+    async def request(self, name, content={}, namespace=None):
+        """ Do a SOAP request and returns the result.
+
+        :param name: ex: 'Auth' for performing an 'AuthRequest'
+        :param content: a dict formatted pythonzimbra-style for request
+        :param namespace: (optional), the namespace, if different from the
+                          client's
+
+        :returns: a dict with response
+        """
+        if not namespace:
+            namespace = self.NAMESPACE
+
+        if self.single_flight is not None and client.is_read_request(name):
+            return await self.single_flight.do(
+                singleflight.request_key(name, content, namespace),
+                lambda: self._request(name, content, namespace))
+
+        return await self._request(name, content, namespace)
+
+    async def _request(self, name, content, namespace):
+        req, resp = self._build_request(name, content, namespace)
+        await self._send(req, resp)
+        return self._extract_response(req, resp, name)
+
+    async def request_many(self, requests, return_exceptions=False):
+        """ Sends several requests concurrently, see
+        ZimbraAbstractClient.request_many(). The concurrency is bounded by
+        max_concurrency.
+
+        :returns: the list of responses, in the order of `requests`
+        """
+        async def send(args):
+            try:
+                return await self.request(*args)
+            except client.ZimSOAPException as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        return list(await asyncio.gather(*(send(i) for i in requests)))
+
+    def iter_request(self, name, content={}, namespace=None):
+        """ Same as ZimbraAbstractClient.iter_request(), as an asynchronous
+        iterator (`async for`) ; the response is parsed at once.
+        """
+        return ResponseIterator(self.request(name, content, namespace))
+
+    async def request_single(self, name, content={}):
+        """
+        :returns: the first tag in the response body
+        """
+        return self._unwrap_single(await self.request(name, content))
+
+    async def request_list(self, name, content={}):
+        """
+        :returns: the list of tags with same name or empty list
+        """
+        return self._unwrap_list(await self.request(name, content))
+
+    async def login(self, user, password):
+        self._route(user)
+        await self._session.login(user, password)
+
+    async def delegated_login(self, login, admin_zc, duration=0):
+        """ Same as ZimbraAbstractClient.delegated_login(), admin_zc being
+        an already logged-in AsyncZimbraAdminClient.
+        """
+        resp = await admin_zc.request(
+            'DelegateAuth', self._delegate_auth_content(login, duration))
+        self._import_delegated_auth(login, resp)
+
+    async def get_logged_in_by(self, login, parent_zc, duration=0):
+        """ Same as ZimbraAbstractClient.get_logged_in_by(), parent_zc being
+        an already logged-in AsyncZimbraAdminClient, whose connections are
+        used for the preauth request.
+        """
+        domain = zobjects.Account(name=login).get_domain()
+        preauth_key = await parent_zc.get_preauth_key(domain)
+        rc = self.REST_PREAUTH(self._server_host, parent_zc._server_port,
+                               pool_manager=parent_zc.pool_manager)
+        url = rc.get_preauth_url(login, duration, preauth_key)
+        status, reason, headers, body = \
+            await parent_zc.pool_manager.urlopen('GET', url)
+        authToken = rc.parse_preauth_response(url, status, reason, headers)
+
+        self._route(login)
+        self.login_with_authToken(authToken, duration * 1000)
+
+    async def is_session_valid(self, force_check=False):
+        return await self._session.is_session_valid(force_check=force_check)
+
+    def close(self):
+        """ Closes the idle connections of the client
+        """
+        self.pool_manager.close()
+
+
+class AsyncZimbraAccountClient(AsyncZimbraAbstractClient):
+    """ asyncio counterpart of ZimbraAccountClient
+    """
+    NAMESPACE = client.ZimbraAccountClient.NAMESPACE
+    LOCATION = client.ZimbraAccountClient.LOCATION
+    REST_PREAUTH = client.ZimbraAccountClient.REST_PREAUTH
+
+    def __init__(self, server_host, server_port='443', *args, **kwargs):
+        super(AsyncZimbraAccountClient, self).__init__(
+            server_host, server_port, *args, **kwargs)
+
+
+class AsyncZimbraAdminClient(AsyncZimbraAbstractClient):
+    """ asyncio counterpart of ZimbraAdminClient
+    """
+    NAMESPACE = client.ZimbraAdminClient.NAMESPACE
+    LOCATION = client.ZimbraAdminClient.LOCATION
+    REST_PREAUTH = client.ZimbraAdminClient.REST_PREAUTH
+
+    def __init__(self, server_host, server_port='7071', *args, **kwargs):
+        super(AsyncZimbraAdminClient, self).__init__(
+            server_host, server_port, *args, **kwargs)
+
+    async def get_preauth_key(self, domain):
+        """ Same as ZimbraAdminClient.get_preauth_key(), fetched at each
+        call
+
+        :param domain: a Domain, with its name set
+        :raises DomainHasNoPreAuthKey: if the domain has none
+        """
+        resp = await self.request_single('GetDomain', {
+            'domain': domain.to_selector(), 'attrs': 'zimbraPreAuthKey'})
+        try:
+            return zobjects.Domain.from_dict(resp)['zimbraPreAuthKey']
+        except KeyError:
+            raise client.DomainHasNoPreAuthKey(domain)
+
+
+class AsyncZimbraMailClient(AsyncZimbraAbstractClient):
+    """ asyncio counterpart of ZimbraMailClient
+    """
+    NAMESPACE = client.ZimbraMailClient.NAMESPACE
+    LOCATION = client.ZimbraMailClient.LOCATION
+    REST_PREAUTH = client.ZimbraMailClient.REST_PREAUTH
+
+    def __init__(self, server_host, server_port='443', *args, **kwargs):
+        super(AsyncZimbraMailClient, self).__init__(
+            server_host, server_port, *args, **kwargs)
+
+    async def login(self, user, password):
+        # !!! We need to authenticate with the 'urn:zimbraAccount' namespace
+        self._route(user)
+        await self._session.login(user, password, 'urn:zimbraAccount')
+
+    async def is_session_valid(self, force_check=False):
+        # zimbraMail do not have by itself an Auth request
+        return await self._session.is_session_valid(
+            'urn:zimbraAccount', force_check)
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Types of the zimbra attributes, to type their values
+
+The values of <a> tags and preferences are strings on the wire. Rather than
+guessing their type from their content (see utils.auto_type()), which is
+slow and turns zip codes or phone numbers to ints, the converter is picked
+from the type declared by zimbra (attrs.xml) for that attribute name. Unknown
+attributes still go through auto_type().
+
+A table of common attributes is shipped, others can be loaded from the
+attrs.xml of a server (/opt/zimbra/conf/attrs/zimbra-attrs.xml):
+
+    attrtypes.load_attrs_xml('zimbra-attrs.xml')
+"""
+
+from xml.etree import ElementTree
+
+from zimsoap import utils
+
+
+def to_bool(s):
+    if s == 'TRUE':
+        return True
+    elif s == 'FALSE':
+        return False
+    return s
+
+
+@utils.memoized()
+def to_int(s):
+    try:
+        return int(s)
+    except (TypeError, ValueError):
+        return s
+
+
+# equal values share memory
+to_text = utils.share
+
+
+# Converters by attrs.xml type, others are kept as text
+CONVERTERS = {
+    'boolean': to_bool,
+    'integer': to_int,
+    'long': to_int,
+    'port': to_int,
+}
+
+# Attribute names, by attrs.xml type
+_TABLE = {
+    'boolean': '''
+        amavisBypassSpamChecks zimbraAdminConsoleCatchAllAddressEnabled
+        zimbraAdminConsoleDNSCheckEnabled zimbraAdminConsoleLDAPAuthEnabled
+        zimbraAdminConsoleSkinEnabled zimbraAllowAnyFromAddress
+        zimbraArchiveEnabled zimbraAttachmentsBlocked
+        zimbraAttachmentsIndexingEnabled zimbraAttachmentsViewInHtmlOnly
+        zimbraCalendarKeepExceptionsOnSeriesTimeChange
+        zimbraCalendarResourceDoubleBookingAllowed
+        zimbraCalendarShowResourceTabs zimbraDataSourceImportOnLogin
+        zimbraDeviceFileOpenWithEnabled zimbraDeviceLockWhenInactive
+        zimbraDeviceOfflineCacheEnabled zimbraDevicePasscodeEnabled
+        zimbraDomainMandatoryMailSignatureEnabled zimbraDumpsterEnabled
+        zimbraDumpsterPurgeEnabled
+        zimbraExternalShareDomainWhitelistEnabled
+        zimbraExternalSharingEnabled zimbraFeatureAdminMailEnabled
+        zimbraFeatureAdvancedSearchEnabled zimbraFeatureAntispamEnabled
+        zimbraFeatureBriefcaseDocsEnabled
+        zimbraFeatureBriefcaseSlidesEnabled
+        zimbraFeatureBriefcaseSpreadsheetEnabled
+        zimbraFeatureBriefcasesEnabled zimbraFeatureCalendarEnabled
+        zimbraFeatureCalendarReminderDeviceEmailEnabled
+        zimbraFeatureCalendarUpsellEnabled
+        zimbraFeatureChangePasswordEnabled
+        zimbraFeatureComposeInNewWindowEnabled
+        zimbraFeatureConfirmationPageEnabled
+        zimbraFeatureContactsDetailedSearchEnabled
+        zimbraFeatureContactsEnabled zimbraFeatureContactsUpsellEnabled
+        zimbraFeatureConversationsEnabled zimbraFeatureCrocodocEnabled
+        zimbraFeatureDiscardInFiltersEnabled
+        zimbraFeatureDistributionListExpandMembersEnabled
+        zimbraFeatureDistributionListFolderEnabled
+        zimbraFeatureExportFolderEnabled
+        zimbraFeatureExternalFeedbackEnabled zimbraFeatureFiltersEnabled
+        zimbraFeatureFlaggingEnabled zimbraFeatureFreeBusyViewEnabled
+        zimbraFeatureFromDisplayEnabled zimbraFeatureGalAutoCompleteEnabled
+        zimbraFeatureGalEnabled zimbraFeatureGalSyncEnabled
+        zimbraFeatureGroupCalendarEnabled zimbraFeatureHtmlComposeEnabled
+        zimbraFeatureIMEnabled zimbraFeatureIdentitiesEnabled
+        zimbraFeatureImapDataSourceEnabled
+        zimbraFeatureImportExportFolderEnabled
+        zimbraFeatureImportFolderEnabled
+        zimbraFeatureInitialSearchPreferenceEnabled
+        zimbraFeatureInstantNotify zimbraFeatureMAPIConnectorEnabled
+        zimbraFeatureMailEnabled zimbraFeatureMailForwardingEnabled
+        zimbraFeatureMailForwardingInFiltersEnabled
+        zimbraFeatureMailPollingIntervalPreferenceEnabled
+        zimbraFeatureMailPriorityEnabled zimbraFeatureMailSendLaterEnabled
+        zimbraFeatureMailUpsellEnabled
+        zimbraFeatureManageSMIMECertificateEnabled
+        zimbraFeatureManageZimlets zimbraFeatureMobilePolicyEnabled
+        zimbraFeatureMobileSyncEnabled zimbraFeatureNewAddrBookEnabled
+        zimbraFeatureNewMailNotificationEnabled
+        zimbraFeatureNotebookEnabled
+        zimbraFeatureOpenMailInNewWindowEnabled zimbraFeatureOptionsEnabled
+        zimbraFeatureOutOfOfficeReplyEnabled
+        zimbraFeaturePeopleSearchEnabled zimbraFeaturePop3DataSourceEnabled
+        zimbraFeaturePortalEnabled zimbraFeaturePriorityInboxEnabled
+        zimbraFeatureReadReceiptsEnabled zimbraFeatureSMIMEEnabled
+        zimbraFeatureSavedSearchesEnabled zimbraFeatureSharingEnabled
+        zimbraFeatureShortcutAliasesEnabled zimbraFeatureSignaturesEnabled
+        zimbraFeatureSkinChangeEnabled zimbraFeatureSocialcastEnabled
+        zimbraFeatureTaggingEnabled zimbraFeatureTasksEnabled
+        zimbraFeatureViewInHtmlEnabled zimbraFeatureVoiceChangePinEnabled
+        zimbraFeatureVoiceEnabled zimbraFeatureVoiceUpsellEnabled
+        zimbraFeatureWebSearchEnabled zimbraFeatureZimbraAssistantEnabled
+        zimbraFileAndroidCrashReportingEnabled
+        zimbraFileIOSCrashReportingEnabled
+        zimbraFreebusyLocalMailboxNotActive
+        zimbraGalAlwaysIncludeLocalCalendarResources
+        zimbraGalGroupIndicatorEnabled
+        zimbraGalSyncAccountBasedAutoCompleteEnabled zimbraHideInGal
+        zimbraImapEnabled zimbraInterceptSendHeadersOnly
+        zimbraInternalSharingCrossDomainEnabled zimbraIsAdminAccount
+        zimbraIsDelegatedAdminAccount zimbraIsDomainAdminAccount
+        zimbraIsExternalVirtualAccount zimbraIsSystemAccount
+        zimbraIsSystemResource zimbraJunkMessagesIndexingEnabled
+        zimbraLdapGalSyncDisabled
+        zimbraMailAllowReceiveButNotSendWhenOverQuota
+        zimbraMailPurgeUseChangeDateForSpam
+        zimbraMailPurgeUseChangeDateForTrash
+        zimbraMobileMetadataMaxSizeEnabled zimbraMobileOutlookSyncEnabled
+        zimbraMobilePolicyAllowNonProvisionableDevices
+        zimbraMobilePolicyAllowPartialProvisioning
+        zimbraMobilePolicyAllowSimpleDevicePassword
+        zimbraMobilePolicyAlphanumericDevicePasswordRequired
+        zimbraMobilePolicyDeviceEncryptionEnabled
+        zimbraMobilePolicyDevicePasswordEnabled
+        zimbraMobilePolicyPasswordRecoveryEnabled
+        zimbraMobilePolicySuppressDeviceEncryption
+        zimbraMobileSmartForwardRFC822Enabled zimbraNotebookSanitizeHtml
+        zimbraPasswordLocked zimbraPasswordLockoutEnabled zimbraPop3Enabled
+        zimbraPrefAccountTreeOpen zimbraPrefAdminConsoleWarnOnExit
+        zimbraPrefAdvancedClientEnforceMinDisplay
+        zimbraPrefAppleIcalDelegationEnabled
+        zimbraPrefAutoAddAddressEnabled
+        zimbraPrefAutoCompleteQuickCompletionOnComma
+        zimbraPrefAutocompleteAddressBubblesEnabled
+        zimbraPrefCalendarAllowCancelEmailToSelf
+        zimbraPrefCalendarAllowForwardedInvite
+        zimbraPrefCalendarAllowPublishMethodInvite
+        zimbraPrefCalendarAlwaysShowMiniCal
+        zimbraPrefCalendarApptAllowAtendeeEdit
+        zimbraPrefCalendarAutoAddInvites
+        zimbraPrefCalendarNotifyDelegatedChanges
+        zimbraPrefCalendarReminderFlashTitle
+        zimbraPrefCalendarReminderMobile
+        zimbraPrefCalendarReminderSendEmail
+        zimbraPrefCalendarReminderSoundsEnabled
+        zimbraPrefCalendarReminderYMessenger
+        zimbraPrefCalendarSendInviteDeniedAutoReply
+        zimbraPrefCalendarShowDeclinedMeetings
+        zimbraPrefCalendarShowPastDueReminders
+        zimbraPrefCalendarToasterEnabled zimbraPrefCalendarUseQuickAdd
+        zimbraPrefColorMessagesEnabled zimbraPrefComposeInNewWindow
+        zimbraPrefContactsDisableAutocompleteOnContactGroupMembers
+        zimbraPrefContactsExpandAppleContactGroups
+        zimbraPrefConvShowCalendar zimbraPrefDeleteInviteOnReply
+        zimbraPrefDisplayExternalImages zimbraPrefFolderColorEnabled
+        zimbraPrefFolderTreeOpen zimbraPrefForwardReplyInOriginalFormat
+        zimbraPrefGalAutoCompleteEnabled zimbraPrefGalSearchEnabled
+        zimbraPrefIMAutoLogin zimbraPrefIMFlashIcon zimbraPrefIMFlashTitle
+        zimbraPrefIMHideBlockedBuddies zimbraPrefIMHideOfflineBuddies
+        zimbraPrefIMInstantNotify zimbraPrefIMLogChats
+        zimbraPrefIMLogChatsEnabled zimbraPrefIMNotifyPresence
+        zimbraPrefIMNotifyStatus zimbraPrefIMReportIdle
+        zimbraPrefIMSoundsEnabled zimbraPrefIMToasterEnabled
+        zimbraPrefImapSearchFoldersEnabled
+        zimbraPrefIncludeSharedItemsInSearch zimbraPrefIncludeSpamInSearch
+        zimbraPrefIncludeTrashInSearch zimbraPrefMailFlashIcon
+        zimbraPrefMailFlashTitle zimbraPrefMailLocalDeliveryDisabled
+        zimbraPrefMailRequestReadReceipts zimbraPrefMailSoundsEnabled
+        zimbraPrefMailToasterEnabled zimbraPrefMandatorySpellCheckEnabled
+        zimbraPrefMessageIdDedupingEnabled
+        zimbraPrefMessageViewHtmlPreferred zimbraPrefOpenMailInNewWindow
+        zimbraPrefOutOfOfficeReplyEnabled
+        zimbraPrefOutOfOfficeStatusAlertOnLogin zimbraPrefPop3IncludeSpam
+        zimbraPrefReadingPaneEnabled zimbraPrefReplyToEnabled
+        zimbraPrefSaveToSent zimbraPrefSearchTreeOpen
+        zimbraPrefSharedAddrBookAutoCompleteEnabled
+        zimbraPrefShortEmailAddress zimbraPrefShowCalendarWeek
+        zimbraPrefShowComposeDirection zimbraPrefShowFragments
+        zimbraPrefShowSearchString zimbraPrefShowSelectionCheckbox
+        zimbraPrefSpellIgnoreAllCaps
+        zimbraPrefStandardClientAccessibilityMode zimbraPrefTagTreeOpen
+        zimbraPrefUseKeyboardShortcuts zimbraPrefUseRfc2231
+        zimbraPrefUseTimeZoneListInCalendar zimbraPrefWarnOnExit
+        zimbraPrefWhenInFoldersEnabled zimbraPrefWhenSentToEnabled
+        zimbraPrefZimletTreeOpen zimbraPublicSharingEnabled
+        zimbraSmtpRestrictEnvelopeFrom zimbraSpamApplyUserFilters
+        zimbraStandardClientCustomPrefTabsEnabled
+        zimbraWebClientShowOfflineLink
+        zimbraZimletDataSensitiveInMixedModeDisabled
+        zimbraZimletLoadSynchronously
+    ''',
+    'integer': '''
+        zimbraAutoProvBatchSize zimbraBatchedIndexingSize
+        zimbraCalendarMaxRevisions zimbraContactAutoCompleteMaxResults
+        zimbraContactMaxNumEntries zimbraContactRankingTableSize
+        zimbraDataSourceMaxNumEntries zimbraDomainAggregateQuotaWarnPercent
+        zimbraFilterBatchSize zimbraGalLdapPageSize zimbraGalMaxResults
+        zimbraGalSyncLdapPageSize zimbraGalSyncMaxConcurrentClients
+        zimbraIdentityMaxNumEntries zimbraMailBlacklistMaxNumEntries
+        zimbraMailForwardingAddressMaxLength
+        zimbraMailForwardingAddressMaxNumAddrs
+        zimbraMailHighlightObjectsMaxSize zimbraMailSignatureMaxLength
+        zimbraMailTrustedSenderListMaxNumEntries
+        zimbraMailWhitelistMaxNumEntries zimbraMaxContactsPerPage
+        zimbraMaxMailItemsPerPage zimbraMaxVoiceItemsPerPage
+        zimbraMobilePolicyAllowBluetooth zimbraMobilePolicyAllowBrowser
+        zimbraMobilePolicyAllowCamera zimbraMobilePolicyAllowConsumerEmail
+        zimbraMobilePolicyAllowDesktopSync zimbraMobilePolicyAllowHTMLEmail
+        zimbraMobilePolicyAllowInternetSharing zimbraMobilePolicyAllowIrDA
+        zimbraMobilePolicyAllowPOPIMAPEmail
+        zimbraMobilePolicyAllowRemoteDesktop
+        zimbraMobilePolicyAllowSMIMEEncryptionAlgorithmNegotiation
+        zimbraMobilePolicyAllowSMIMESoftCerts
+        zimbraMobilePolicyAllowStorageCard
+        zimbraMobilePolicyAllowTextMessaging
+        zimbraMobilePolicyAllowUnsignedApplications
+        zimbraMobilePolicyAllowUnsignedInstallationPackages
+        zimbraMobilePolicyAllowWiFi
+        zimbraMobilePolicyDevicePasswordExpiration
+        zimbraMobilePolicyDevicePasswordHistory
+        zimbraMobilePolicyMaxCalendarAgeFilter
+        zimbraMobilePolicyMaxDevicePasswordFailedAttempts
+        zimbraMobilePolicyMaxEmailAgeFilter
+        zimbraMobilePolicyMaxEmailBodyTruncationSize
+        zimbraMobilePolicyMaxEmailHTMLBodyTruncationSize
+        zimbraMobilePolicyMaxInactivityTimeDeviceLock
+        zimbraMobilePolicyMinDevicePasswordComplexCharacters
+        zimbraMobilePolicyMinDevicePasswordLength
+        zimbraMobilePolicyRefreshInterval
+        zimbraMobilePolicyRequireDeviceEncryption
+        zimbraMobilePolicyRequireEncryptedSMIMEMessages
+        zimbraMobilePolicyRequireEncryptionSMIMEAlgorithm
+        zimbraMobilePolicyRequireManualSyncWhenRoaming
+        zimbraMobilePolicyRequireSignedSMIMEAlgorithm
+        zimbraMobilePolicyRequireSignedSMIMEMessages
+        zimbraNotebookMaxRevisions zimbraPasswordEnforceHistory
+        zimbraPasswordLockoutMaxFailures zimbraPasswordMaxAge
+        zimbraPasswordMaxLength zimbraPasswordMinAge
+        zimbraPasswordMinAlphaChars zimbraPasswordMinDigitsOrPuncs
+        zimbraPasswordMinLength zimbraPasswordMinLowerCaseChars
+        zimbraPasswordMinNumericChars zimbraPasswordMinPunctuationChars
+        zimbraPasswordMinUpperCaseChars
+        zimbraPrefCalendarApptReminderWarningTime
+        zimbraPrefCalendarDayHourEnd zimbraPrefCalendarDayHourStart
+        zimbraPrefCalendarFirstDayOfWeek zimbraPrefContactsPerPage
+        zimbraPrefIMIdleTimeout zimbraPrefItemsPerVirtualPage
+        zimbraPrefMailItemsPerPage zimbraPrefMarkMsgRead
+        zimbraPrefVoiceItemsPerPage zimbraQuotaWarnPercent
+        zimbraSignatureMaxNumEntries zimbraSignatureMinNumEntries
+        zimbraSyncWindowSize zimbraWebClientMaxInputBufferLength
+    ''',
+    'long': '''
+        zimbraAggregateQuotaLastUsage zimbraDomainAggregateQuota
+        zimbraFileUploadMaxSizePerFile zimbraMailDomainQuota
+        zimbraMailQuota
+    ''',
+    'duration': '''
+        zimbraAdminAuthTokenLifetime zimbraAuthTokenLifetime
+        zimbraCalendarCalDavSharedFolderCacheDuration
+        zimbraDataSourceCalendarPollingInterval
+        zimbraDataSourceMinPollingInterval
+        zimbraDataSourceRssPollingInterval
+        zimbraDeviceAllowedPasscodeLockoutDuration
+        zimbraDumpsterUserVisibleAge
+        zimbraExternalShareInvitationUrlExpiration
+        zimbraExternalShareLifetime zimbraFileExternalShareLifetime
+        zimbraFilePublicShareLifetime zimbraFileShareLifetime
+        zimbraFilterSleepInterval zimbraFreebusyExchangeCachedInterval
+        zimbraFreebusyExchangeCachedIntervalStart
+        zimbraMailDumpsterLifetime zimbraMailIdleSessionTimeout
+        zimbraMailMessageLifetime zimbraMailMinPollingInterval
+        zimbraMailSpamLifetime zimbraMailTrashLifetime
+        zimbraPasswordLockoutDuration zimbraPasswordLockoutFailureLifetime
+        zimbraPrefAutoSaveDraftInterval
+        zimbraPrefCalendarDefaultApptDuration
+        zimbraPrefCalendarViewTimeInterval zimbraPrefInboxReadLifetime
+        zimbraPrefInboxUnreadLifetime zimbraPrefJunkLifetime
+        zimbraPrefMailPollingInterval zimbraPrefOutOfOfficeCacheDuration
+        zimbraPrefSentLifetime zimbraPrefTrashLifetime
+        zimbraPublicShareLifetime zimbraQuotaWarnInterval
+        zimbraShareLifetime
+    ''',
+    'gentime': '''
+        zimbraCreateTimestamp zimbraGalDefinitionLastModifiedTime
+        zimbraLastLogonTimestamp zimbraPasswordModifiedTime
+    ''',
+    'string': '''
+        cn co company dc description displayName facsimileTelephoneNumber
+        givenName homePhone initials l mail mobile o objectClass ou pager
+        postalCode sn st street telephoneNumber title uid userPassword
+        zimbraAccountStatus zimbraAdminConsoleUIComponents
+        zimbraAdminSavedSearches zimbraArchiveAccountDateTemplate
+        zimbraArchiveAccountNameTemplate zimbraAuthMech
+        zimbraAutoProvNotificationBody zimbraAutoProvNotificationSubject
+        zimbraBasicAuthRealm zimbraCOSId zimbraCalResType
+        zimbraContactAutoCompleteEmailFields zimbraContactEmailFields
+        zimbraDomainAggregateQuotaPolicy zimbraDomainAliasTargetId
+        zimbraDomainDefaultCOSId zimbraDomainName zimbraDomainStatus
+        zimbraDomainType zimbraExternalAccountLifetimeAfterDisabled
+        zimbraFeatureSocialFiltersEnabled zimbraFreebusyExchangeServerType
+        zimbraGalAccountId zimbraGalAutoCompleteLdapFilter
+        zimbraGalInternalSearchBase zimbraGalLdapAttrMap
+        zimbraGalLdapValueMap zimbraGalMode zimbraGalSyncTimestampFormat
+        zimbraGalTokenizeAutoCompleteKey zimbraGalTokenizeSearchKey
+        zimbraIMService zimbraId zimbraInterceptBody zimbraInterceptFrom
+        zimbraInterceptSubject zimbraMailAlias
+        zimbraMailCatchAllForwardingAddress zimbraMailDeliveryAddress
+        zimbraMailForwardingAddress zimbraMailHost
+        zimbraMailSSLClientCertPrincipalMap zimbraMailSieveScript
+        zimbraMailStatus zimbraMailThreadingAlgorithm zimbraMailTransport
+        zimbraNewMailNotificationBody zimbraNewMailNotificationFrom
+        zimbraNewMailNotificationSubject zimbraNotes zimbraPortalName
+        zimbraPreAuthKey
+        zimbraPrefBriefcaseReadingPaneLocation
+        zimbraPrefCalendarApptVisibility zimbraPrefCalendarInitialView
+        zimbraPrefCalendarReminderDuration1 zimbraPrefCalendarWorkingHours
+        zimbraPrefClientType zimbraPrefComposeFormat
+        zimbraPrefContactsInitialView zimbraPrefConvReadingPaneLocation
+        zimbraPrefConversationOrder zimbraPrefDedupeMessagesSentToSelf
+        zimbraPrefDefaultPrintFontSize zimbraPrefDefaultSignatureId
+        zimbraPrefExternalSendersType zimbraPrefFileSharingApplication
+        zimbraPrefForwardIncludeOriginalText
+        zimbraPrefForwardReplyPrefixChar zimbraPrefForwardReplySignatureId
+        zimbraPrefFromAddress zimbraPrefFromDisplay zimbraPrefGetMailAction
+        zimbraPrefGroupMailBy zimbraPrefHtmlEditorDefaultFontColor
+        zimbraPrefHtmlEditorDefaultFontFamily
+        zimbraPrefHtmlEditorDefaultFontSize zimbraPrefIMIdleStatus
+        zimbraPrefIdentityName zimbraPrefLocale
+        zimbraPrefMailForwardingAddress zimbraPrefMailInitialSearch
+        zimbraPrefMailSelectAfterDelete zimbraPrefMailSendReadReceipts
+        zimbraPrefMailSignature zimbraPrefMailSignatureStyle
+        zimbraPrefOutOfOfficeExternalReply zimbraPrefOutOfOfficeReply
+        zimbraPrefPop3DeleteOption zimbraPrefReadingPaneLocation
+        zimbraPrefReplyIncludeOriginalText zimbraPrefReplyToAddress
+        zimbraPrefReplyToDisplay zimbraPrefSentMailFolder zimbraPrefSkin
+        zimbraPrefSortOrder zimbraPrefTasksReadingPaneLocation
+        zimbraPrefTimeZoneId zimbraPrefWhenInFolderIds
+        zimbraPrefWhenSentToAddresses zimbraQuotaWarnMessage
+        zimbraReverseProxyClientCertMode zimbraServerHostname
+        zimbraServiceHostname zimbraSignatureId zimbraSignatureName
+        zimbraSkinLogoURL zimbraVirtualHostname
+        zimbraZimletAvailableZimlets
+    ''',
+
+}
+
+# {attribute name: attrs.xml type}
+ATTR_TYPES = {name: attr_type
+              for attr_type, names in _TABLE.items()
+              for name in names.split()}
+
+_converters = {name: CONVERTERS.get(attr_type, to_text)
+               for name, attr_type in ATTR_TYPES.items()}
+
+
+def register(attr_types):
+    """ Adds or overrides attribute types
+
+    :param attr_types: a dict of {attribute name: attrs.xml type}
+    """
+    ATTR_TYPES.update(attr_types)
+    _converters.update(
+        (name, CONVERTERS.get(attr_type, to_text))
+        for name, attr_type in attr_types.items())
+
+
+def parse_attrs_xml(source):
+    """
+    :param source: the path or a file object of an attrs.xml file
+    :returns: a dict of {attribute name: attrs.xml type}
+    """
+    return {attr.get('name'): attr.get('type')
+            for attr in ElementTree.parse(source).iter('attr')}
+
+
+def load_attrs_xml(source):
+    """ Registers the attribute types of an attrs.xml file, see
+    parse_attrs_xml()
+    """
+    register(parse_attrs_xml(source))
+
+
+def get_converter(name):
+    """
+    :returns: the function typing the values of that attribute,
+              utils.auto_type() if it is unknown
+    """
+    return _converters.get(name, utils.auto_type)
+
+
+def convert(name, value):
+    """ Types a value of the named attribute
+    """
+    return _converters.get(name, utils.auto_type)(value)
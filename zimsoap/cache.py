@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Caching of the directory objects fetched by the admin clients
+
+Admin getters (get_account(), get_domain()...) are called a lot, directly and
+before every modification to get the id of the object. A DirectoryCache
+keeps the fetched objects for a while, findable by any of their selectors
+(id, name, or an alias), so that they are fetched once:
+
+    cache = DirectoryCache(maxsize=10000, ttl=600)
+    zc = ZimbraAdminClient('zimbra.example.com', cache=cache)
+
+The client drops the cached objects it modifies, renames or deletes. Changes
+made by others are only seen once the cached object expires.
+"""
+
+from collections import OrderedDict
+import threading
+
+from zimsoap.utils import clock
+
+
+class DirectoryCache(object):
+    """ A thread-safe cache of ZObjects, dropping the objects older than `ttl`
+    seconds and the least recently used ones beyond `maxsize` objects.
+
+    Objects are cached by class and id, and are also found by their name and
+    aliases. The cached objects are given as is : do not modify them.
+
+    :param maxsize: the maximum number of objects
+    :param ttl: how long an object is kept, in seconds
+    """
+    # <a> tags of the other names of an object
+    ALIAS_ATTRS = ('zimbraMailAlias',)
+
+    def __init__(self, maxsize=1000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # {(class, id): (object, expiry, selector keys)}, the least recently
+        # used first
+        self._entries = OrderedDict()
+        # {(class, by, value): id}
+        self._ids = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _selector_key(cls, by, value):
+        # names are case-insensitive
+        return (cls, by, value.lower())
+
+    def _lookup(self, cls, zobj):
+        """ :returns: the (class, id) key of zobj, or None if unknown
+        """
+        selector = zobj.to_selector()
+        by, value = selector['by'], selector['_content']
+        if by == 'id':
+            return (cls, value)
+        zid = self._ids.get(self._selector_key(cls, by, value))
+        if zid is None:
+            return None
+        return (cls, zid)
+
+    def _remove(self, key):
+        obj, expiry, selector_keys = self._entries.pop(key)
+        for k in selector_keys:
+            if self._ids.get(k) == key[1]:
+                del self._ids[k]
+
+    def get(self, cls, zobj):
+        """ :param zobj: a ZObject with at least one selector (ex: name)
+            :returns: the cached object of class cls, or None
+        """
+        with self._lock:
+            key = self._lookup(cls, zobj)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if clock() >= entry[1]:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            # now the most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, cls, obj):
+        """ Caches an object, fetched as a cls, if it has an id
+        """
+        zid = getattr(obj, 'id', None)
+        if zid is None:
+            return
+
+        selector_keys = []
+        names = []
+        if getattr(obj, 'name', None) is not None:
+            names.append(obj.name)
+        for attr in self.ALIAS_ATTRS:
+            names.extend(obj.property_as_list(attr))
+        for name in names:
+            selector_keys.append(self._selector_key(cls, 'name', name))
+
+        key = (cls, zid)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (obj, clock() + self.ttl, selector_keys)
+            for k in selector_keys:
+                self._ids[k] = zid
+
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, cls, zobj):
+        """ Drops the cached object of class cls selected by zobj, if any
+        """
+        with self._lock:
+            key = self._lookup(cls, zobj)
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ids.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """ :returns: a dict of counters
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
@@ -9,20 +9,29 @@ for pre-authentification.
 """
 
 import datetime
+from multiprocessing.pool import ThreadPool
+import threading
+import weakref
 try:
-    from urllib2 import HTTPCookieProcessor, build_opener, HTTPError
+    from urllib2 import HTTPError
 except ImportError:
-    from urllib.request import HTTPCookieProcessor, build_opener, HTTPError
+    from urllib.error import HTTPError
 import time
 import re
 import warnings
 
-from six.moves import http_cookiejar, urllib
+from six.moves import http_cookies, urllib
 from six import text_type, binary_type
 import pythonzimbra
 import pythonzimbra.tools.auth
-from pythonzimbra.communication import Communication
 
+from zimsoap import attrtypes
+from zimsoap import cache as directory_cache
+from zimsoap import nameindex
+from zimsoap import singleflight
+from zimsoap import table
+from zimsoap import tokenpool
+from zimsoap import transport
 from zimsoap import utils
 from zimsoap import zobjects
 
@@ -30,6 +39,10 @@ from zimsoap import zobjects
 class RESTClient:
     """ Abstract Classe, RESTClient defines a REST client for some operations we
     can't do with SOAP API, such as admin preauth.
+
+    Requests are sent over the kept-alive connections of `pool_manager` (a
+    transport.PoolManager), so that a client can be reused for many
+    preauths.
     """
     class NoPreauthKeyProvided(Exception):
         pass
@@ -40,7 +53,8 @@ class RESTClient:
             self.msg = 'Zimbra issued HTTP error : '+e.msg
             Exception.__init__(self, self.msg)
 
-    def __init__(self, server_host, server_port=None, preauth_key=None):
+    def __init__(self, server_host, server_port=None, preauth_key=None,
+                 pool_manager=None):
         if server_port:
             self.preauth_url = 'https://{0}:{1}/service/preauth?'.format(
                 server_host, server_port)
@@ -49,51 +63,77 @@ class RESTClient:
                 server_host)
 
         self.set_preauth_key(preauth_key)
+        if pool_manager is None:
+            pool_manager = transport.PoolManager()
+        self.pool_manager = pool_manager
 
     def set_preauth_key(self, preauth_key):
         self.preauth_key = preauth_key
 
-    def get_preauth_token(self, account_name, expires=0):
-        if not self.preauth_key:
+    def get_preauth_token(self, account_name, expires=0, preauth_key=None):
+        """
+        :param preauth_key: the preauth key of the account domain, defaults
+                            to the one of the client
+        """
+        preauth_key = preauth_key or self.preauth_key
+        if not preauth_key:
             raise self.NoPreauthKeyProvided
 
+        # The token is set by the (redirect) response, not followed
+        url = self.get_preauth_url(account_name, expires, preauth_key)
+        status, reason, headers, body = self.pool_manager.urlopen('GET', url)
+        return self.parse_preauth_response(url, status, reason, headers)
+
+    def get_preauth_url(self, account_name, expires, preauth_key):
+        """
+        :param expires: the lifetime of the token, in seconds, 0 for the
+                        default one
+        :returns: the URL of a preauth request
+        """
         ts = int(time.time())*1000
+        # the signed value is the sent one, in milliseconds
+        expires = int(expires*1000)
 
-        preauth_str = utils.build_preauth_str(self.preauth_key, account_name,
+        preauth_str = utils.build_preauth_str(preauth_key, account_name,
                                               ts, expires, admin=self.isadmin)
 
         args = urllib.parse.urlencode({
             'account': account_name,
             'by': 'name',
             'timestamp': ts,
-            'expires': expires*1000,
+            'expires': expires,
             'admin': "1" if self.isadmin else "0",
             'preauth': preauth_str
         })
+        return self.preauth_url+args
 
-        cj = http_cookiejar.CookieJar()
-        browser = build_opener(HTTPCookieProcessor(cj))
+    def parse_preauth_response(self, url, status, reason, headers):
+        """ :returns: the token set by the response of a preauth request
+        """
+        if status >= 400:
+            raise self.RESTBackendError(
+                HTTPError(url, status, reason, headers, None))
 
         try:
-            url = browser.open(self.preauth_url+args)
-            url.read()
-            value = ""
-            for cookie in cj:
-                if cookie.name == self.TOKEN_COOKIE:
-                    value = cookie.value
-            url.close()
-            browser.close()
-            return value
-        except HTTPError as e:
-            raise self.RESTBackendError(e)
+            set_cookies = headers.get_all('Set-Cookie') or []
+        except AttributeError:
+            # python 2
+            set_cookies = headers.getheaders('Set-Cookie')
+        for set_cookie in set_cookies:
+            cookie = http_cookies.SimpleCookie(str(set_cookie))
+            if self.TOKEN_COOKIE in cookie:
+                return cookie[self.TOKEN_COOKIE].value
+        return ""
 
 
 class AdminRESTClient(RESTClient):
     TOKEN_COOKIE = 'ZM_ADMIN_AUTH_TOKEN'
 
-    def __init__(self, server_host, server_port=7071, preauth_key=None):
+    def __init__(self, server_host, server_port=7071, preauth_key=None,
+                 pool_manager=None):
         self.isadmin = True
-        RESTClient.__init__(self, server_host, server_port, preauth_key)
+        RESTClient.__init__(self, server_host, server_port, preauth_key,
+                            pool_manager)
 
 
 class AccountRESTClient(RESTClient):
@@ -139,11 +179,13 @@ class DomainHasNoPreAuthKey(ZimSOAPException):
 class ZimbraSoapServerError(ZimSOAPException):
     r_soap_text = re.compile(r'<soap:Text>(.*)</soap:Text>')
 
-    def __init__(self, request, response):
+    def __init__(self, request, response, fault=None):
         self.request = request
         self.response = response
 
-        fault = response.get_response()['Fault']
+        # fault is given for a request part of a BatchRequest
+        if fault is None:
+            fault = response.get_response()['Fault']
         self.msg = fault['Reason']['Text']
         self.code = fault['Detail']['Error']['Code']
         self.trace_url = fault['Detail']['Error']['Trace']
@@ -166,18 +208,383 @@ class ZimbraSoapUnexpectedResponse(ZimSOAPException):
             return 'Unexpected Response from Zimbra Server'
 
 
+# Faults telling that the auth token of the request was refused
+AUTH_FAULT_CODES = ('service.AUTH_EXPIRED', 'service.AUTH_REQUIRED')
+# Fault of the AuthRequest done by ZimbraAPISession.is_session_valid() when
+# the token is refused ; other requests return it for other reasons (ex:
+# ChangePasswordRequest with a wrong old password).
+AUTH_FAILED_CODE = 'account.AUTH_FAILED'
+
+# Requests the caller needs the answer of right away, they are never queued
+# in a batch (ex: the GetAccount done by _get_or_fetch_id() before a
+# ModifyAccount).
+READ_REQUEST_PREFIXES = ('Get', 'Search', 'Count', 'Check')
+IMMEDIATE_REQUESTS = ('Auth', 'DelegateAuth')
+
+
+def is_read_request(name):
+    """ Does a request only read data ?
+
+    :param name: ex: 'GetAccount' for a 'GetAccountRequest'
+    """
+    return name.startswith(READ_REQUEST_PREFIXES)
+
+
+class BatchItem(object):
+    """ A request queued in a Batch
+
+    Its outcome is available through result() once the batch is sent.
+    """
+    def __init__(self, name, content, namespace):
+        self.name = name
+        self.content = content
+        self.namespace = namespace
+        self.request_id = None
+        self.sent = False
+        self._response = None
+        self._error = None
+
+    def result(self):
+        """
+        :returns: the response dict, as request() would return it
+        :raises: the error the server returned for that request
+        """
+        if not self.sent:
+            raise ZimSOAPException(
+                '{0} is still queued, batch not sent yet'.format(self.name))
+        if self._error is not None:
+            raise self._error
+        return self._response
+
+    def __repr__(self):
+        return '<BatchItem {0}Request:{1}>'.format(
+            self.name, self.request_id)
+
+
+class Batch(object):
+    """ Queues the requests done through a client and sends them as
+    BatchRequests, see ZimbraAbstractClient.batch().
+
+    Client methods can also be called directly on the batch object.
+    """
+    def __init__(self, client, onerror='continue', max_size=100):
+        if onerror not in ('continue', 'stop'):
+            raise ValueError('onerror should be "continue" or "stop"')
+        self.client = client
+        self.onerror = onerror
+        self.max_size = max_size
+        self.items = []
+        self._pending = []
+        # (function, args) to call once the queued requests are sent
+        self._after_send = []
+
+    def __enter__(self):
+        if self.client._batch is not None:
+            raise ZimSOAPException('Batches cannot be nested')
+        self.client._batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.client._batch = None
+        if exc_type is None:
+            self.send()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def add(self, name, content, namespace):
+        """ Queues a request
+
+        :returns: a BatchItem
+        """
+        item = BatchItem(name, content, namespace)
+        self.items.append(item)
+        self._pending.append(item)
+        return item
+
+    def after_send(self, func, *args):
+        """ Calls func(*args) once the queued requests are sent (or failed),
+        ex: to drop from the caches the objects they modify.
+        """
+        self._after_send.append((func, args))
+
+    def send(self):
+        """ Sends the queued requests, max_size requests per BatchRequest
+        """
+        pending, self._pending = self._pending, []
+        after_send, self._after_send = self._after_send, []
+        try:
+            for i in range(0, len(pending), self.max_size):
+                self._send_chunk(pending[i:i+self.max_size])
+        finally:
+            for func, args in after_send:
+                func(*args)
+
+    def results(self):
+        """
+        :returns: a list, in queuing order, of response dicts or of the
+                  exceptions raised by the failed requests.
+        """
+        out = []
+        for item in self.items:
+            try:
+                out.append(item.result())
+            except ZimSOAPException as e:
+                out.append(e)
+        return out
+
+    def _send_chunk(self, items):
+        req, resp = self._build_chunk(items)
+        self.client._send(req, resp)
+        self._read_chunk(req, resp, items)
+
+    def _build_chunk(self, items):
+        """ :returns: a (request, response) pair, the BatchRequest of the
+                      items ready to be sent
+        """
+        client = self.client
+        req = client._new_request()
+        resp = client._new_response()
+        if client._session.is_logged_in():
+            req.set_auth_token(client._session.authToken)
+        req.enable_batch(self.onerror)
+
+        for item in items:
+            item.request_id = req.add_request(
+                item.name+'Request', dict(item.content), item.namespace)
+        return req, resp
+
+    def _read_chunk(self, req, resp, items):
+        """ Dispatches the BatchResponse to the items
+        """
+        by_id = {str(item.request_id): item for item in items}
+        body = resp.get_body()
+        session = self.client._session
+        if 'BatchResponse' not in body:
+            if 'Fault' in body:
+                error = ZimbraSoapServerError(req, resp)
+                session.note_fault(error.code)
+                raise error
+            raise ZimbraSoapUnexpectedResponse(
+                req, resp, 'Cannot find BatchResponse in response "{}"'.format(
+                    body))
+        session.note_success()
+
+        for tag, parts in body['BatchResponse'].items():
+            if not isinstance(parts, (dict, list)):
+                continue  # an attribute, like xmlns
+            for part in utils.as_list(parts):
+                part = resp._filter_response(part)
+                item = by_id.get(str(part.pop('requestId', None)))
+                if item is None:
+                    continue
+                item.sent = True
+                if tag == 'Fault':
+                    item._error = ZimbraSoapServerError(req, resp, part)
+                    session.note_fault(item._error.code)
+                elif tag != item.name+'Response':
+                    item._error = ZimbraSoapUnexpectedResponse(
+                        req, resp, 'Expecting {0}Response, got {1}'.format(
+                            item.name, tag))
+                else:
+                    item._response = part
+
+        for item in items:
+            if not item.sent:
+                # With onerror="stop", requests after the failed one
+                item.sent = True
+                item._error = ZimbraSoapUnexpectedResponse(
+                    req, resp, '{0}Request was not processed'.format(
+                        item.name))
+
+
 class ZimbraAbstractClient(object):
     """ Factorized abstract code for SOAP API access.
 
     Provides common ground for zimbraAdmin and zimbraAccount.
+
+    Connections to the server are kept alive and reused between requests.
+
+    Clients are thread-safe: several threads can send requests through the
+    same client, sharing its connections and its authentication token (see
+    also request_many()). Batches are per-thread.
+
+    :param pool_size: maximum number of idle connections kept per server
+    :param pool_manager: a transport.PoolManager, to share connections
+                         between several clients (pool_size is then ignored)
+    :param wire_format: 'xml' (default) or 'json', the format of SOAP
+                        messages on the wire. JSON is cheaper to build and
+                        parse, responses are the same dicts in both formats.
+    :param router: a routing.MailboxRouter ; once logged in as an account,
+                   the requests are sent straight to the mailbox server of
+                   that account, rather than through server_host.
+    :param rate_limiter: a ratelimit.RateLimiter, to throttle the requests
+                         (per server) and retry the ones refused by the
+                         server because of the load.
+    :param coalesce_reads: if True, identical read requests (Get*, Search*...)
+                           sent at the same time by several threads share a
+                           single call to the server.
+    :param compression: ask the server for compressed responses (ignored if
+                        a pool_manager is given, see PoolManager)
+    :param compress_min_size: gzip the requests of at least that size, in
+                              bytes (ignored if a pool_manager is given).
+                              The server must accept compressed requests.
+    :param identity_map: if True, the objects fetched several times (same
+                         class and id) are materialized once: the object
+                         still in use is updated in place and given back.
     """
-    def __init__(self, server_host, server_port, *args, **kwargs):
+    WIRE_FORMATS = ('xml', 'json')
+    POOL_MANAGER = transport.PoolManager
+    COMMUNICATION = transport.PooledCommunication
+    SINGLE_FLIGHT = singleflight.SingleFlight
+
+    def __init__(self, server_host, server_port, pool_size=10,
+                 pool_manager=None, wire_format='xml', router=None,
+                 rate_limiter=None, coalesce_reads=False, compression=True,
+                 compress_min_size=None, identity_map=False, *args,
+                 **kwargs):
+        if wire_format not in self.WIRE_FORMATS:
+            raise ValueError('wire_format should be one of {0}'.format(
+                self.WIRE_FORMATS))
+        self.wire_format = wire_format
+
         loc = 'https://%s:%s/%s' % (server_host, server_port, self.LOCATION)
-        self.com = Communication(loc)
+        if pool_manager is None:
+            pool_manager = self._new_pool_manager(
+                maxsize=pool_size, compression=compression,
+                compress_min_size=compress_min_size)
+        self.pool_manager = pool_manager
+        self.com = self.COMMUNICATION(loc, pool_manager)
         self._server_host = server_host
         self._server_port = server_port
-
-        self._session = ZimbraAPISession(self)
+        self.router = router
+        self.rate_limiter = rate_limiter
+        self.single_flight = None
+        if coalesce_reads:
+            self.single_flight = self.SINGLE_FLIGHT()
+        self.login_account = None
+        # {(class, id): ZObject}, holding the objects while they are in use
+        self.identity_map = None
+        if identity_map:
+            self.identity_map = weakref.WeakValueDictionary()
+            self._identity_lock = threading.Lock()
+
+        self._session = self._new_session()
+        self._local = threading.local()
+
+    def _new_pool_manager(self, **kwargs):
+        return self.POOL_MANAGER(**kwargs)
+
+    def _zobject(self, cls, d, partial=False):
+        """ Builds a ZObject from a response dict, see identity_map
+
+        :param partial: the dict holds only some of the attributes (ex: a
+                        Get* with attrs), merged into the known object
+                        rather than replacing its data
+        :returns: a cls object
+        """
+        obj = cls.from_dict(d)
+        if self.identity_map is None or d.get('id') is None:
+            return obj
+
+        key = (cls, d['id'])
+        with self._identity_lock:
+            known = self.identity_map.get(key)
+            if known is None:
+                self.identity_map[key] = obj
+                return obj
+        known._update_from(obj, merge=partial)
+        return known
+
+    def _new_session(self):
+        return ZimbraAPISession(self)
+
+    @property
+    def _batch(self):
+        """ The Batch being filled by the current thread, if any
+        """
+        return getattr(self._local, 'batch', None)
+
+    @_batch.setter
+    def _batch(self, batch):
+        self._local.batch = batch
+
+    def _new_request(self):
+        if self.wire_format == 'json':
+            return transport.RequestJson()
+        return pythonzimbra.request_xml.RequestXml()
+
+    def _new_response(self):
+        if self.wire_format == 'json':
+            return transport.ResponseJson()
+        return pythonzimbra.response_xml.ResponseXml()
+
+    def _send(self, req, resp):
+        if self.rate_limiter is None:
+            self.com.send_request(req, resp)
+        else:
+            pool = self.com.pool
+            self.rate_limiter.call(
+                (pool.host, pool.port), lambda: self._send_once(req, resp))
+
+    def _send_once(self, req, resp):
+        self.com.send_request(req, resp)
+        self._raise_if_unavailable(req, resp)
+
+    @staticmethod
+    def _raise_if_unavailable(req, resp):
+        # raised here rather than by the caller, so that it can be retried
+        if resp.is_fault() and (resp.get_fault_code() ==
+                                'service.TEMPORARILY_UNAVAILABLE'):
+            raise ZimbraSoapServerError(req, resp)
+
+    def _send_stream(self, req, resp):
+        """ Same as _send(), for a response to be parsed incrementally
+
+        :returns: an iterator over the elements of the response, or None if
+                  it is an error (fed to `resp`)
+        """
+        if self.rate_limiter is None:
+            return self.com.stream_response(req, resp)
+        pool = self.com.pool
+        return self.rate_limiter.call(
+            (pool.host, pool.port),
+            lambda: self._send_stream_once(req, resp))
+
+    def _send_stream_once(self, req, resp):
+        elements = self.com.stream_response(req, resp)
+        if elements is None:
+            self._raise_if_unavailable(req, resp)
+        return elements
+
+    def batch(self, onerror='continue', max_size=100):
+        """ Queues the requests done within a `with` block and sends them
+        at the end of the block, grouped in BatchRequests.
+
+            with zc.batch() as b:
+                for account in accounts:
+                    b.modify_account(account, {'displayName': 'foo'})
+                    b.add_account_alias(account, 'bar@example.com')
+            for res in b.results():
+                ...
+
+        Only the requests modifying data are queued : read requests (Get*,
+        Search*...) and authentication are still sent immediately, as their
+        response is usually needed by the calling method (ex: to fetch the
+        id of an object). The queued requests return a BatchItem rather than
+        their response, so only methods which do not use the response of
+        their request make sense within a batch.
+
+        Only the requests done from the thread which opened the batch are
+        queued.
+
+        :param onerror: 'continue' or 'stop' processing the batch when a
+                        request fails
+        :param max_size: maximum number of requests per BatchRequest
+        :returns: a Batch
+        """
+        return Batch(self, onerror, max_size)
 
     def request(self, name, content={}, namespace=None):
         """ Do a SOAP request and returns the result.
@@ -188,47 +595,101 @@ class ZimbraAbstractClient(object):
         :param namespace: (optional), the namespace, if different from the
                           client's
 
-        :returns: a dict with response
+        :returns: a dict with response, or a BatchItem if the request is
+                  queued in a batch (see batch()).
         """
         if not namespace:
             namespace = self.NAMESPACE
 
-        req_name = name+'Request'
-        resp_name = name+'Response'
-        req = pythonzimbra.request_xml.RequestXml()
-        resp = pythonzimbra.response_xml.ResponseXml()
+        if (self._batch is not None and not is_read_request(name) and
+                name not in IMMEDIATE_REQUESTS):
+            return self._batch.add(name, content, namespace)
+
+        if self.single_flight is not None and is_read_request(name):
+            return self.single_flight.do(
+                singleflight.request_key(name, content, namespace),
+                lambda: self._request(name, content, namespace))
+
+        return self._request(name, content, namespace)
+
+    def _request(self, name, content, namespace):
+        req, resp = self._build_request(name, content, namespace)
+        self._send(req, resp)
+        return self._extract_response(req, resp, name)
+
+    def request_many(self, requests, max_workers=10,
+                     return_exceptions=False):
+        """ Sends several requests in parallel, from a pool of threads
+        sharing the connections and authentication of the client.
+
+            counts = zc.request_many(
+                [('CountAccount', {'domain': d.to_selector()})
+                 for d in domains], max_workers=20)
+
+        Use a pool_size of at least max_workers to keep all the connections
+        alive. Requests sent this way are never queued in a batch.
+
+        :param requests: an iterable of (name, content) or
+                         (name, content, namespace) tuples
+        :param max_workers: number of requests in flight at the same time
+        :param return_exceptions: if True, the exception raised by a failed
+                                  request is returned in place of its
+                                  response, instead of being raised.
+        :returns: the list of responses, in the order of `requests`
+        """
+        requests = list(requests)
+        if not requests:
+            return []
+
+        def send(args):
+            try:
+                return self.request(*args)
+            except ZimSOAPException as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        pool = ThreadPool(min(max_workers, len(requests)))
+        try:
+            return pool.map(send, requests, chunksize=1)
+        finally:
+            pool.terminate()
+
+    def _build_request(self, name, content, namespace):
+        """
+        :returns: a (request, response) pair, the request ready to be sent
+        """
+        req = self._new_request()
+        resp = self._new_response()
 
         if self._session.is_logged_in():
             req.set_auth_token(self._session.authToken)
 
-        req.add_request(req_name, content, namespace)
-        try:
-            self.com.send_request(req, resp)
-        except HTTPError as e:
-            if resp:
-                raise ZimbraSoapServerError(e.req, e.resp)
-            else:
-                raise
+        # copy: JSON requests add their namespace to the dict
+        req.add_request(name+'Request', dict(content), namespace)
+        return req, resp
 
+    def _extract_response(self, req, resp, name):
+        """
+        :returns: the content of the <name>Response tag
+        """
+        resp_name = name+'Response'
         try:
             resp_content = resp.get_response()
-            return resp_content[resp_name]
+            content = resp_content[resp_name]
         except KeyError:
             if 'Fault' in resp_content:
-                raise ZimbraSoapServerError(req, resp)
+                error = ZimbraSoapServerError(req, resp)
+                self._session.note_fault(error.code)
+                raise error
             raise ZimbraSoapUnexpectedResponse(
                 req, resp, 'Cannot find {} in response "{}"'.format(
                     resp_name, resp.get_response()))
+        self._session.note_success()
+        return content
 
-        return resp_content
-
-    def request_single(self, name, content={}):
-        """ Simple wrapper arround request to extract a single response
-
-        :returns: the first tag in the response body
-        """
-        resp = self.request(name, content)
-
+    @staticmethod
+    def _unwrap_single(resp):
         # We stop on the first non-attribute (attributes are unicode/str)
         # If it's a list, we only return the first one.
 
@@ -240,13 +701,8 @@ class ZimbraAbstractClient(object):
 
         return None
 
-    def request_list(self, name, content={}):
-        """ Simple wrapper arround request to extract a list of response
-
-        :returns: the list of tags with same name or empty list
-        """
-        resp = self.request(name, content)
-
+    @staticmethod
+    def _unwrap_list(resp):
         # We stop on the first non-attribute (attributes are unicode/str)
         # If it's a list, we only return the first one.
 
@@ -258,13 +714,83 @@ class ZimbraAbstractClient(object):
 
         return []
 
+    def request_single(self, name, content={}):
+        """ Simple wrapper arround request to extract a single response
+
+        :returns: the first tag in the response body
+        """
+        return self._unwrap_single(self.request(name, content))
+
+    def request_list(self, name, content={}):
+        """ Simple wrapper arround request to extract a list of response
+
+        :returns: the list of tags with same name or empty list
+        """
+        return self._unwrap_list(self.request(name, content))
+
+    def _route(self, login):
+        """ Sends the next requests to the mailbox server of `login`,
+        if the client has a router.
+        """
+        self.login_account = login
+        if self.router is not None:
+            self.com = self.COMMUNICATION(
+                self.router.url(login, self.LOCATION, self._server_port),
+                self.pool_manager)
+
+    def iter_request(self, name, content={}, namespace=None):
+        """ Same as request_list(), but parses the response incrementally,
+        yielding each child tag of the response as soon as it is parsed.
+
+        Memory usage then stays flat, whatever the size of the response
+        (XML wire format only, JSON responses are parsed at once, as well as
+        the responses shared by a single_flight). Each child is a dict as in
+        a request_list() of several items.
+
+        :returns: an iterator over (tag name, dict) tuples
+        """
+        if not namespace:
+            namespace = self.NAMESPACE
+
+        if self.wire_format != 'xml' or self.single_flight is not None:
+            resp_content = self.request(name, content, namespace)
+            for tag, value in resp_content.items():
+                if isinstance(value, (dict, list)):
+                    for i in utils.as_list(value):
+                        yield tag, i
+            return
+
+        req, resp = self._build_request(name, content, namespace)
+        elements = self._send_stream(req, resp)
+        if elements is None:
+            # raises the error
+            self._extract_response(req, resp, name)
+            return
+        self._session.note_success()
+
+        resp_name = name+'Response'
+        for ancestors, tag, node in elements:
+            if ancestors[1] != 'Body':
+                # ex: the notifications of soap:Header/context
+                continue
+            if ancestors[2] != resp_name:
+                raise ZimbraSoapUnexpectedResponse(
+                    req, resp, 'Expecting {0}, got {1}'.format(
+                        resp_name, '/'.join(ancestors + (tag,))))
+            yield tag, node
+
     def login(self, user, password):
+        self._route(user)
         self._session.login(user, password)
 
     def login_with_authToken(self, authToken, lifetime=None):
+        """
+        :param lifetime: the lifetime of the token, in milliseconds, as given
+                         by the API
+        """
         self._session.import_session(authToken)
         if lifetime:
-            self._session.set_end_date(int(lifetime))
+            self._session.set_end_date(int(lifetime) / 1000.)
 
     def get_logged_in_by(self, login, parent_zc, duration=0):
         """Use another client to get logged in via preauth mechanism by an
@@ -273,45 +799,95 @@ class ZimbraAbstractClient(object):
         It required the domain of the admin user to have preAuthKey
         The preauth key cannot be created by API, do it with zmprov :
             zmprov gdpak <domain>
+
+        If parent_zc has a token pool, the token is taken from it.
+
+        :param duration: the lifetime of the token, in seconds
         """
-        domain_name = zobjects.Account(name=login).get_domain()
-        preauth_key = parent_zc.get_domain(domain_name)['zimbraPreAuthKey']
+        domain = zobjects.Account(name=login).get_domain()
+        rc = parent_zc.get_rest_preauth_client(
+            self.REST_PREAUTH, self._server_host)
 
-        rc = self.REST_PREAUTH(
-            self._server_host, parent_zc._server_port, preauth_key=preauth_key)
+        def fetch(expires):
+            preauth_key = parent_zc.get_preauth_key(domain)
+            return rc.get_preauth_token(
+                login, expires, preauth_key=preauth_key)
 
-        authToken = rc.get_preauth_token(login)
+        pool = parent_zc.token_pool
+        if pool is None:
+            authToken, left = fetch(duration), duration
+        else:
+            lifetime = duration or pool.preauth_lifetime
+            authToken, left = pool.get(
+                (self.REST_PREAUTH, self._server_host, login.lower(),
+                 duration),
+                lambda: (fetch(lifetime), lifetime))
 
-        self.login_with_authToken(authToken)
+        self._route(login)
+        # unknown without a duration, the default one of the server is used
+        self.login_with_authToken(authToken, int(left * 1000))
 
     def delegated_login(self, login, admin_zc, duration=0):
         """Use another client to get logged in via delegated_auth mechanism by an
         already logged in admin.
 
+        If admin_zc has a token pool, the token is taken from it.
+
         :param admin_zc: An already logged-in admin client
         :type admin_zc: ZimbraAdminClient
         :param login: the user login (or email) you want to log as
         """
+        authToken, lifetime = admin_zc.get_delegated_auth_token(
+            zobjects.Account(name=login), duration)
+        self._import_delegated_auth(
+            login, {'authToken': authToken, 'lifetime': lifetime})
+
+    @staticmethod
+    def _delegate_auth_content(login, duration=0):
         # a duration of zero is interpretted literaly by the API...
         selector = zobjects.Account(name=login).to_selector()
         delegate_args = {'account': selector}
         if duration:
-            delegate_args['duration': duration]
-        resp = admin_zc.request('DelegateAuth', delegate_args)
+            delegate_args['duration'] = duration
+        return delegate_args
 
+    def _import_delegated_auth(self, login, resp):
         lifetime = resp['lifetime']
         authToken = resp['authToken']
 
-        self.login_account = login
+        self._route(login)
         self.login_with_authToken(authToken, lifetime)
 
-    def is_session_valid(self):
+    def is_session_valid(self, force_check=False):
+        """ Tells if the session is still valid, asking the server (with an
+        AuthRequest) only if it was not used successfully for a while, or if
+        `force_check`.
+        """
         # some classes may need to overload it
-        return self._session.is_session_valid()
+        return self._session.is_session_valid(force_check=force_check)
 
     def get_host(self):
         return self._server_host
 
+    def get_transfer_stats(self):
+        """ Bytes sent and received, per request name
+
+        :returns: a dict indexed by request name ('GetAccountRequest'...),
+                  values are dicts with 'requests', 'request_bytes',
+                  'request_wire_bytes', 'response_bytes' and
+                  'response_wire_bytes' counters, wire sizes being the
+                  compressed ones.
+        """
+        return self.pool_manager.transfer_stats.as_dict()
+
+    def get_pool_stats(self):
+        """ Connection pool counters
+
+        :returns: a dict indexed by (host, port), values are dicts with
+                  'hits', 'new_connections' and 'idle_evictions' counters.
+        """
+        return self.pool_manager.stats()
+
 
 class ZimbraAccountClient(ZimbraAbstractClient):
     """ Specialized Soap client to access zimbraAccount webservice.
@@ -445,23 +1021,27 @@ class ZimbraAccountClient(ZimbraAbstractClient):
         """ Gets all the preferences of the current user
 
         :returns: a dict presenting the preferences by name, values are
-                 typed to str/bool/int/float regarding their content.
+                 typed to str/bool/int/float regarding their attribute type
+                 (see attrtypes), or their content if it is unknown.
         """
         pref_list = self.request('GetPrefs')['pref']
 
         out = {}
         for pref in pref_list:
-            out[pref['name']] = utils.auto_type(pref['_content'])
+            out[pref['name']] = attrtypes.convert(
+                pref['name'], pref['_content'])
 
         return out
 
     def get_preference(self, pref_name):
         """ Gets a single named preference
 
-        :returns: the value, typed to str/bool/int/float regarding its content.
+        :returns: the value, typed to str/bool/int/float regarding its
+                  attribute type (see attrtypes), or its content if it is
+                  unknown.
         """
         resp = self.request_single('GetPrefs', {'pref': {'name': pref_name}})
-        return utils.auto_type(resp['_content'])
+        return attrtypes.convert(pref_name, resp['_content'])
 
     def create_identity(self, name, attrs=[]):
         """ Create an Identity
@@ -594,16 +1174,67 @@ class ZimbraAdminClient(ZimbraAbstractClient):
 
     API ref is
     http://files.zimbra.com/docs/soap_api/8.0.4/soap-docs-804/api-reference/zimbraAdmin/service-summary.html
+
+    :param compact: if True, the listings and searches give compact objects
+                    (see zobjects.CompactZObject), for big inventories
+    :param cache: a cache.DirectoryCache, or True for a default one ; the
+                  objects fetched by the getters (get_account()...) are then
+                  cached, and dropped once modified by this client
+    :param name_index: a nameindex.NameIndex (or SQLiteNameIndex), or True
+                       for an in-memory one ; the ids of the fetched and
+                       listed objects are then kept by name, sparing the
+                       Get* requests done to learn the id of objects only
+                       known by name before modifying them
+    :param preauth_key_ttl: how long the preauth keys of the domains are
+                            kept, in seconds, see get_preauth_key()
+    :param token_pool: a tokenpool.TokenPool, or True for a default one ;
+                       the tokens of the delegated and preauth logins done
+                       through this client are then reused while valid
     """
     NAMESPACE = 'urn:zimbraAdmin'
     LOCATION = 'service/admin/soap'
     REST_PREAUTH = AdminRESTClient
 
-    def __init__(self, server_host, server_port='7071',
-                 *args, **kwargs):
+    # ZObject classes of the SearchDirectoryResponse tags
+    SEARCH_CLASSES = {
+        'account': zobjects.Account,
+        'domain': zobjects.Domain,
+        'dl': zobjects.DistributionList,
+        'cos': zobjects.COS,
+        'calresource': zobjects.CalendarResource,
+        # 'alias': TODO,
+    }
+
+    def __init__(self, server_host, server_port='7071', compact=False,
+                 cache=None, name_index=None, preauth_key_ttl=300,
+                 token_pool=None, *args, **kwargs):
         super(ZimbraAdminClient, self).__init__(
             server_host, server_port,
             *args, **kwargs)
+        self.compact = compact
+        if cache is True:
+            cache = directory_cache.DirectoryCache()
+        self.cache = cache
+        if name_index is True:
+            name_index = nameindex.NameIndex()
+        self.name_index = name_index
+        self.preauth_key_ttl = preauth_key_ttl
+        # {domain name: (key, expiry)}
+        self._preauth_keys = {}
+        # {(class, host): RESTClient}
+        self._rest_preauth_clients = {}
+        self._preauth_lock = threading.Lock()
+        if token_pool is True:
+            token_pool = tokenpool.TokenPool()
+        self.token_pool = token_pool
+
+    def _zobject_class(self, cls):
+        """
+        :returns: the class to build the listed objects of class cls
+        """
+        if self.compact:
+            return zobjects.COMPACT_CLASSES.get(cls, cls)
+        return cls
 
     def get_quota_usage(self, domain=None, all_servers=None,
                         limit=None, offset=None, sort_by=None,
@@ -662,11 +1293,63 @@ class ZimbraAdminClient(ZimbraAbstractClient):
             attr = attr[1::]
         return self.get_config(attr)
 
+    def _get_zobject(self, name, cls, zobj, attrs=None):
+        """ Fetches an object with a Get* request, or from the cache if
+        all its attributes are asked for.
+
+        :param name: the request name, ex: 'GetAccount'
+        :param zobj: a cls object, with a selector attribute set
+        :returns: a cls object
+        """
+        cached = attrs is None and self.cache is not None
+        if cached:
+            obj = self.cache.get(cls, zobj)
+            if obj is not None:
+                return obj
+
+        content = {cls.TAG_NAME: zobj.to_selector()}
+        if attrs is not None:
+            content['attrs'] = utils.attrs_param(attrs)
+        resp = self.request_single(name, content)
+        obj = self._zobject(cls, resp, partial=attrs is not None)
+        if cached:
+            self.cache.put(cls, obj)
+        return obj
+
+    def _zobject(self, cls, d, partial=False):
+        obj = super(ZimbraAdminClient, self)._zobject(cls, d, partial)
+        if self.name_index is not None:
+            zid = getattr(obj, 'id', None)
+            name = getattr(obj, 'name', None)
+            if zid is not None and name is not None:
+                self.name_index.put(cls.TAG_NAME, name, zid)
+        return obj
+
+    def _uncache(self, cls, zid, renamed=False):
+        """ Drops from the cache an object modified by a request
+
+        Within a batch, it is dropped again once the request is sent : the
+        object may be read (and cached) meanwhile, still unmodified.
+
+        :param renamed: if the object was renamed or deleted, its names are
+                        also dropped from the name index
+        """
+        if self._batch is not None:
+            self._batch.after_send(self._drop_cached, cls, zid, renamed)
+        self._drop_cached(cls, zid, renamed)
+
+    def _drop_cached(self, cls, zid, renamed):
+        if self.cache is not None:
+            self.cache.invalidate(cls, cls(id=zid))
+        if renamed and self.name_index is not None:
+            self.name_index.forget(cls.TAG_NAME, zid)
+
     def _get_or_fetch_id(self, zobj, fetch_func):
         """ Returns the ID of a Zobject wether it's already known or not
 
-        If zobj.id is not known (frequent if zobj is a selector), fetches first
-        the object and then returns its ID.
+        If zobj.id is not known (frequent if zobj is a selector), looks up its
+        name in the name index if any, or else fetches first the object and
+        then returns its ID.
 
         :type zobj:       a zobject subclass
         :type fetch_func: the function to fetch the zobj from server if its id
@@ -676,70 +1359,202 @@ class ZimbraAdminClient(ZimbraAbstractClient):
 
         try:
             return zobj.id
+        except AttributeError:
+            pass
+
+        name = getattr(zobj, 'name', None)
+        if self.name_index is not None and name is not None:
+            zid = self.name_index.get(zobj.TAG_NAME, name)
+            if zid is not None:
+                return zid
+
+        try:
+            return fetch_func(zobj).id
+        except AttributeError:
+            raise ValueError('Unqualified Resource')
+
+    def _get_or_fetch_name(self, zobj, fetch_func):
+        """ Same as _get_or_fetch_id(), for the name
+        """
+        try:
+            return zobj.name
         except AttributeError:
             try:
-                return fetch_func(zobj).id
+                return fetch_func(zobj).name
             except AttributeError:
                 raise ValueError('Unqualified Resource')
 
-    def get_all_domains(self):
-        resp = self.request_list('GetAllDomains')
-        return [zobjects.Domain.from_dict(d) for d in resp]
-
-    def get_all_accounts(self, domain=None, server=None,
-                         include_system_accounts=False,
-                         include_admin_accounts=True,
-                         include_virtual_accounts=True):
-        selectors = {}
+    def _iter_search(self, types, classes, attrs, domain=None, server=None):
+        """ Lists objects through SearchDirectory, fetching only some of
+        their attributes (the Get All* requests give them all).
+
+        :param types: the SearchDirectory types
+        :param classes: the ZObject classes, indexed by tag name
+        :param attrs: the attributes to fetch, see utils.attrs_param()
+        :param domain: a Domain, to list only its objects
+        :param server: a Server, to list only the objects hosted on it
+        """
+        return self._iter_zobjects(
+            'SearchDirectory',
+            self._search_content(types, attrs, domain, server), classes,
+            partial=True)
+
+    def _search_content(self, types, attrs, domain=None, server=None):
+        """ :returns: the content of a SearchDirectory request, see
+                      _iter_search()
+        """
+        # as GetAll*, no cap on the number of results (the server default
+        # one fails the search with account.TOO_MANY_SEARCH_RESULTS)
+        content = {'query': '', 'types': types, 'maxResults': 0,
+                   'attrs': utils.attrs_param(attrs)}
         if domain:
-            selectors['domain'] = domain.to_selector()
+            content['domain'] = self._get_or_fetch_name(
+                domain, self.get_domain)
         if server:
-            selectors['server'] = server.to_selector()
+            content['query'] = '(zimbraMailHost={0})'.format(
+                self._get_or_fetch_name(server, self.get_server))
+        return content
 
-        dict_accounts = self.request_list('GetAllAccounts', selectors)
+    def _iter_zobjects(self, name, content, classes, partial=False):
+        """ Streams a list response, see iter_request()
 
-        accounts = []
-        for i in dict_accounts:
-            account = zobjects.Account.from_dict(i)
+        :param classes: the ZObject classes, indexed by tag name ; other
+                        tags are skipped.
+        :param partial: see _zobject()
+        """
+        classes = {k: self._zobject_class(v) for k, v in classes.items()}
+        for tag, node in self.iter_request(name, content):
+            if tag in classes:
+                yield self._zobject(classes[tag], node, partial)
+
+    def get_all_domains(self, attrs=None):
+        """
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
+        """
+        return list(self.iter_all_domains(attrs))
 
+    def iter_all_domains(self, attrs=None):
+        """ Same as get_all_domains(), parsing the response incrementally
+        """
+        classes = {'domain': zobjects.Domain}
+        if attrs is not None:
+            return self._iter_search('domains', classes, attrs)
+        return self._iter_zobjects('GetAllDomains', {}, classes)
+
+    def get_all_accounts(self, domain=None, server=None,
+                         include_system_accounts=False,
+                         include_admin_accounts=True,
+                         include_virtual_accounts=True,
+                         attrs=None):
+        """
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string), the accounts are then listed
+                      with a SearchDirectory request
+        """
+        return list(self.iter_all_accounts(
+            domain, server, include_system_accounts, include_admin_accounts,
+            include_virtual_accounts, attrs))
+
+    def iter_all_accounts(self, domain=None, server=None,
+                          include_system_accounts=False,
+                          include_admin_accounts=True,
+                          include_virtual_accounts=True,
+                          attrs=None):
+        """ Same as get_all_accounts(), parsing the response incrementally
+        """
+        classes = {'account': zobjects.Account}
+        if attrs is not None:
+            # the ones needed for filtering
+            attrs = utils.attrs_param(attrs).split(',')
+            for include, attr in (
+                    (include_system_accounts, 'zimbraIsSystemAccount'),
+                    (include_admin_accounts, 'zimbraIsAdminAccount'),
+                    (include_virtual_accounts,
+                     'zimbraIsExternalVirtualAccount')):
+                if not include and attr not in attrs:
+                    attrs.append(attr)
+            accounts = self._iter_search(
+                'accounts', classes, attrs, domain, server)
+        else:
+            selectors = {}
+            if domain:
+                selectors['domain'] = domain.to_selector()
+            if server:
+                selectors['server'] = server.to_selector()
+            accounts = self._iter_zobjects(
+                'GetAllAccounts', selectors, classes)
+
+        for account in accounts:
             if not (
                 not include_system_accounts and account.is_system() or
                 not include_admin_accounts and account.is_admin() or
                 not include_virtual_accounts and account.is_virtual()
             ):
-                accounts.append(account)
-
+                yield account
+
+    def account_table(self, attrs, domain=None, server=None):
+        """ Lists accounts in a column-oriented table, for analytics over
+        many accounts, see table.AccountTable. The response is streamed into
+        the columns, without building ZObjects.
+
+        Unlike get_all_accounts(), system accounts are not skipped.
+
+        :param attrs: the attributes to fetch (list or comma-separated
+                      string)
+        :param domain: a Domain, to list only its accounts
+        :param server: a Server, to list only the accounts hosted on it
+        :returns: a table.AccountTable
+        """
+        attrs = utils.attrs_param(attrs).split(',')
+        accounts = table.AccountTable(attrs)
+        content = self._search_content('accounts', attrs, domain, server)
+        for tag, node in self.iter_request('SearchDirectory', content):
+            if tag == 'account':
+                accounts.append(node)
         return accounts
 
     # Calendar resources
 
-    def get_all_calendar_resources(self, domain=None, server=None,):
+    def get_all_calendar_resources(self, domain=None, server=None,
+                                   attrs=None):
+        """
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
+        """
+        return list(self.iter_all_calendar_resources(domain, server, attrs))
+
+    def iter_all_calendar_resources(self, domain=None, server=None,
+                                    attrs=None):
+        """ Same as get_all_calendar_resources(), parsing the response
+        incrementally
+        """
+        classes = {'calresource': zobjects.CalendarResource}
+        if attrs is not None:
+            return self._iter_search(
+                'resources', classes, attrs, domain, server)
+
         selectors = {}
         if domain:
             selectors['domain'] = domain.to_selector()
         if server:
             selectors['server'] = server.to_selector()
 
-        dict_calres = self.request_list('GetAllCalendarResources', selectors)
-
-        resources = []
-        for i in dict_calres:
-            calres = zobjects.CalendarResource.from_dict(i)
-            resources.append(calres)
-
-        return resources
+        return self._iter_zobjects(
+            'GetAllCalendarResources', selectors, classes)
 
-    def get_calendar_resource(self, cal_resource):
+    def get_calendar_resource(self, cal_resource, attrs=None):
         """ Fetches an calendar resource with all its attributes.
 
         :param account: a CalendarResource, with either id or
                         name attribute set.
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
         :returns: a CalendarResource object, filled.
         """
-        selector = cal_resource.to_selector()
-        resp = self.request_single('GetCalendarResource',
-                                   {'calresource': selector})
-        return zobjects.CalendarResource.from_dict(resp)
+        return self._get_zobject(
+            'GetCalendarResource', zobjects.CalendarResource, cal_resource,
+            attrs)
 
     def create_calendar_resource(self, name, password=None, attrs={}):
         """
@@ -756,10 +1571,9 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         return zobjects.CalendarResource.from_dict(resp)
 
     def delete_calendar_resource(self, calresource):
-        self.request('DeleteCalendarResource', {
-            'id': self._get_or_fetch_id(calresource,
-                                        self.get_calendar_resource),
-        })
+        zid = self._get_or_fetch_id(calresource, self.get_calendar_resource)
+        self.request('DeleteCalendarResource', {'id': zid})
+        self._uncache(zobjects.CalendarResource, zid, renamed=True)
 
     def modify_calendar_resource(self, calres, attrs):
         """
@@ -767,11 +1581,12 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param attrs:    a dictionary of attributes to set ({key:value,...})
         """
         attrs = [{'n': k, '_content': v} for k, v in attrs.items()]
+        zid = self._get_or_fetch_id(calres, self.get_calendar_resource)
         self.request('ModifyCalendarResource', {
-            'id': self._get_or_fetch_id(
-                calres, self.get_calendar_resource),
+            'id': zid,
             'a': attrs
         })
+        self._uncache(zobjects.CalendarResource, zid)
 
     def rename_calendar_resource(self, r_description, new_r_name):
         """
@@ -781,11 +1596,12 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param new_r_name: new name of the list
         :return: a zobjects.CalendarResource
         """
+        zid = self._get_or_fetch_id(r_description, self.get_calendar_resource)
         resp = self.request('RenameCalendarResource', {
-            'id': self._get_or_fetch_id(r_description,
-                                        self.get_calendar_resource),
+            'id': zid,
             'newName': new_r_name
         })
+        self._uncache(zobjects.CalendarResource, zid, renamed=True)
 
         return zobjects.CalendarResource.from_dict(resp['calresource'])
 
@@ -821,9 +1637,13 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         return list(ret)
 
     def get_all_mailboxes(self):
-        resp = self.request_list('GetAllMailboxes')
+        return list(self.iter_all_mailboxes())
 
-        return [zobjects.Mailbox.from_dict(i) for i in resp]
+    def iter_all_mailboxes(self):
+        """ Same as get_all_mailboxes(), parsing the response incrementally
+        """
+        return self._iter_zobjects(
+            'GetAllMailboxes', {}, {'mbox': zobjects.Mailbox})
 
     def get_account_mailbox(self, account_id):
         """ Returns a Mailbox corresponding to an account. Usefull to get the
@@ -860,9 +1680,9 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         return zobjects.Domain.from_dict(resp)
 
     def delete_domain(self, domain):
-        self.request('DeleteDomain', {
-            'id': self._get_or_fetch_id(domain, self.get_domain)
-        })
+        zid = self._get_or_fetch_id(domain, self.get_domain)
+        self.request('DeleteDomain', {'id': zid})
+        self._uncache(zobjects.Domain, zid, renamed=True)
 
     def delete_domain_forced(self, domain):
         # Remove aliases and accounts
@@ -892,14 +1712,21 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         for dl in dls:
             self.delete_distribution_list(dl)
 
-        self.request('DeleteDomain', {
-            'id': self._get_or_fetch_id(domain, self.get_domain)
-        })
+        self.delete_domain(domain)
 
-    def get_domain(self, domain):
-        selector = domain.to_selector()
-        resp = self.request_single('GetDomain', {'domain': selector})
-        return zobjects.Domain.from_dict(resp)
+    def get_domain(self, domain, attrs=None):
+        """
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
+        """
+        return self._get_zobject('GetDomain', zobjects.Domain, domain, attrs)
+
+    def get_server(self, server, attrs=None):
+        """
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
+        """
+        return self._get_zobject('GetServer', zobjects.Server, server, attrs)
 
     def modify_domain(self, domain, attrs):
         """
@@ -908,10 +1735,12 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :type attrs dict
         """
         attrs = [{'n': k, '_content': v} for k, v in attrs.items()]
+        zid = self._get_or_fetch_id(domain, self.get_domain)
         self.request('ModifyDomain', {
-            'id': self._get_or_fetch_id(domain, self.get_domain),
+            'id': zid,
             'a': attrs
         })
+        self._uncache(zobjects.Domain, zid)
 
     def add_distribution_list_alias(self, distribution_list, alias):
         """
@@ -920,12 +1749,13 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param alias:     email alias address
         :returns:         None (the API itself returns nothing)
         """
+        zid = self._get_or_fetch_id(
+            distribution_list, self.get_distribution_list)
         self.request('AddDistributionListAlias', {
-            'id': self._get_or_fetch_id(
-                distribution_list, self.get_distribution_list
-                ),
+            'id': zid,
             'alias': alias,
         })
+        self._uncache(zobjects.DistributionList, zid)
 
     def remove_distribution_list_alias(self, distribution_list, alias):
         """
@@ -934,34 +1764,50 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param alias:     email alias address
         :returns:         None (the API itself returns nothing)
         """
+        zid = self._get_or_fetch_id(
+            distribution_list, self.get_distribution_list)
         self.request('RemoveDistributionListAlias', {
-            'id': self._get_or_fetch_id(
-                distribution_list, self.get_distribution_list
-            ),
+            'id': zid,
             'alias': alias,
         })
+        self._uncache(zobjects.DistributionList, zid)
+
+    def get_all_distribution_lists(self, domain=None, attrs=None):
+        """
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
+        """
+        return list(self.iter_all_distribution_lists(domain, attrs))
+
+    def iter_all_distribution_lists(self, domain=None, attrs=None):
+        """ Same as get_all_distribution_lists(), parsing the response
+        incrementally
+        """
+        classes = {'dl': zobjects.DistributionList}
+        if attrs is not None:
+            return self._iter_search(
+                'distributionlists', classes, attrs, domain)
 
-    def get_all_distribution_lists(self, domain=None):
         if domain:
             selectors = {'domain': domain.to_selector()}
         else:
             selectors = {}
 
-        got = self.request_list('GetAllDistributionLists', selectors)
-        return [zobjects.DistributionList.from_dict(i) for i in got]
+        return self._iter_zobjects(
+            'GetAllDistributionLists', selectors, classes)
 
-    def get_distribution_list(self, dl_description):
+    def get_distribution_list(self, dl_description, attrs=None):
         """
         :param:   dl_description : a DistributionList specifying either :
                    - id:   the account_id
                    - name: the name of the list
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
         :returns: the DistributionList
         """
-        selector = dl_description.to_selector()
-
-        resp = self.request_single('GetDistributionList', {'dl': selector})
-        dl = zobjects.DistributionList.from_dict(resp)
-        return dl
+        return self._get_zobject(
+            'GetDistributionList', zobjects.DistributionList, dl_description,
+            attrs)
 
     def create_distribution_list(self, name, dynamic=0):
         """
@@ -983,11 +1829,13 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param attrs  : a dictionary of attributes to set ({key:value,...})
         """
         attrs = [{'n': k, '_content': v} for k, v in attrs.items()]
+        zid = self._get_or_fetch_id(dl_description,
+                                    self.get_distribution_list)
         self.request('ModifyDistributionList', {
-            'id': self._get_or_fetch_id(dl_description,
-                                        self.get_distribution_list),
+            'id': zid,
             'a': attrs
         })
+        self._uncache(zobjects.DistributionList, zid)
 
     def rename_distribution_list(self, dl_description, new_dl_name):
         """
@@ -997,18 +1845,20 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param new_dl_name: new name of the list
         :return: a zobjects.DistributionList
         """
+        zid = self._get_or_fetch_id(dl_description,
+                                    self.get_distribution_list)
         resp = self.request('RenameDistributionList', {
-            'id': self._get_or_fetch_id(dl_description,
-                                        self.get_distribution_list),
+            'id': zid,
             'newName': new_dl_name
         })
+        self._uncache(zobjects.DistributionList, zid, renamed=True)
 
         return zobjects.DistributionList.from_dict(resp['dl'])
 
     def delete_distribution_list(self, dl):
-        self.request('DeleteDistributionList', {
-            'id': self._get_or_fetch_id(dl, self.get_distribution_list)
-        })
+        zid = self._get_or_fetch_id(dl, self.get_distribution_list)
+        self.request('DeleteDistributionList', {'id': zid})
+        self._uncache(zobjects.DistributionList, zid, renamed=True)
 
     def add_distribution_list_member(self, distribution_list, members):
         """ Adds members to the distribution list
@@ -1018,11 +1868,13 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :type members:           list of str
         """
         members = [{'_content': v} for v in members]
+        zid = self._get_or_fetch_id(distribution_list,
+                                    self.get_distribution_list)
         resp = self.request_single('AddDistributionListMember', {
-            'id': self._get_or_fetch_id(distribution_list,
-                                        self.get_distribution_list),
+            'id': zid,
             'dlm': members
         })
+        self._uncache(zobjects.DistributionList, zid)
         return resp
 
     def remove_distribution_list_member(self, distribution_list, members):
@@ -1033,22 +1885,25 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :type members:           list of str
         """
         members = [{'_content': v} for v in members]
+        zid = self._get_or_fetch_id(distribution_list,
+                                    self.get_distribution_list)
         resp = self.request_single('RemoveDistributionListMember', {
-            'id': self._get_or_fetch_id(distribution_list,
-                                        self.get_distribution_list),
+            'id': zid,
             'dlm': members
         })
+        self._uncache(zobjects.DistributionList, zid)
         return resp
 
-    def get_account(self, account):
+    def get_account(self, account, attrs=None):
         """ Fetches an account with all its attributes.
 
         :param account: an account object, with either id or name attribute set
+        :param attrs: if set, fetch only those attributes (list or
+                      comma-separated string)
         :returns: a zobjects.Account object, filled.
         """
-        selector = account.to_selector()
-        resp = self.request_single('GetAccount', {'account': selector})
-        return zobjects.Account.from_dict(resp)
+        return self._get_zobject('GetAccount', zobjects.Account, account,
+                                 attrs)
 
     def rename_account(self, account, new_name):
         """ Rename an account.
@@ -1056,10 +1911,12 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param account: a zobjects.Account
         :param new_name: a string of new account name
         """
+        zid = self._get_or_fetch_id(account, self.get_account)
         self.request('RenameAccount', {
-            'id': self._get_or_fetch_id(account, self.get_account),
+            'id': zid,
             'newName': new_name
         })
+        self._uncache(zobjects.Account, zid, renamed=True)
 
     def modify_account(self, account, attrs):
         """
@@ -1067,10 +1924,12 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param attrs  : a dictionary of attributes to set ({key:value,...})
         """
         attrs = [{'n': k, '_content': v} for k, v in attrs.items()]
+        zid = self._get_or_fetch_id(account, self.get_account)
         self.request('ModifyAccount', {
-            'id': self._get_or_fetch_id(account, self.get_account),
+            'id': zid,
             'a': attrs
         })
+        self._uncache(zobjects.Account, zid)
 
     def set_password(self, account, password):
         """
@@ -1104,9 +1963,9 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         """
         :param account: an account object to be used as a selector
         """
-        self.request('DeleteAccount', {
-            'id': self._get_or_fetch_id(account, self.get_account),
-        })
+        zid = self._get_or_fetch_id(account, self.get_account)
+        self.request('DeleteAccount', {'id': zid})
+        self._uncache(zobjects.Account, zid, renamed=True)
 
     def add_account_alias(self, account, alias):
         """
@@ -1114,10 +1973,12 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param alias:     email alias address
         :returns:         None (the API itself returns nothing)
         """
+        zid = self._get_or_fetch_id(account, self.get_account)
         self.request('AddAccountAlias', {
-            'id': self._get_or_fetch_id(account, self.get_account),
+            'id': zid,
             'alias': alias,
         })
+        self._uncache(zobjects.Account, zid)
 
     def remove_account_alias(self, account, alias):
         """
@@ -1125,10 +1986,54 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param alias:     email alias address
         :returns:         None (the API itself returns nothing)
         """
+        zid = self._get_or_fetch_id(account, self.get_account)
         self.request('RemoveAccountAlias', {
-            'id': self._get_or_fetch_id(account, self.get_account),
+            'id': zid,
             'alias': alias,
         })
+        self._uncache(zobjects.Account, zid)
+
+    def get_preauth_key(self, domain):
+        """ The preauth key of a domain, fetched once per preauth_key_ttl
+        seconds (with only that attribute).
+
+        :param domain: a Domain, with its name set
+        :raises DomainHasNoPreAuthKey: if the domain has none
+        """
+        name = domain.name.lower()
+        with self._preauth_lock:
+            entry = self._preauth_keys.get(name)
+        now = utils.clock()
+        if entry is not None and now < entry[1]:
+            return entry[0]
+
+        try:
+            preauth_key = self.get_domain(
+                zobjects.Domain(name=name),
+                attrs=['zimbraPreAuthKey'])['zimbraPreAuthKey']
+        except KeyError:
+            raise DomainHasNoPreAuthKey(domain)
+        with self._preauth_lock:
+            self._preauth_keys[name] = (
+                preauth_key, now + self.preauth_key_ttl)
+        return preauth_key
+
+    def get_rest_preauth_client(self, cls, server_host):
+        """ A REST client to get preauth tokens from a server (on the port
+        of this client), shared by the calls and sharing the connections of
+        this client.
+
+        :param cls: the RESTClient subclass, ex: AccountRESTClient
+        """
+        key = (cls, server_host)
+        with self._preauth_lock:
+            try:
+                return self._rest_preauth_clients[key]
+            except KeyError:
+                rc = self._rest_preauth_clients[key] = cls(
+                    server_host, self._server_port,
+                    pool_manager=self.pool_manager)
+                return rc
 
     def mk_auth_token(self, account, admin=False, duration=0):
         """ Builds an authentification token, using preauth mechanism.
@@ -1141,11 +2046,7 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param account: an account object to be used as a selector
         :returns:       the auth string
         """
-        domain = account.get_domain()
-        try:
-            preauth_key = self.get_domain(domain)['zimbraPreAuthKey']
-        except KeyError:
-            raise DomainHasNoPreAuthKey(domain)
+        preauth_key = self.get_preauth_key(account.get_domain())
         timestamp = int(time.time())*1000
         expires = duration*1000
         return utils.build_preauth_str(preauth_key, account.name, timestamp,
@@ -1160,13 +2061,11 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         warnings.warn("delegate_auth() on parent client is deprecated,"
                       " use delegated_login() on child client instead",
                       DeprecationWarning)
-        selector = account.to_selector()
-        resp = self.request('DelegateAuth', {'account': selector})
-
-        lifetime = resp['lifetime']
-        authToken = resp['authToken']
+        authToken, lifetime = self.get_delegated_auth_token(account)
 
-        zc = ZimbraAccountClient(self._server_host)
+        zc = ZimbraAccountClient(self._server_host,
+                                 pool_manager=self.pool_manager,
+                                 wire_format=self.wire_format)
         zc.login_with_authToken(authToken, lifetime)
         return zc
 
@@ -1179,14 +2078,35 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         """
         if account is None:
             account = self.get_account(zobjects.Account(name=account_name))
-        selector = account.to_selector()
+        return self.get_delegated_auth_token(account)
 
-        resp = self.request('DelegateAuth', {'account': selector})
+    def get_delegated_auth_token(self, account, duration=0):
+        """ Gets a token to act as an account with a DelegateAuthRequest,
+        or from the token pool if any.
 
-        authToken = resp['authToken']
-        lifetime = int(resp['lifetime'])
+        :param account: an account object to be used as a selector
+        :param duration: the lifetime of the token, in seconds, defaults to
+                         the one of the server
+        :returns: a (token, lifetime) tuple, the lifetime (left) being in
+                  milliseconds, as in a DelegateAuthResponse
+        """
+        selector = account.to_selector()
+        content = {'account': selector}
+        if duration:
+            content['duration'] = duration
 
-        return authToken, lifetime
+        def fetch():
+            resp = self.request('DelegateAuth', content)
+            return resp['authToken'], int(resp['lifetime']) / 1000.
+
+        if self.token_pool is None:
+            authToken, lifetime = fetch()
+        else:
+            authToken, lifetime = self.token_pool.get(
+                ('DelegateAuth', self._server_host, selector['by'],
+                 selector['_content'].lower(), duration),
+                fetch)
+        return authToken, int(lifetime * 1000)
 
     def delegated_login(self, *args, **kwargs):
         raise NotImplementedError(
@@ -1218,32 +2138,42 @@ class ZimbraAdminClient(ZimbraAbstractClient):
         :param countOnly: Whether response should be count only. Default is
         0 (false)
         :param attrs: Comma-seperated list of attrs to return ("displayName",
-        "zimbraId", "zimbraAccountStatus")
+        "zimbraId", "zimbraAccountStatus"), or a list of them
         :return: dict of list of "account" "alias" "dl" "calresource" "domain"
         "cos"
         """
+        partial = 'attrs' in kwargs
+        if partial:
+            kwargs['attrs'] = utils.attrs_param(kwargs['attrs'])
 
         search_response = self.request('SearchDirectory', kwargs)
 
         result = {}
-        items = {
-            "account": zobjects.Account.from_dict,
-            "domain": zobjects.Domain.from_dict,
-            "dl": zobjects.DistributionList.from_dict,
-            "cos": zobjects.COS.from_dict,
-            "calresource": zobjects.CalendarResource.from_dict
-            # "alias": TODO,
-        }
+        items = {k: self._zobject_class(v)
+                 for k, v in self.SEARCH_CLASSES.items()}
 
-        for obj_type, func in items.items():
+        for obj_type, cls in items.items():
             if obj_type in search_response:
                 if isinstance(search_response[obj_type], list):
                     result[obj_type] = [
-                        func(v) for v in search_response[obj_type]]
+                        self._zobject(cls, v, partial)
+                        for v in search_response[obj_type]]
                 else:
-                    result[obj_type] = func(search_response[obj_type])
+                    result[obj_type] = self._zobject(
+                        cls, search_response[obj_type], partial)
         return result
 
+    def iter_search_directory(self, **kwargs):
+        """ Same as search_directory(), but parses the response
+        incrementally, yielding the found objects one by one, rather than
+        grouping them by type.
+        """
+        partial = 'attrs' in kwargs
+        if partial:
+            kwargs['attrs'] = utils.attrs_param(kwargs['attrs'])
+        return self._iter_zobjects(
+            'SearchDirectory', kwargs, self.SEARCH_CLASSES, partial)
+
 
 class ZimbraMailClient(ZimbraAbstractClient):
     """ Specialized Soap client to access zimbraMail webservice.
@@ -1275,15 +2205,15 @@ not {0}'.format(type(l)))
 
         return str_ids
 
-    def is_session_valid(self):
-        # zimbraMail do not have by itself an Auth request, so create a
-        # zimbraAccount client for that check.
-        zac = ZimbraAccountClient(self._server_host, self._server_port)
-        zac._session.import_session(self._session.authToken)
-        return zac.is_session_valid()
+    def is_session_valid(self, force_check=False):
+        # zimbraMail do not have by itself an Auth request, it is sent in the
+        # zimbraAccount namespace, as for login().
+        return self._session.is_session_valid(
+            'urn:zimbraAccount', force_check)
 
     def login(self, user, password):
         # !!! We need to authenticate with the 'urn:zimbraAccount' namespace
+        self._route(user)
         self._session.login(user, password, 'urn:zimbraAccount')
 
     # Permissions
@@ -2075,13 +3005,21 @@ class ZimbraAPISession:
     """Handle the login, the session expiration and the generation of the
        authentification header.
     """
+    # seconds during which a request the token was accepted for is trusted
+    # by is_session_valid(), rather than asking the server
+    validity_check_interval = 60
+
     def __init__(self, client):
         self.client = client
         self.authToken = None
+        # (token, clock()) of the last request the token was accepted for
+        self._last_success = None
+        # the last token refused by the server
+        self._rejected_token = None
 
     def set_end_date(self, lifetime):
         """Computes and store an absolute end_date session according to the
-        lifetime of the session"""
+        lifetime of the session (in seconds)"""
         self.end_date = (datetime.datetime.now() +
                          datetime.timedelta(0, lifetime))
 
@@ -2098,17 +3036,26 @@ class ZimbraAPISession:
             namespace = self.client.NAMESPACE
 
         data = self.client.request(
-            'Auth',
-            {
-                'account': zobjects.Account(name=username).to_selector(),
-                'password': {'_content': password}
-            },
-            namespace)
+            'Auth', self._auth_content(username, password), namespace)
+        self._import_auth(data)
+
+    @staticmethod
+    def _auth_content(username, password):
+        return {
+            'account': zobjects.Account(name=username).to_selector(),
+            'password': {'_content': password}
+        }
+
+    def _import_auth(self, data):
+        """ Stores the session from an AuthResponse content
+        """
         self.authToken = data['authToken']
+        # in milliseconds
         lifetime = int(data['lifetime'])
 
         self.authToken = str(self.authToken)
-        self.set_end_date(lifetime)
+        self.set_end_date(lifetime / 1000.)
+        self.note_success()
 
     def import_session(self, auth_token):
         if not isinstance(auth_token, (binary_type, text_type)):
@@ -2126,10 +3073,57 @@ class ZimbraAPISession:
         except AttributeError:
             return True
 
-    def is_session_valid(self):
+    def note_success(self):
+        """ Records that the token was just accepted by the server
+        """
+        if self.authToken:
+            self._last_success = (self.authToken, utils.clock())
+
+    def note_fault(self, code, validity_check=False):
+        """ Records a fault returned by the server, the token being refused
+        if it is an authentication one.
+
+        :param validity_check: the fault answers the AuthRequest done by
+                               is_session_valid()
+        """
+        if code in AUTH_FAULT_CODES or (
+                validity_check and code == AUTH_FAILED_CODE):
+            self._rejected_token = self.authToken
+            self._last_success = None
+
+    def _known_validity(self):
+        """ :returns: True or False if the validity of the session can be
+                      told without asking the server, None otherwise
+        """
+        if not self.is_logged_in() or self.authToken == self._rejected_token:
+            return False
+        if self._last_success is not None:
+            token, date = self._last_success
+            age = utils.clock() - date
+            if (token == self.authToken and
+                    age < self.validity_check_interval):
+                return True
+        return None
+
+    def _validity_check_content(self):
+        return {'authToken': {'_content': self.authToken}}
+
+    def is_session_valid(self, namespace=None, force_check=False):
+        """ Tells if the session is still valid, from its expiry date and the
+        last request done with it ; the server is only asked (with an
+        AuthRequest) when this is not enough, or if `force_check`.
+
+        :param namespace: the namespace of the AuthRequest, if the client
+                          one is not suitable for authentication
+        """
+        if not force_check:
+            valid = self._known_validity()
+            if valid is not None:
+                return valid
         try:
-            self.client.request('Auth',
-                                {'authToken': {'_content': self.authToken}})
+            self.client.request(
+                'Auth', self._validity_check_content(), namespace)
             return True
-        except ZimbraSoapServerError:
+        except ZimbraSoapServerError as e:
+            self.note_fault(e.code, validity_check=True)
             return False
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Name to id indexes of the directory objects
+
+Most admin requests modifying an object take its id, when scripts mostly
+know objects by name : the admin client then first fetches the object, only
+to learn its id. A name index remembers the ids of the objects seen in the
+responses (fetched or listed), so that they can be used right away:
+
+    zc = ZimbraAdminClient('zimbra.example.com',
+                           name_index=SQLiteNameIndex('ids.sqlite'))
+    zc.get_all_accounts()
+    zc.modify_account(Account(name='foo@example.com'), {...})  # no GetAccount
+
+The index is kept up to date with the renames and deletions done through the
+client ; if an object is renamed or deleted by someone else, its old id is
+used, and the server answers a NO_SUCH_* fault.
+"""
+
+import sqlite3
+import threading
+
+
+class NameIndex(object):
+    """ An in-memory index of ids, by kind of object (the ZObject TAG_NAME,
+    ex: 'account') and name. Thread-safe.
+    """
+    def __init__(self):
+        # {(kind, name): id}
+        self._ids = {}
+        # {(kind, id): set of (kind, name)}
+        self._names = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(kind, name):
+        # names are case-insensitive
+        return (kind, name.lower())
+
+    def get(self, kind, name):
+        """ :returns: the id of the object, or None if unknown
+        """
+        with self._lock:
+            zid = self._ids.get(self._key(kind, name))
+            if zid is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return zid
+
+    def put(self, kind, name, zid):
+        key = self._key(kind, name)
+        with self._lock:
+            previous = self._ids.get(key)
+            if previous != zid:
+                if previous is not None:
+                    self._names[(kind, previous)].discard(key)
+                self._ids[key] = zid
+                self._names.setdefault((kind, zid), set()).add(key)
+
+    def forget(self, kind, zid):
+        """ Drops the names of an object, given its id
+        """
+        with self._lock:
+            for key in self._names.pop((kind, zid), ()):
+                del self._ids[key]
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def stats(self):
+        """ :returns: a dict of counters
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self)}
+
+
+class SQLiteNameIndex(NameIndex):
+    """ A NameIndex kept in a SQLite database file, to be reused by later
+    runs.
+
+    Writes are committed by batches of `commit_every`, and on flush() and
+    close().
+
+    :param path: the database file, created if needed
+    """
+    def __init__(self, path, commit_every=1000):
+        super(SQLiteNameIndex, self).__init__()
+        self.commit_every = commit_every
+        self._pending = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS ids ('
+            'kind TEXT NOT NULL, name TEXT NOT NULL, id TEXT NOT NULL, '
+            'PRIMARY KEY (kind, name))')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS ids_by_id ON ids (id)')
+        self._db.commit()
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._db.commit()
+            self._pending = 0
+
+    def get(self, kind, name):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id FROM ids WHERE kind = ? AND name = ?',
+                self._key(kind, name)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, kind, name, zid):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO ids (kind, name, id) '
+                'VALUES (?, ?, ?)', self._key(kind, name) + (zid,))
+            self._written()
+
+    def forget(self, kind, zid):
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM ids WHERE kind = ? AND id = ?', (kind, zid))
+            self._written()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM ids')
+            self._db.commit()
+            self._pending = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM ids').fetchone()[0]
+
+    def stats(self):
+        size = len(self)
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+    def flush(self):
+        """ Commits the pending writes
+        """
+        with self._lock:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        self._db.close()
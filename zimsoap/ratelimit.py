@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Client-side throttling, to stay below the DoSFilter of zimbra servers
+
+Zimbra answers 503 (or a service.TEMPORARILY_UNAVAILABLE fault) to clients
+sending too many requests, and then makes them wait. A RateLimiter keeps the
+requests rate and the number of requests in flight of each server under
+limits, adapting them to the server : limits are cut when the server
+throttles the client (multiplicative decrease), and slowly raised back while
+it does not (additive increase). Throttled requests are retried after a
+random backoff.
+"""
+
+import random
+import threading
+import time
+
+from zimsoap.utils import clock
+
+# HTTP status or fault codes of a request refused because of the load
+THROTTLING_CODES = (503, 'service.TEMPORARILY_UNAVAILABLE')
+
+
+def is_throttling_error(e):
+    """ Tells if an exception (HTTPError or ZimbraSoapServerError) means the
+    server refused the request because of the load.
+    """
+    return getattr(e, 'code', None) in THROTTLING_CODES
+
+
+class HostLimiter(object):
+    """ Limits and counters for a single server, see RateLimiter
+    """
+    def __init__(self, rate, max_in_flight, min_rate, increase, decrease,
+                 burst):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.max_max_in_flight = max_in_flight
+        self.max_in_flight = float(max_in_flight)
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+
+        self.in_flight = 0
+        self.throttled = 0
+        self.tokens = burst
+        self._last_fill = clock()
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+        # functions to call once a slot is freed, see try_acquire()
+        self._waiters = []
+
+    def _take_slot(self):
+        """ Takes a slot if there is a free one, self._cond being held
+
+        :returns: a (time the request is allowed, seconds to wait before
+                  sending it) tuple, or None
+        """
+        if self.in_flight >= int(self.max_in_flight):
+            return None
+        self.in_flight += 1
+
+        now = clock()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self._last_fill) * self.rate)
+        self._last_fill = now
+        # a negative balance books the next tokens
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        return now + wait, wait
+
+    def acquire(self):
+        """ Blocks until a request can be sent
+
+        :returns: the time the request was allowed
+        """
+        with self._cond:
+            slot = self._take_slot()
+            while slot is None:
+                self._cond.wait()
+                slot = self._take_slot()
+
+        started, wait = slot
+        if wait:
+            time.sleep(wait)
+        return started
+
+    def try_acquire(self, waiter):
+        """ Same as acquire(), without blocking (ex: for asyncio)
+
+        :param waiter: if there is no free slot, it is called (once, from
+                       the thread releasing a slot) when one is freed
+        :returns: a (time the request is allowed, seconds to wait before
+                  sending it) tuple, or None if there is no free slot
+        """
+        with self._cond:
+            slot = self._take_slot()
+            if slot is None:
+                self._waiters.append(waiter)
+            return slot
+
+    def release(self, started, throttled=False):
+        """ Frees the slot of a request, adapting the limits
+
+        :param started: the value returned by acquire() for that request
+        :param throttled: if the server refused the request because of the
+                          load
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                # only once for all the requests sent at the old rate
+                if started >= self._last_decrease:
+                    self._last_decrease = clock()
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.max_in_flight = max(
+                        1, self.max_in_flight * self.decrease)
+            else:
+                self.rate = min(
+                    self.max_rate, self.rate + self.increase / self.rate)
+                self.max_in_flight = min(
+                    self.max_max_in_flight,
+                    self.max_in_flight + 1. / self.max_in_flight)
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter()
+
+    def as_dict(self):
+        with self._cond:
+            return {
+                'rate': self.rate,
+                'max_in_flight': int(self.max_in_flight),
+                'in_flight': self.in_flight,
+                'throttled': self.throttled,
+            }
+
+
+class RateLimiter(object):
+    """ Adaptive per-server rate and concurrency limits
+
+    Can be shared between several clients, to share the limits of a server.
+
+        limiter = RateLimiter(rate=50, max_in_flight=8)
+        zc = ZimbraAdminClient('zimbra.example.com', rate_limiter=limiter)
+
+    :param rate: maximum requests per second, per server
+    :param max_in_flight: maximum requests in flight, per server
+    :param min_rate: the rate is never cut below that
+    :param increase: requests per second added to the rate, roughly every
+                     second without throttling
+    :param decrease: factor applied to the limits when throttled
+    :param burst: requests which may be sent at once after an idle period
+    :param retries: how many times a throttled request is retried
+    :param backoff: base delay (seconds) before retrying, doubled on every
+                    attempt, a random part of it is actually waited
+    :param max_backoff: maximum delay before retrying
+    """
+    def __init__(self, rate=50, max_in_flight=10, min_rate=1, increase=1,
+                 decrease=0.5, burst=1, retries=3, backoff=0.5,
+                 max_backoff=30):
+        self.rate = rate
+        self.max_in_flight = max_in_flight
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host_limiter(self, host):
+        with self._lock:
+            try:
+                return self._hosts[host]
+            except KeyError:
+                limiter = HostLimiter(
+                    self.rate, self.max_in_flight, self.min_rate,
+                    self.increase, self.decrease, self.burst)
+                self._hosts[host] = limiter
+                return limiter
+
+    def backoff_delay(self, attempt):
+        """
+        :returns: the delay before the attempt-th retry (full jitter)
+        """
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, host, func):
+        """ Calls `func` within the limits of `host`, retrying it if it
+        raises a throttling error (see is_throttling_error()).
+
+        :returns: what func returns
+        """
+        limiter = self.host_limiter(host)
+        attempt = 0
+        while True:
+            started = limiter.acquire()
+            try:
+                ret = func()
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                limiter.release(started, throttled)
+                if not throttled or attempt >= self.retries:
+                    raise
+            except BaseException:
+                limiter.release(started)
+                raise
+            else:
+                limiter.release(started)
+                return ret
+
+            time.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    def stats(self):
+        """
+        :returns: a dict of current limits and counters dicts, indexed by
+                  server
+        """
+        with self._lock:
+            hosts = list(self._hosts.items())
+        return {host: limiter.as_dict() for host, limiter in hosts}
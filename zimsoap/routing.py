@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Routing of account requests to the mailbox server of the account
+
+In a multi-server setup, the requests sent to the proxy for an account are
+forwarded to the mailbox server (zimbraMailHost) of the account. A
+MailboxRouter finds out that server, so that the clients can talk to it
+directly.
+"""
+
+import threading
+
+from zimsoap import zobjects
+
+
+class MailboxRouter(object):
+    """ Resolves and caches the mailbox server of accounts
+
+        router = MailboxRouter(admin_zc, port=8443)
+        zc = ZimbraMailClient('proxy.example.com', router=router)
+        zc.login('user@example.com', 'secret')  # talks to its mailbox server
+
+    :param admin_client: a logged-in ZimbraAdminClient, used to lookup the
+                         zimbraMailHost of the accounts
+    :param port: the port of the mailbox servers, defaults to the port of
+                 the routed client
+    :param scheme: 'https' or 'http'
+    """
+    def __init__(self, admin_client, port=None, scheme='https'):
+        self.admin_client = admin_client
+        self.port = port
+        self.scheme = scheme
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def get_mail_host(self, account_name):
+        """ Fetched once per account, then served from the cache
+
+        :returns: the zimbraMailHost of the account
+        """
+        with self._lock:
+            try:
+                return self._hosts[account_name]
+            except KeyError:
+                pass
+
+        account = self.admin_client.get_account(
+            zobjects.Account(name=account_name), attrs=['zimbraMailHost'])
+        host = account['zimbraMailHost']
+
+        with self._lock:
+            self._hosts[account_name] = host
+        return host
+
+    def forget(self, account_name=None):
+        """ Drops the cached mailbox server of an account (ex: after a
+        mailbox move), or of all accounts.
+        """
+        with self._lock:
+            if account_name is None:
+                self._hosts.clear()
+            else:
+                self._hosts.pop(account_name, None)
+
+    def url(self, account_name, location, default_port):
+        """
+        :returns: the URL of `location` on the account mailbox server
+        """
+        return '{0}://{1}:{2}/{3}'.format(
+            self.scheme, self.get_mail_host(account_name),
+            self.port or default_port, location)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Coalescing of identical concurrent calls
+
+When several threads ask for the same thing at the same time (ex: the same
+GetDomainRequest), only the first one actually does the call, the others
+wait for it and share its result.
+"""
+
+import copy
+import json
+import threading
+
+
+def request_key(name, content, namespace):
+    """
+    :returns: a hashable key, equal for requests having the same name,
+              namespace and content (whatever the order of the dict keys)
+    """
+    return (namespace, name,
+            json.dumps(content, sort_keys=True, default=repr))
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ Shares the result of a call between the callers asking for the same
+    key while it is in flight.
+
+    The first caller gets the result itself, the others get a deep copy of
+    it (or the same exception raised).
+
+    - calls: calls actually done
+    - shared: calls avoided by sharing the result of an in-flight one
+    """
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        :returns: the result of func(), or of the in-flight call for key
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.calls += 1
+            else:
+                leader = False
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared}
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Snapshot files of ZObjects, see zobjects.dump_snapshot() and
+zobjects.load_snapshot()
+
+A snapshot keeps, for each object, its class, its text attributes, its lists
+of text attributes (ex: the members of a distribution list) and its <a> tags,
+the typed values being kept as on the wire. Every distinct string is stored
+once, in a string table, and objects only refer to them by index, in columns
+(arrays of uint32) :
+
+  - the magic, the format version and the length of the header (JSON)
+  - the header : number of objects, class names and sections locations
+  - the sections, 8-bytes aligned, little-endian :
+      - strings : the UTF-8 strings, and their offsets
+      - classes : the class index of each object
+      - for the attributes, lists and <a> tags : the offsets of the pairs of
+        each object, and the names and values (string indexes) of the pairs
+
+Loaded lazily, the file is memory-mapped and the objects are built from the
+columns at each access, strings being decoded once.
+"""
+
+import array
+import json
+import mmap
+import struct
+import sys
+
+from six import string_types, text_type
+
+MAGIC = b'ZSNP'
+VERSION = 1
+# magic, version, header length
+PREAMBLE = struct.Struct('<4sHI')
+
+UINT32 = 'I' if array.array('I').itemsize == 4 else 'L'
+# Pairs of each object : XML attributes, lists, <a> tags
+GROUPS = ('attrs', 'lists', 'a')
+# The string index of None (an <a> tag without value)
+NONE = 0
+
+
+def _to_bytes(arr):
+    if sys.byteorder != 'little':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    try:
+        return arr.tobytes()
+    except AttributeError:
+        # python 2
+        return arr.tostring()
+
+
+def _object_pairs(obj):
+    """ :returns: the (attrs, lists, a) pairs of an object, as lists of
+              (name, value) tuples, text only
+    """
+    attrs = []
+    lists = []
+    names = []
+    for cls in type(obj).__mro__:
+        names.extend(cls.__dict__.get('__slots__', ()))
+    names.extend(getattr(obj, '__dict__', ()))
+
+    for k in names:
+        if k.startswith('_') or not hasattr(obj, k):
+            continue
+        v = getattr(obj, k)
+        if isinstance(v, string_types):
+            attrs.append((k, v))
+        elif isinstance(v, (list, tuple)):
+            lists.extend((k, i) for i in v if isinstance(i, string_types))
+
+    a = []
+    for k, v in obj._get_untyped_a_tags().items():
+        if isinstance(v, list):
+            a.extend((k, i) for i in v)
+        else:
+            a.append((k, v))
+    return attrs, lists, a
+
+
+def dump(objs, path, classes):
+    """ Writes the objects to a snapshot file
+
+    :param classes: the classes which can be snapshotted, by name
+    :raises ValueError: if an object is of another class
+    """
+    strings = {None: NONE}
+    string_list = [None]
+
+    def index(s):
+        try:
+            return strings[s]
+        except KeyError:
+            i = strings[s] = len(string_list)
+            string_list.append(s)
+            return i
+
+    class_names = []
+    class_indexes = {}
+    object_classes = array.array(UINT32)
+    columns = {}
+    for group in GROUPS:
+        columns[group] = (array.array(UINT32, [0]), array.array(UINT32),
+                          array.array(UINT32))
+
+    for obj in objs:
+        name = type(obj).__name__
+        if classes.get(name) is not type(obj):
+            raise ValueError('Cannot snapshot a {0}'.format(type(obj)))
+        if name not in class_indexes:
+            class_indexes[name] = len(class_names)
+            class_names.append(name)
+        object_classes.append(class_indexes[name])
+
+        for group, pairs in zip(GROUPS, _object_pairs(obj)):
+            offsets, keys, values = columns[group]
+            for k, v in pairs:
+                keys.append(index(k))
+                values.append(index(v))
+            offsets.append(len(keys))
+
+    blob = bytearray()
+    string_offsets = array.array(UINT32, [0])
+    for s in string_list[1:]:
+        blob.extend(text_type(s).encode('utf-8'))
+        string_offsets.append(len(blob))
+
+    sections = [('strings', bytes(blob)),
+                ('string_offsets', _to_bytes(string_offsets)),
+                ('classes', _to_bytes(object_classes))]
+    for group in GROUPS:
+        for suffix, arr in zip(('offsets', 'keys', 'values'),
+                               columns[group]):
+            sections.append(('{0}_{1}'.format(group, suffix),
+                             _to_bytes(arr)))
+
+    # sections offsets are relative to the end of the header
+    locations = {}
+    position = 0
+    for name, data in sections:
+        locations[name] = (position, len(data))
+        position += len(data) + (-len(data) % 8)
+
+    header = {
+        'count': len(object_classes),
+        'classes': class_names,
+        'sections': locations,
+    }
+    header = json.dumps(header, sort_keys=True).encode('utf-8')
+    # so that the sections are aligned too
+    header += b' ' * (-(PREAMBLE.size + len(header)) % 8)
+
+    with open(path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for name, data in sections:
+            f.write(data)
+            f.write(b'\0' * (-len(data) % 8))
+
+
+class Snapshot(object):
+    """ The objects of a snapshot, as a read-only sequence, see load()
+
+    Objects are built at each access, and not kept. Close the snapshot (or
+    use it as a context manager) to release the file.
+    """
+    def __init__(self, buf, classes):
+        """ :param buf: the content of the file, bytes or mmap
+            :param classes: the classes by name
+        """
+        self._buf = buf
+        self._views = []
+        try:
+            magic, version, header_length = PREAMBLE.unpack_from(buf, 0)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC:
+            raise ValueError('Not a zimsoap snapshot')
+        if version != VERSION:
+            raise ValueError(
+                'Unsupported snapshot version: {0}'.format(version))
+
+        start = PREAMBLE.size
+        header = json.loads(
+            bytes(buf[start:start + header_length]).decode('utf-8'))
+        start += header_length
+
+        self._count = header['count']
+        try:
+            self._classes = [classes[name] for name in header['classes']]
+        except KeyError as e:
+            raise ValueError('Unknown class in snapshot: {0}'.format(e))
+
+        sections = {}
+        for name, (offset, length) in header['sections'].items():
+            typecode = 'B' if name == 'strings' else UINT32
+            sections[name] = self._section(
+                typecode, start + offset, length)
+        self._sections = sections
+        self._strings = [None] * len(sections['string_offsets'])
+
+    def _section(self, typecode, start, length):
+        view = memoryview(self._buf)[start:start + length]
+        if typecode == 'B':
+            self._views.append(view)
+            return view
+        if hasattr(view, 'cast') and sys.byteorder == 'little':
+            # no copy
+            view = view.cast(typecode)
+            self._views.append(view)
+            return view
+        arr = array.array(typecode)
+        try:
+            arr.frombytes(view.tobytes())
+        except AttributeError:
+            # python 2
+            arr.fromstring(view.tobytes())
+        if sys.byteorder != 'little':
+            arr.byteswap()
+        return arr
+
+    def _string(self, i):
+        """ Decodes the string of index i, once
+        """
+        s = self._strings[i]
+        if s is None and i != NONE:
+            offsets = self._sections['string_offsets']
+            s = self._strings[i] = self._sections['strings'][
+                offsets[i - 1]:offsets[i]].tobytes().decode('utf-8')
+        return s
+
+    def _pairs(self, group, i):
+        offsets = self._sections[group + '_offsets']
+        keys = self._sections[group + '_keys']
+        values = self._sections[group + '_values']
+        string = self._string
+        return [(string(keys[j]), string(values[j]))
+                for j in range(offsets[i], offsets[i + 1])]
+
+    def _build(self, i):
+        cls = self._classes[self._sections['classes'][i]]
+        d = dict(self._pairs('attrs', i))
+        a = self._pairs('a', i)
+        if a:
+            d['a'] = [{cls.ATTRNAME_PROPERTY: k, '_content': v}
+                      for k, v in a]
+        obj = cls.from_dict(d)
+
+        lists = {}
+        for k, v in self._pairs('lists', i):
+            lists.setdefault(k, []).append(v)
+        for k, v in lists.items():
+            setattr(obj, k, v)
+        return obj
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._build(j) for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError('snapshot index out of range')
+        return self._build(i)
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._build(i)
+
+    def close(self):
+        for view in self._views:
+            if hasattr(view, 'release'):
+                view.release()
+        self._views = []
+        self._sections = {}
+        if hasattr(self._buf, 'close'):
+            self._buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load(path, classes, lazy=True):
+    """ Reads a snapshot file
+
+    :param classes: the classes of the objects, by name
+    :param lazy: if True, the file is memory-mapped and a Snapshot is
+                 returned, building the objects on access ; else a list of
+                 all the objects
+    :raises ValueError: if the file is not a snapshot of a supported version
+    """
+    with open(path, 'rb') as f:
+        if lazy:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+
+    try:
+        snapshot = Snapshot(buf, classes)
+    except ValueError:
+        if lazy:
+            buf.close()
+        raise
+    if lazy:
+        return snapshot
+    try:
+        return list(snapshot)
+    finally:
+        snapshot.close()
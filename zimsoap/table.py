@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Column-oriented tables of directory objects, for analytics
+
+Rather than one ZObject per account, an AccountTable holds a few attributes
+of all the accounts in columns : numbers and booleans in arrays, text in
+dictionary-encoded columns (an array of codes, and the list of the distinct
+values), which suits low-cardinality attributes such as COS ids or statuses.
+
+    table = zc.account_table(
+        ['zimbraCOSId', 'zimbraAccountStatus', 'zimbraMailQuota'])
+    active = table.filter('zimbraAccountStatus', 'active')
+    active.group_by('zimbraCOSId', 'zimbraMailQuota')
+    # {'e00428a1-...': 1073741824, None: 52428800}
+
+Columns can be had as numpy arrays (see to_numpy()) if it is installed.
+"""
+
+import array
+
+from six import integer_types
+
+from zimsoap import attrtypes
+from zimsoap import utils
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    array.array('q')
+    INT_TYPECODE = 'q'
+except ValueError:
+    # python 2
+    INT_TYPECODE = 'l'
+
+
+class ListColumn(object):
+    """ Values kept as they are, for unique values (ids, names)
+    """
+    def __init__(self, data=None):
+        self.data = [] if data is None else data
+
+    def append(self, value):
+        self.data.append(value)
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __len__(self):
+        return len(self.data)
+
+    def values(self):
+        return list(self.data)
+
+    def select(self, predicate):
+        """
+        :returns: the indexes of the values matching the predicate
+        """
+        return [i for i, v in enumerate(self.data) if predicate(v)]
+
+    def take(self, indexes):
+        """
+        :returns: a new column, of the values at the indexes
+        """
+        data = self.data
+        return type(self)([data[i] for i in indexes])
+
+    def to_numpy(self):
+        return numpy.array(self.data, dtype=object)
+
+
+class IntColumn(ListColumn):
+    """ Integers, in an array ; missing values are None
+
+    Values which are not a single integer (missing, multi-valued, or not a
+    number after all) are set in the mask array, their data being 0 : 0 is
+    a meaningful value for some attributes (ex: an unlimited
+    zimbraMailQuota), it is never taken for a missing one.
+    """
+    TYPECODE = INT_TYPECODE
+    # the value of the masked items
+    MISSING = None
+
+    def __init__(self, data=None, mask=None):
+        self.data = array.array(self.TYPECODE, data or ())
+        # 1 for the missing values
+        if mask is None:
+            mask = array.array('b', [0]) * len(self.data)
+        self.mask = array.array('b', mask)
+
+    def append(self, value):
+        if isinstance(value, integer_types):
+            self.data.append(value)
+            self.mask.append(0)
+        else:
+            self.data.append(0)
+            self.mask.append(1)
+
+    def __getitem__(self, i):
+        if self.mask[i]:
+            return self.MISSING
+        return self.data[i]
+
+    def values(self):
+        missing = self.MISSING
+        return [missing if m else v for v, m in zip(self.data, self.mask)]
+
+    def select(self, predicate):
+        return [i for i, v in enumerate(self.values()) if predicate(v)]
+
+    def take(self, indexes):
+        data = self.data
+        mask = self.mask
+        return type(self)([data[i] for i in indexes],
+                          [mask[i] for i in indexes])
+
+    def to_numpy(self):
+        """ :returns: a masked array
+        """
+        return numpy.ma.masked_array(
+            numpy.frombuffer(self.data, dtype=self.data.typecode),
+            mask=numpy.frombuffer(self.mask, dtype='b').astype(bool))
+
+
+class BoolColumn(IntColumn):
+    """ Booleans, as 0/1 in an array ; missing values are False, as for
+    Zimbra
+    """
+    TYPECODE = 'b'
+    MISSING = False
+
+    def __getitem__(self, i):
+        return bool(self.data[i])
+
+    def values(self):
+        return [bool(v) for v in self.data]
+
+    def to_numpy(self):
+        return numpy.frombuffer(self.data, dtype='b').astype(bool)
+
+
+class CategoryColumn(ListColumn):
+    """ Dictionary-encoded values : an array of codes, indexes in the list
+    of the distinct values ; missing values are None
+    """
+    def __init__(self, codes=(), categories=None):
+        self.codes = array.array('i', codes)
+        self.categories = [None] if categories is None else categories
+        self._index = {v: i for i, v in enumerate(self.categories)}
+
+    def append(self, value):
+        try:
+            code = self._index[value]
+        except KeyError:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, i):
+        return self.categories[self.codes[i]]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def values(self):
+        categories = self.categories
+        return [categories[c] for c in self.codes]
+
+    def select(self, predicate):
+        # the predicate is only run once per distinct value
+        matching = set(
+            i for i, v in enumerate(self.categories) if predicate(v))
+        return [i for i, c in enumerate(self.codes) if c in matching]
+
+    def take(self, indexes):
+        codes = self.codes
+        return type(self)(
+            (codes[i] for i in indexes), list(self.categories))
+
+    def to_numpy(self):
+        """ :returns: the codes, see self.categories
+        """
+        return numpy.frombuffer(self.codes, dtype='i')
+
+
+class AccountTable(object):
+    """ Some attributes of accounts, in columns, see the module docstring
+
+    The XML attributes "id" and "name" are always there.
+
+    :param attrs: the names of the <a> attributes to keep
+    """
+    COLUMN_CLASSES = {
+        'boolean': BoolColumn,
+        'integer': IntColumn,
+        'long': IntColumn,
+        'port': IntColumn,
+    }
+
+    def __init__(self, attrs, columns=None):
+        self.attrs = list(attrs)
+        self._attrs = set(self.attrs)
+        if columns is None:
+            columns = {'id': ListColumn(), 'name': ListColumn()}
+            for attr in self.attrs:
+                attr_type = attrtypes.ATTR_TYPES.get(attr)
+                columns[attr] = self.COLUMN_CLASSES.get(
+                    attr_type, CategoryColumn)()
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name):
+        """ :returns: the column values, as a list
+        """
+        return self.columns[name].values()
+
+    def append(self, node):
+        """ Adds an account, from its dict in python-zimbra format, without
+        building a ZObject.
+        """
+        columns = self.columns
+        attrs = self._attrs
+        values = {}
+        for a in utils.as_list(node.get('a', ())):
+            name = a['n']
+            if name in attrs:
+                value = attrtypes.convert(name, a.get('_content'))
+                if name in values:
+                    # multi-valued
+                    prev = values[name]
+                    if not isinstance(prev, tuple):
+                        prev = (prev,)
+                    value = prev + (value,)
+                values[name] = value
+
+        columns['id'].append(node.get('id'))
+        columns['name'].append(node.get('name'))
+        for attr in self.attrs:
+            columns[attr].append(values.get(attr))
+
+    def rows(self):
+        """ Iterates over the accounts, as dicts of their attributes
+        """
+        names = list(self.columns)
+        columns = [self.columns[name].values() for name in names]
+        for row in zip(*columns):
+            yield dict(zip(names, row))
+
+    def take(self, indexes):
+        """ :returns: a new table, of the accounts at the indexes
+        """
+        return AccountTable(self.attrs, {
+            name: column.take(indexes)
+            for name, column in self.columns.items()})
+
+    def filter(self, name, value):
+        """ :param value: the value to keep, or a predicate function
+            :returns: a new table, of the accounts whose `name` column
+                      matches the value
+        """
+        if callable(value):
+            predicate = value
+        else:
+            def predicate(v):
+                return v == value
+        return self.take(self.columns[name].select(predicate))
+
+    def group_by(self, key, value=None):
+        """ :param key: the column to group by
+            :param value: a numeric column, to sum by group ; if None, the
+                          accounts are counted
+            :returns: a dict of {key value: sum or count}
+        """
+        key_column = self.columns[key]
+        if value is None:
+            weights = None
+        else:
+            # the missing values are not summed
+            weights = [w or 0 for w in self.columns[value].values()]
+
+        if isinstance(key_column, CategoryColumn):
+            # aggregated by code, then decoded
+            counts = [0] * len(key_column.categories)
+            if weights is None:
+                for c in key_column.codes:
+                    counts[c] += 1
+                totals = counts
+            else:
+                totals = [0] * len(counts)
+                for c, w in zip(key_column.codes, weights):
+                    counts[c] += 1
+                    totals[c] += w
+            return {key_column.categories[c]: totals[c]
+                    for c, count in enumerate(counts) if count}
+
+        groups = {}
+        keys = key_column.values()
+        if weights is None:
+            for k in keys:
+                groups[k] = groups.get(k, 0) + 1
+        else:
+            for k, w in zip(keys, weights):
+                groups[k] = groups.get(k, 0) + w
+        return groups
+
+    def to_numpy(self, name):
+        """ :returns: a column as a numpy array (the codes of text columns)
+        """
+        if numpy is None:
+            raise ImportError('numpy is not installed')
+        return self.columns[name].to_numpy()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" Pooling of the auth tokens of many accounts
+
+Logging in as an account on behalf of an admin (delegated_login(),
+get_logged_in_by()) costs a DelegateAuth or preauth request, for a token
+valid for hours. A TokenPool, given to the admin client, keeps the tokens
+it gets until shortly before they expire, so that the clients of an account
+can be built again and again without asking for a new token each time:
+
+    admin_zc = ZimbraAdminClient('zimbra.example.com', token_pool=True)
+    admin_zc.login('admin@example.com', 'secret')
+    for name in account_names:
+        zc = ZimbraMailClient('zimbra.example.com')
+        zc.delegated_login(name, admin_zc)  # DelegateAuth once per account
+        ...
+"""
+
+from collections import OrderedDict
+import threading
+
+from zimsoap import singleflight
+from zimsoap.utils import clock
+
+
+class TokenPool(object):
+    """ A thread-safe pool of auth tokens, by key (ex: the account name)
+
+    Tokens are given back until `refresh_margin` seconds before they expire,
+    a new one is then fetched. Concurrent fetches of the same key are shared.
+
+    :param refresh_margin: in seconds
+    :param preauth_lifetime: the lifetime of the preauth tokens, in seconds,
+                             asked for when fetching them for the pool
+    :param maxsize: the maximum number of tokens kept, the oldest ones are
+                    dropped first
+    """
+    def __init__(self, refresh_margin=60, preauth_lifetime=3600,
+                 maxsize=100000):
+        self.refresh_margin = refresh_margin
+        self.preauth_lifetime = preauth_lifetime
+        self.maxsize = maxsize
+        # {key: (token, expiry)}, the oldest first
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+        self._single_flight = singleflight.SingleFlight()
+        self.hits = 0
+        self.fetches = 0
+
+    def get(self, key, fetch):
+        """ :param fetch: a function giving a new (token, lifetime) tuple,
+                          the lifetime being in seconds
+            :returns: a (token, lifetime) tuple, lifetime being the seconds
+                      left before the token expires
+        """
+        now = clock()
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and now < entry[1] - self.refresh_margin:
+                self.hits += 1
+                return entry[0], entry[1] - now
+
+        def fetch_and_put():
+            token, lifetime = fetch()
+            self.put(key, token, lifetime)
+            with self._lock:
+                self.fetches += 1
+            return token, lifetime
+
+        return self._single_flight.do(key, fetch_and_put)
+
+    def put(self, key, token, lifetime):
+        """ :param lifetime: in seconds
+        """
+        with self._lock:
+            self._tokens.pop(key, None)
+            self._tokens[key] = (token, clock() + lifetime)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+
+    def forget(self, key):
+        """ Drops a token (ex: revoked by the server)
+        """
+        with self._lock:
+            self._tokens.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def stats(self):
+        """ :returns: a dict of counters
+        """
+        with self._lock:
+            return {'hits': self.hits, 'fetches': self.fetches,
+                    'size': len(self._tokens)}
@@ -0,0 +1,607 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+""" HTTP transport for the SOAP clients
+
+pythonzimbra's Communication opens a new urllib connection (and does a full
+TLS handshake) for every single SOAP call. The classes here keep connections
+alive between calls instead, and resume TLS sessions when a new connection
+has to be opened anyway.
+"""
+
+import gzip
+import io
+import socket
+import ssl
+import threading
+import time
+import zlib
+
+from six.moves import http_client, urllib
+from pythonzimbra.communication import Communication
+import pythonzimbra.request_json
+import pythonzimbra.response_json
+from pythonzimbra.response_xml import ResponseXml
+
+from zimsoap import utils
+
+try:
+    from urllib2 import HTTPError, URLError
+except ImportError:
+    from urllib.error import HTTPError, URLError
+
+
+# Errors meaning that a kept-alive connection was closed by the server while
+# it was sitting in the pool.
+STALE_CONNECTION_ERRORS = (
+    http_client.BadStatusLine, http_client.CannotSendRequest,
+    socket.error)
+
+# Errors telling, once a request is sent, that the server closed the
+# connection without answering anything: it was closed while idle.
+NO_RESPONSE_ERRORS = (
+    getattr(http_client, 'RemoteDisconnected', http_client.BadStatusLine),)
+
+
+class RequestJson(pythonzimbra.request_json.RequestJson):
+    """ pythonzimbra RequestJson, but able to batch more than two requests
+    of the same name.
+    """
+    def add_request(self, request_name, request_dict, namespace):
+        if not self.batch_request:
+            return super(RequestJson, self).add_request(
+                request_name, request_dict, namespace)
+
+        request_dict['_jsns'] = namespace
+        request_id = self.batch_request_id
+        request_dict['requestId'] = request_id
+        self.batch_request_id += 1
+
+        batch_node = self.request_dict['Body']['BatchRequest']
+        batch_node.setdefault(request_name, []).append(request_dict)
+        return request_id
+
+
+class ResponseJson(pythonzimbra.response_json.ResponseJson):
+    """ pythonzimbra ResponseJson, but giving the very same dicts than
+    ResponseXml would for the same response.
+    """
+    def set_response(self, response_text):
+        super(ResponseJson, self).set_response(response_text)
+        for part in ('Header', 'Body'):
+            self.response_dict[part] = {
+                k: utils.json_to_dom_dict(k, v)
+                for k, v in self.response_dict.get(part, {}).items()
+                if k != '_jsns'}
+
+
+class _HTTPSConnection(http_client.HTTPSConnection):
+    """ An HTTPSConnection resuming the TLS session of its pool, if any.
+    """
+    def __init__(self, host, port, pool, **kwargs):
+        http_client.HTTPSConnection.__init__(self, host, port, **kwargs)
+        self.pool = pool
+
+    def connect(self):
+        if not hasattr(ssl.SSLSocket, 'session'):
+            # Python < 3.6, no session resumption
+            return http_client.HTTPSConnection.connect(self)
+
+        http_client.HTTPConnection.connect(self)
+        server_hostname = getattr(self, '_tunnel_host', None) or self.host
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=server_hostname,
+            session=self.pool.tls_session)
+        self.pool.tls_session = self.sock.session
+
+
+class PoolStats(object):
+    """ Counters of a ConnectionPool
+
+    - hits: requests sent over an already opened connection
+    - new_connections: connections opened
+    - idle_evictions: connections closed because they stayed idle too long
+    """
+    def __init__(self):
+        self.hits = 0
+        self.new_connections = 0
+        self.idle_evictions = 0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'new_connections': self.new_connections,
+            'idle_evictions': self.idle_evictions,
+        }
+
+    def __repr__(self):
+        return '<PoolStats hits={0} new_connections={1} idle_evictions={2}>'\
+            .format(self.hits, self.new_connections, self.idle_evictions)
+
+
+class TransferStats(object):
+    """ Bytes transferred, per request name (ex: 'GetAccountRequest')
+
+    Raw sizes are the ones of the SOAP messages, wire sizes the ones of the
+    HTTP bodies, once compressed.
+    """
+    COUNTERS = ('requests', 'request_bytes', 'request_wire_bytes',
+                'response_bytes', 'response_wire_bytes')
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _add(self, name, **counts):
+        with self._lock:
+            counters = self._counters.get(name)
+            if counters is None:
+                counters = self._counters[name] = dict.fromkeys(
+                    self.COUNTERS, 0)
+            for k, v in counts.items():
+                counters[k] += v
+
+    def add_request(self, name, raw, wire):
+        self._add(name, requests=1, request_bytes=raw,
+                  request_wire_bytes=wire)
+
+    def add_response(self, name, raw, wire):
+        self._add(name, response_bytes=raw, response_wire_bytes=wire)
+
+    def as_dict(self):
+        """
+        :returns: a dict of counters dicts, indexed by request name
+        """
+        with self._lock:
+            return {k: dict(v) for k, v in self._counters.items()}
+
+
+def request_name(request):
+    """
+    :returns: the name of the tag in the Body of a pythonzimbra request
+    """
+    if request.request_type == 'json':
+        return next(iter(request.request_dict['Body']), None)
+    node = request.body_node.firstChild
+    return node.tagName if node is not None else None
+
+
+def gzip_compress(data):
+    # gzip.compress() is python >= 3.2 only
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def _decompressor(encoding):
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return zlib.decompressobj()
+
+
+def decompress(data, encoding):
+    """ Decodes a body of the given Content-Encoding
+
+    :returns: the decoded body
+    """
+    if encoding not in ('gzip', 'deflate'):
+        return data
+    try:
+        return _decompressor(encoding).decompress(data)
+    except zlib.error:
+        if encoding != 'deflate':
+            raise
+        # some servers send raw deflate streams
+        return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+
+
+class DecompressingReader(object):
+    """ Decodes a compressed body on the fly, while it is read, counting
+    the bytes read.
+    """
+    def __init__(self, fileobj, encoding=None):
+        self.fileobj = fileobj
+        self.encoding = encoding
+        if encoding in ('gzip', 'deflate'):
+            self._decompressor = _decompressor(encoding)
+        else:
+            self._decompressor = None
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = 64 * 1024
+        while True:
+            data = self.fileobj.read(size)
+            self.wire_bytes += len(data)
+            if self._decompressor is None:
+                break
+            if data:
+                data = self._decompressor.decompress(data)
+                if not data:
+                    # not enough compressed data yet
+                    continue
+            else:
+                data = self._decompressor.flush()
+            break
+        self.raw_bytes += len(data)
+        return data
+
+
+class ConnectionPool(object):
+    """ Keep-alive connections to a single (host, port)
+
+    At most `maxsize` idle connections are kept, connections idle for more
+    than `idle_timeout` seconds are closed rather than reused.
+    """
+    def __init__(self, host, port, scheme='https', maxsize=10, timeout=None,
+                 context=None, idle_timeout=60):
+        self.host = host
+        self.port = int(port)
+        self.scheme = scheme
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+
+        if scheme == 'https' and context is None:
+            # honors ssl._create_default_https_context overrides, as urllib
+            context = ssl._create_default_https_context()
+        self.context = context
+        self.tls_session = None
+
+        self.stats = PoolStats()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        kwargs = {}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+
+        if self.scheme == 'https':
+            return _HTTPSConnection(self.host, self.port, self,
+                                    context=self.context, **kwargs)
+        else:
+            return http_client.HTTPConnection(self.host, self.port, **kwargs)
+
+    def get(self):
+        """ Get a connection, reusing an idle one if possible
+
+        :returns: a (connection, reused) tuple
+        """
+        conn = self._get_idle()
+        if conn is None:
+            return self._new_connection(), False
+        else:
+            return conn, True
+
+    def _get_idle(self):
+        """ Pops the most recently used idle connection, closing the ones
+        idle for too long on the way.
+
+        :returns: a connection, or None if a new one has to be opened
+        """
+        now = time.time()
+        evicted = []
+        conn = None
+
+        with self._lock:
+            while self._idle:
+                candidate, since = self._idle.pop()
+                if now - since > self.idle_timeout:
+                    evicted.append(candidate)
+                    self.stats.idle_evictions += 1
+                else:
+                    conn = candidate
+                    self.stats.hits += 1
+                    break
+            if conn is None:
+                self.stats.new_connections += 1
+
+        for i in evicted:
+            i.close()
+        return conn
+
+    def put(self, conn):
+        """ Give back a connection after its response was fully read
+        """
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, since in idle:
+            conn.close()
+
+    def urlopen(self, method, path, body=None, headers={}):
+        """ Sends a request and reads the whole response
+
+        A connection found closed by the server while idle is transparently
+        replaced by a new one, see stream().
+
+        :returns: a (status, reason, headers, body) tuple
+        """
+        conn, resp = self.stream(method, path, body, headers)
+        try:
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self.put(conn)
+
+        return resp.status, resp.reason, resp.msg, data
+
+    def stream(self, method, path, body=None, headers={}):
+        """ Sends a request, without reading the response body
+
+        The request is sent again on a new connection only if a reused one
+        fails while sending it, or if the server closes it without answering
+        anything (it was closed while idle) ; once the request may have been
+        processed (ex: reset while reading the response), the error is raised,
+        not to run it twice.
+
+        The caller has to give the connection back with release() once done
+        with the response.
+
+        :returns: a (connection, http_client.HTTPResponse) tuple
+        """
+        while True:
+            conn, reused = self.get()
+            try:
+                conn.request(method, path, body, headers)
+            except STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                if reused and not isinstance(e, socket.timeout):
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            try:
+                return conn, conn.getresponse()
+            except NO_RESPONSE_ERRORS:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+    def release(self, conn, resp):
+        """ Gives back a connection used by stream()
+        """
+        if resp.will_close or not resp.isclosed():
+            # partially read responses cannot be skipped
+            conn.close()
+        else:
+            self.put(conn)
+
+
+class PoolManager(object):
+    """ Holds one ConnectionPool per (scheme, host, port)
+
+    Share a PoolManager between several clients to let them share their
+    connections.
+
+    :param compression: ask the servers for compressed (gzip or deflate)
+                        responses
+    :param compress_min_size: gzip request bodies of at least that size, in
+                              bytes (None to never compress them).
+    """
+    POOL_CLASS = ConnectionPool
+
+    def __init__(self, maxsize=10, timeout=None, context=None,
+                 idle_timeout=60, compression=True, compress_min_size=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.context = context
+        self.idle_timeout = idle_timeout
+        self.compression = compression
+        self.compress_min_size = compress_min_size
+        self.transfer_stats = TransferStats()
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def connection_pool(self, scheme, host, port):
+        key = (scheme, host, int(port))
+        with self._lock:
+            try:
+                return self._pools[key]
+            except KeyError:
+                pool = self.POOL_CLASS(
+                    host, port, scheme, maxsize=self.maxsize,
+                    timeout=self.timeout, context=self.context,
+                    idle_timeout=self.idle_timeout)
+                self._pools[key] = pool
+                return pool
+
+    def urlopen(self, method, url, body=None, headers={}):
+        """ Sends a request to an URL, through the pool of its server, see
+        ConnectionPool.urlopen()
+
+        :raises URLError: on network errors
+        """
+        pool, path = self._pool_and_path(url)
+        try:
+            return pool.urlopen(method, path, body, headers)
+        except (socket.error, http_client.HTTPException) as e:
+            raise URLError(e)
+
+    def _pool_and_path(self, url):
+        """ :returns: a (ConnectionPool, path) tuple, to request `url`
+        """
+        parsed = urllib.parse.urlsplit(url)
+        default_port = 443 if parsed.scheme == 'https' else 80
+        pool = self.connection_pool(
+            parsed.scheme, parsed.hostname, parsed.port or default_port)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        return pool, path
+
+    def stats(self):
+        """
+        :returns: a dict of counters dicts, indexed by (host, port)
+        """
+        with self._lock:
+            pools = list(self._pools.values())
+        return {(p.host, p.port): p.stats.as_dict() for p in pools}
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+
+class PooledCommunication(Communication):
+    """ Drop-in replacement for pythonzimbra Communication, sending the
+    requests over the kept-alive connections of a PoolManager.
+    """
+    CONTENT_TYPES = {
+        'xml': 'application/soap+xml; charset=utf-8',
+        'json': 'application/json; charset=utf-8',
+    }
+    POOL_MANAGER = PoolManager
+
+    def __init__(self, url, pool_manager=None, timeout=None, context=None):
+        Communication.__init__(self, url, timeout, context)
+        if pool_manager is None:
+            pool_manager = self.POOL_MANAGER(timeout=timeout, context=context)
+        self.pool_manager = pool_manager
+
+        parsed = urllib.parse.urlsplit(url)
+        default_port = 443 if parsed.scheme == 'https' else 80
+        self.pool = pool_manager.connection_pool(
+            parsed.scheme, parsed.hostname, parsed.port or default_port)
+        self.path = parsed.path or '/'
+
+    def send_request(self, request, response=None):
+        """ Same contract as pythonzimbra Communication.send_request()
+
+        HTTP 500 are expected to carry a SOAP Fault and are fed to the
+        response, other HTTP errors raise an HTTPError, network errors raise
+        an URLError.
+        """
+        headers, body = self._prepare_request(request)
+        try:
+            status, reason, resp_headers, data = self.pool.urlopen(
+                'POST', self.path, body, headers)
+        except (socket.error, http_client.HTTPException) as e:
+            raise URLError(e)
+
+        return self._feed_response(
+            request, response, status, reason, resp_headers, data)
+
+    def iter_response(self, request, response, depth=3):
+        """ Sends an XML request and parses the response incrementally
+
+        The elements at `depth` (3 for the children of the response tag,
+        <Envelope><Body><XxxResponse><child/>) are yielded as soon as they
+        are parsed, see utils.iter_xml_elements().
+
+        Errors are handled as in send_request(): HTTP 500 are fed to the
+        response (and nothing is yielded).
+        """
+        elements = self.stream_response(request, response, depth)
+        if elements is not None:
+            for item in elements:
+                yield item
+
+    def stream_response(self, request, response, depth=3):
+        """ Sends an XML request, its response being then parsed
+        incrementally, as in iter_response()
+
+        :returns: an iterator over the elements of the response, or None if
+                  it is an error (an HTTP 500, fed to the response)
+        """
+        headers, body = self._prepare_request(request)
+        try:
+            conn, resp = self.pool.stream('POST', self.path, body, headers)
+        except (socket.error, http_client.HTTPException) as e:
+            raise URLError(e)
+
+        if resp.status != 200:
+            try:
+                self._feed_response(request, response, resp.status,
+                                    resp.reason, resp.msg, resp.read())
+            finally:
+                self.pool.release(conn, resp)
+            return None
+        return self._iter_elements(request, conn, resp, depth)
+
+    def _iter_elements(self, request, conn, resp, depth):
+        try:
+            reader = DecompressingReader(
+                resp, resp.msg.get('Content-Encoding'))
+            try:
+                for item in utils.iter_xml_elements(reader, depth):
+                    yield item
+            finally:
+                self.pool_manager.transfer_stats.add_response(
+                    request_name(request), reader.raw_bytes,
+                    reader.wire_bytes)
+        finally:
+            self.pool.release(conn, resp)
+
+    def _prepare_request(self, request):
+        """
+        :returns: a (headers, body) tuple
+        """
+        headers = {
+            'Content-Type': self.CONTENT_TYPES.get(
+                request.request_type, 'text/xml; charset=utf-8'),
+        }
+        body = request.get_request().encode('utf-8')
+        raw_size = len(body)
+
+        pm = self.pool_manager
+        if pm.compression:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+        if (pm.compress_min_size is not None and
+                raw_size >= pm.compress_min_size):
+            body = gzip_compress(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        pm.transfer_stats.add_request(
+            request_name(request), raw_size, len(body))
+        return headers, body
+
+    def _feed_response(self, request, response, status, reason, headers,
+                       data):
+        """ Feeds the HTTP response to the pythonzimbra response
+
+        :returns: the response, a new one if None was given, or None
+        """
+        wire_size = len(data)
+        data = decompress(data, headers.get('Content-Encoding'))
+        self.pool_manager.transfer_stats.add_response(
+            request_name(request), len(data), wire_size)
+
+        if status not in (200, 500):
+            raise HTTPError(self.url, status, reason, headers,
+                            io.BytesIO(data))
+
+        local_response = None
+        if response is None:
+            if request.request_type == 'json':
+                local_response = ResponseJson()
+            else:
+                local_response = ResponseXml()
+            response = local_response
+
+        response.set_response(data.decode('utf-8'))
+        return local_response
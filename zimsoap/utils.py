@@ -4,13 +4,19 @@ from __future__ import unicode_literals
 
 """ Misc tool functions """
 
-import pythonzimbra
-import pythonzimbra.tools.xmlserializer
-
+import functools
 import re
 import hmac
 import hashlib
-from xml.dom import minidom
+import time
+from collections import OrderedDict
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+from six import string_types, text_type
+
+# monotonic clock if available (python >= 3.3)
+clock = getattr(time, 'monotonic', time.time)
 
 re_zuuid = re.compile(r'[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}')
 
@@ -49,6 +55,17 @@ def as_list(obj):
         return [obj]
 
 
+def attrs_param(attrs):
+    """ Formats the attributes to fetch, for the "attrs" parameter of the
+    Get* and SearchDirectory requests
+
+    :param attrs: attribute names, as a list or a comma-separated string
+    """
+    if isinstance(attrs, string_types):
+        return attrs
+    return ','.join(attrs)
+
+
 def get_content(obj):
     """ Works arround (sometimes) non predictible results of pythonzimbra
 
@@ -61,6 +78,71 @@ def get_content(obj):
         return obj
 
 
+def memoized(maxsize=10000):
+    """ Decorator caching the results of a function of a string, by argument
+
+    Other arguments than strings are not cached. Once the cache holds
+    `maxsize` results, the least recently used one is dropped. Results
+    which are strings are shared by the calls with equal arguments, so that
+    they share memory.
+
+    The decorated function gets a stats() method, returning the counts of
+    calls answered from the cache (hits) and actually running the function
+    (misses), a clear() method, and the original function as __wrapped__.
+    """
+    def decorator(func):
+        # the least recently used first
+        cache = OrderedDict()
+        try:
+            touch = cache.move_to_end
+        except AttributeError:
+            # python 2
+            def touch(s):
+                cache[s] = cache.pop(s)
+        # hits, misses
+        counts = [0, 0]
+
+        @functools.wraps(func)
+        def wrapper(s):
+            if not isinstance(s, string_types):
+                return func(s)
+            try:
+                ret = cache[s]
+                # now the most recently used
+                touch(s)
+            except KeyError:
+                pass
+            else:
+                counts[0] += 1
+                return ret
+
+            counts[1] += 1
+            ret = cache[s] = func(s)
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+            return ret
+
+        def stats():
+            return {'hits': counts[0], 'misses': counts[1],
+                    'size': len(cache)}
+
+        wrapper.stats = stats
+        wrapper.clear = cache.clear
+        # not set by python 2 functools.wraps()
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+@memoized()
+def share(s):
+    """ :returns: the first seen string equal to s (among the last ones), so
+              that equal strings kept by many objects share memory
+    """
+    return s
+
+
+@memoized()
 def auto_type(s):
     """ Get a XML response and tries to convert it to Python base object
     """
@@ -99,14 +181,221 @@ def auto_untype(arg):
         return arg
 
 
+# Size of the expat text buffer, larger text runs are given in several
+# pieces.
+XML_TEXT_BUFFER_SIZE = 65536
+
+
 def xml_str_to_dict(s):
     """ Transforms an XML string it to python-zimbra dict format
 
     For format, see:
       https://github.com/Zimbra-Community/python-zimbra/blob/master/README.md
 
+    Gives the very same dicts as pythonzimbra dom_to_dict() on a minidom
+    document, but builds them straight from the expat parser events, without
+    any DOM, which is several times faster.
+
     :param: a string, containing XML
     :returns: a dict, with python-zimbra format
     """
-    xml = minidom.parseString(s)
-    return pythonzimbra.tools.xmlserializer.dom_to_dict(xml.firstChild)
+    root = {}
+    # the dicts of the open tags
+    stack = [root]
+    push = stack.append
+    pop = stack.pop
+    # the pieces of the current text run, given in several events when
+    # larger than the expat buffer ; DOM keeps the last text node.
+    run = []
+    join = ''.join
+
+    def start(tag, node):
+        if run:
+            stack[-1]['_content'] = join(run)
+            del run[:]
+        # expat gives the attributes dict, namespace declarations included
+        # as in DOM, that is the node dict.
+        if ':' in tag:
+            tag = tag.split(':', 1)[1]
+        if len(node) > 1:
+            # DOM lists namespace declarations first
+            decls = [k for k in node if k.startswith('xmlns')]
+            if decls and len(decls) < len(node):
+                attrs = node
+                node = {k: attrs[k] for k in decls}
+                node.update(
+                    (k, v) for k, v in attrs.items() if k not in node)
+        parent = stack[-1]
+        # Same "single tag or list of tags" logic as in dom_to_dict
+        try:
+            prev_val = parent[tag]
+        except KeyError:
+            parent[tag] = node
+        else:
+            if type(prev_val) is list:
+                prev_val.append(node)
+            else:
+                parent[tag] = [prev_val, node]
+        push(node)
+
+    def end(tag):
+        node = pop()
+        if run:
+            node['_content'] = join(run)
+            del run[:]
+
+    if isinstance(s, text_type):
+        # as pyexpat does for text, ignoring the declared encoding
+        s = s.encode('utf-8')
+        parser = expat.ParserCreate('utf-8')
+    else:
+        parser = expat.ParserCreate()
+    # adjacent text (entities, CDATA...) is merged, as in DOM text nodes
+    parser.buffer_text = True
+    parser.buffer_size = XML_TEXT_BUFFER_SIZE
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = run.append
+    parser.Parse(s, True)
+    return root
+
+
+# The JSON format holds key/value pairs in an "_attrs" dict where the XML
+# format uses one tag per pair (ex: <pref name="key">value</pref>). Maps the
+# parent tag name to the (tag, key attribute) of the pairs in XML.
+JSON_ATTRS_TAGS = {
+    'GetPrefsResponse': ('pref', 'name'),
+    'prefs': ('pref', 'name'),
+    'attrs': ('attr', 'name'),
+    'props': ('prop', 'name'),
+}
+DEFAULT_JSON_ATTRS_TAG = ('a', 'n')
+
+
+def _json_scalar_to_str(v):
+    if isinstance(v, bool):
+        return '1' if v else '0'
+    elif isinstance(v, text_type):
+        return v
+    else:
+        return text_type(v)
+
+
+def _add_child(node_dict, tag, value):
+    # Same "single tag or list of tags" logic as in dom_to_dict
+    if tag in node_dict:
+        prev_val = node_dict[tag]
+        if not isinstance(prev_val, list):
+            node_dict[tag] = [prev_val]
+        node_dict[tag].append(value)
+    else:
+        node_dict[tag] = value
+
+
+def json_to_dom_dict(tag, node):
+    """ Transforms a tag of a Zimbra JSON response into python-zimbra dict
+    format, exactly as it would be if the response was in XML.
+
+    Zimbra JSON gives numbers and booleans where XML only has strings, always
+    gives lists for child tags and uses "_attrs" for key/value pairs.
+
+    :param tag:  the tag name
+    :param node: the JSON object of that tag
+    :returns: a dict, as dom_to_dict() would build for the tag content
+    """
+    node_dict = {}
+
+    if not isinstance(node, dict):
+        # a text-only tag in a list (ex: "dlm": ["foo@example.com"])
+        node_dict['_content'] = _json_scalar_to_str(node)
+        return node_dict
+
+    for k, v in node.items():
+        if k == '_jsns':
+            node_dict['xmlns'] = v
+        elif k == '_attrs':
+            child_tag, key_attr = JSON_ATTRS_TAGS.get(
+                tag, DEFAULT_JSON_ATTRS_TAG)
+            for attr_name, attr_values in v.items():
+                for attr_value in as_list(attr_values):
+                    _add_child(node_dict, child_tag, {
+                        key_attr: attr_name,
+                        '_content': _json_scalar_to_str(attr_value)})
+        elif isinstance(v, list):
+            for child in v:
+                _add_child(node_dict, k, json_to_dom_dict(k, child))
+        elif isinstance(v, dict):
+            _add_child(node_dict, k, json_to_dom_dict(k, v))
+        else:
+            # attributes, and _content
+            node_dict[k] = _json_scalar_to_str(v)
+
+    return node_dict
+
+
+def _local_name(tag):
+    """ '{urn:zimbraAdmin}account' -> 'account' """
+    return tag.rsplit('}', 1)[-1]
+
+
+def element_to_dict(elem, ns_decls={}):
+    """ Transforms an ElementTree element into python-zimbra dict format, as
+    dom_to_dict() would do for the same minidom element.
+
+    :param ns_decls: namespace declarations of elements (see iterparse()
+                     "start-ns" events), as a dict of lists of (prefix, uri)
+                     tuples indexed by element; they are attributes in DOM.
+    :returns: a dict, the content of the tag
+    """
+    node_dict = {}
+    for prefix, uri in ns_decls.get(elem, ()):
+        node_dict['xmlns:'+prefix if prefix else 'xmlns'] = uri
+    for k, v in elem.attrib.items():
+        node_dict[_local_name(k)] = v
+
+    # DOM keeps the last text node
+    content = elem.text
+    for child in elem:
+        _add_child(node_dict, _local_name(child.tag),
+                   element_to_dict(child, ns_decls))
+        if child.tail is not None:
+            content = child.tail
+    if content is not None:
+        node_dict['_content'] = content
+    return node_dict
+
+
+def iter_xml_elements(source, depth):
+    """ Parses an XML document incrementally, yielding its elements of a
+    given depth as soon as they are parsed, and then forgetting them, so that
+    memory usage does not depend on the number of elements.
+
+    :param source: a file-like object, the XML document
+    :param depth: the depth of the elements to yield, the root being at 0
+    :returns: an iterator over (ancestors, tag, dict) tuples, ancestors
+              being the tuple of the ancestors tags, from the root, and dict
+              the content of the element in python-zimbra format.
+    """
+    stack = []
+    ns_decls = {}
+    pending_ns = []
+
+    for event, item in ElementTree.iterparse(
+            source, events=('start-ns', 'start', 'end')):
+        if event == 'start-ns':
+            pending_ns.append(item)
+        elif event == 'start':
+            if pending_ns:
+                ns_decls[item] = pending_ns
+                pending_ns = []
+            stack.append(item)
+        else:
+            stack.pop()
+            if len(stack) == depth:
+                yield (tuple(_local_name(i.tag) for i in stack),
+                       _local_name(item.tag),
+                       element_to_dict(item, ns_decls))
+                stack[-1].remove(item)
+                if ns_decls:
+                    for i in item.iter():
+                        ns_decls.pop(i, None)
@@ -9,6 +9,10 @@ zimbra API. It is left to
 ZimbraAdminClient/ZimbraAccountClient/ZimbraMailClient...
 """
 
+from six import string_types, text_type
+
+from zimsoap import attrtypes
+from zimsoap import snapshot
 from zimsoap import utils
 
 
@@ -43,8 +47,9 @@ class ZObject(object):
         # import attributes
         obj._import_attributes(d)
 
-        # import <a> child tags as dict items, see __getitem__()
-        obj._a_tags = obj._parse_a_tags(d)
+        # <a> child tags are imported as dict items on first access, see
+        # __getitem__()
+        obj._a_raw = None
 
         return obj
 
@@ -55,28 +60,119 @@ class ZObject(object):
         self._a_tags = {}
         self._full_data = {}
 
+    def _get_raw_a_tags(self):
+        """ The not yet typed <a> tags values, grouped by name, parsed from
+        the full data at the first call.
+        """
+        if self._a_raw is None:
+            self._a_raw = self._group_a_tags(self._full_data)
+        return self._a_raw
+
+    def _get_a_tag(self, k):
+        """ Types the value of a single <a> tag, at its first access
+
+        :raises KeyError: if there is no such tag
+        """
+        try:
+            return self._a_typed[k]
+        except KeyError:
+            v = self._type_a_value(k, self._get_raw_a_tags()[k])
+            self._a_typed[k] = v
+            return v
+
+    @property
+    def _a_tags(self):
+        """ A dict of all the <a> tags, see _parse_a_tags()
+        """
+        raw = self._get_raw_a_tags()
+        if raw:
+            for k, v in raw.items():
+                if k not in self._a_typed:
+                    self._a_typed[k] = self._type_a_value(k, v)
+            self._a_raw = {}
+        return self._a_typed
+
+    @_a_tags.setter
+    def _a_tags(self, props):
+        self._a_typed = props
+        self._a_raw = {}
+
     def __hash__(self):
-        return hash(str(self))
+        try:
+            return hash(self._get_cmp_key())
+        except ValueError:
+            # never equal to another object
+            return hash(str(self))
 
     def get_full_data(self):
         return self._full_data
 
+    def _update_from(self, other, merge=False):
+        """ Replaces, in place, the data of the object by the one of another
+        object of the same class (ex: fetched again).
+
+        :param merge: keep the <a> tags the other object has not (ex: it was
+                      fetched with only some attributes)
+        """
+        if merge:
+            props = self._get_untyped_a_tags()
+            props.update(other._get_untyped_a_tags())
+        for cls in type(self).__mro__:
+            for k in cls.__dict__.get('__slots__', ()):
+                try:
+                    setattr(self, k, getattr(other, k))
+                except AttributeError:
+                    if hasattr(self, k):
+                        delattr(self, k)
+        self.__dict__.clear()
+        self.__dict__.update(other.__dict__)
+        if merge:
+            self._set_untyped_a_tags(props)
+            full_data = self._full_data
+            if full_data:
+                self._full_data = dict(full_data)
+                self._full_data['a'] = self._ungroup_a_tags(props)
+
     def get_full_xml(self):
         return self._full_data
 
+    def _get_cmp_key(self):
+        """ The key identifying the object, for equality and hashing : its
+        id, checked to be a Zimbra UUID, or else its (case-insensitive) name.
+        It is computed once per id or name value.
+
+        :raises ValueError: if there is no name and no valid id
+        """
+        value = getattr(self, 'id', None)
+        kind = 'id'
+        if value is None:
+            value = getattr(self, 'name', None)
+            kind = 'name'
+            if value is None:
+                raise ValueError('No "id" nor "name" attribute')
+
+        cached = getattr(self, '_cmp_key', None)
+        if cached is None or cached[0] is not value:
+            if kind == 'id':
+                if not utils.is_zuuid(value):
+                    raise ValueError('"id" is not a Zimbra UUID')
+                key = (kind, value)
+            else:
+                key = (kind, value.lower())
+            cached = self._cmp_key = (value, key)
+        return cached[1]
+
     def __eq__(self, other):
         if type(self) != type(other):
             raise TypeError('Cannot compare %s with %s' %
                             (type(self), type(other)))
 
         try:
-            if not utils.is_zuuid(self.id) or not utils.is_zuuid(other.id):
-                raise AttributeError()
-        except AttributeError:
+            return self._get_cmp_key() == other._get_cmp_key()
+        except ValueError:
             raise ValueError(
-                'Both comparees should have a Zimbra UUID as "id" attribute')
-
-        return self.id == other.id
+                'Both comparees should have a Zimbra UUID as "id" attribute, '
+                'or a "name"')
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -85,10 +181,12 @@ class ZObject(object):
         """ Returns an item which is one of the <a> tags (if any). Attributes
         are parsed oportunisticly at the first __getitem__ call.
         """
-        return self._a_tags[k]
+        return self._get_a_tag(k)
 
     def __setitem__(self, k, v):
-        self._a_tags[k] = utils.auto_type(v)
+        self._a_typed[k] = attrtypes.convert(k, v)
+        # the raw value is outdated
+        self._get_raw_a_tags().pop(k, None)
 
     def __repr__(self):
         most_significant_id = getattr(self, 'id',
@@ -121,7 +219,7 @@ class ZObject(object):
                else, will raise a KeyError.
         """
         try:
-            return self._a_tags[property_name]
+            return self._get_a_tag(property_name)
         except KeyError:
             if default != Ellipsis:
                 return default
@@ -129,14 +227,15 @@ class ZObject(object):
                 raise
 
     def has_property(self, property_name):
-        return (property_name in self._a_tags)
+        return (property_name in self._a_typed or
+                property_name in self._get_raw_a_tags())
 
     def property_as_list(self, property_name):
         """ property() but encapsulates it in a list, if it's a
         single-element property.
         """
         try:
-            res = self._a_tags[property_name]
+            res = self._get_a_tag(property_name)
         except KeyError:
             return []
 
@@ -151,6 +250,16 @@ class ZObject(object):
         If a tag with same "n" attributes appears several times, the
         dict value is a list with the tags values, else it's a string.
 
+        :param: dic the dict describing the tag
+        :returns:   a dict
+        """
+        return {k: cls._type_a_value(k, v)
+                for k, v in cls._group_a_tags(dic).items()}
+
+    @classmethod
+    def _group_a_tags(cls, dic):
+        """ Same as _parse_a_tags(), without typing the values
+
         :param: dic the dict describing the tag
         :returns:   a dict
         """
@@ -167,16 +276,7 @@ class ZObject(object):
 
         for child in childs:
             k = child[cls.ATTRNAME_PROPERTY]
-            try:
-                v = child['_content']
-            except KeyError:
-                v = None
-
-            try:
-                v = utils.auto_type(str(v))
-            except UnicodeEncodeError:
-                # Some times, str() fails because of accents...
-                v = utils.auto_type(v)
+            v = child.get('_content')
 
             if k in props:
                 prev_v = props[k]
@@ -189,6 +289,56 @@ class ZObject(object):
                 props[k] = v
         return props
 
+    @staticmethod
+    def _type_a_value(k, v):
+        """ Types a value of _group_a_tags(), see attrtypes
+        """
+        if isinstance(v, list):
+            return [ZObject._type_a_value(k, i) for i in v]
+        convert = attrtypes.get_converter(k)
+        try:
+            return convert(str(v))
+        except UnicodeEncodeError:
+            # Some times, str() fails because of accents...
+            return convert(v)
+
+    @staticmethod
+    def _untype_a_value(v):
+        """ The opposite of _type_a_value(), gives the value as text
+        """
+        if isinstance(v, list):
+            return [ZObject._untype_a_value(i) for i in v]
+        v = utils.auto_untype(v)
+        if v is None or isinstance(v, string_types):
+            return v
+        return text_type(v)
+
+    def _get_untyped_a_tags(self):
+        """ The values of the <a> tags as text, as _group_a_tags() gives
+        them
+        """
+        props = dict(self._get_raw_a_tags())
+        for k, v in self._a_typed.items():
+            if k not in props:
+                props[k] = self._untype_a_value(v)
+        return props
+
+    def _set_untyped_a_tags(self, props):
+        """ :param props: the <a> tags values, as _group_a_tags() gives them
+        """
+        self._a_typed = {}
+        self._a_raw = props
+
+    @classmethod
+    def _ungroup_a_tags(cls, props):
+        """ The reverse of _group_a_tags()
+
+        :returns: a list of <a> tags dicts
+        """
+        return [{cls.ATTRNAME_PROPERTY: k, '_content': v}
+                for k, values in props.items()
+                for v in utils.as_list(values)]
+
     @classmethod
     def _unparse_a_tags(cls, attrs_dict):
         """ Iterates over the dictionary
@@ -287,30 +437,21 @@ class Account(AbstractAddressableZObject):
 
         No field present means False by default.
         """
-        try:
-            return self._a_tags['zimbraIsAdminAccount']
-        except KeyError:
-            return False
+        return self.property('zimbraIsAdminAccount', False)
 
     def is_system(self):
         """ Is it a system account ?
 
         No field present means False by default.
         """
-        try:
-            return self._a_tags['zimbraIsSystemAccount']
-        except KeyError:
-            return False
+        return self.property('zimbraIsSystemAccount', False)
 
     def is_virtual(self):
         """ Is it a virtual external account ?
 
         No field present means False by default.
         """
-        try:
-            return self._a_tags['zimbraIsExternalVirtualAccount']
-        except KeyError:
-            return False
+        return self.property('zimbraIsExternalVirtualAccount', False)
 
 
 class CalendarResource(AbstractAddressableZObject):
@@ -412,10 +553,10 @@ class DistributionList(ZObject):
     SELECTORS = ('id', 'name')
 
     @classmethod
-    def from_dict(cls, d):
+    def from_dict(cls, d, **kwargs):
         """ Override default, adding the capture of members.
         """
-        o = super(DistributionList, cls).from_dict(d)
+        o = super(DistributionList, cls).from_dict(d, **kwargs)
         o.members = []
         if 'dlm' in d:
             o.members = [utils.get_content(member)
@@ -590,3 +731,171 @@ class QuotaUsage(ZObject):
     TAG_NAME = 'QuotaUsage'
     SELECTORS = ('domain', 'allServers', 'limit', 'offset', 'sortBy',
                  'sortAscending', 'refresh')
+
+
+class CompactZObject(ZObject):
+    """ A memory-saving ZObject, for the big listings
+
+    The XML attributes are stored in __slots__ (see the subclasses), and the
+    <a> tags values in a tuple, indexed by a key table shared by all the
+    objects having the same <a> names. Values are typed at each access, and
+    the full data dict is not kept, unless asked for, get_full_data()
+    rebuilds it.
+
+    As ZObject and its subclasses are not slotted, the objects still have a
+    __dict__ slot, but the dict is only allocated if an attribute without a
+    slot is set (ex: an unexpected XML attribute). The saving is that dict,
+    plus the full data dict and the typed <a> tags dict of the ZObjects.
+
+    Other child tags than <a> are dropped.
+    """
+    __slots__ = ('_a_keys', '_a_values', '_full_data', '_cmp_key')
+
+    # Shared key tables ({name: index} dicts), indexed by the names tuple
+    _key_tables = {}
+    MAX_KEY_TABLES = 10000
+
+    @classmethod
+    def from_dict(cls, d, keep_full_data=False):
+        if not isinstance(d, dict):
+            raise TypeError('Expecting a <dict>, got a {0}'.format(type(d)))
+        obj = cls.__new__(cls)
+        obj._full_data = d if keep_full_data else None
+        obj._import_attributes(d)
+        obj._set_a_values(cls._group_a_tags(d))
+        return obj
+
+    def __init__(self, *args, **kwargs):
+        super(CompactZObject, self).__init__(*args, **kwargs)
+        self._full_data = None
+
+    @classmethod
+    def _get_key_table(cls, names):
+        try:
+            return cls._key_tables[names]
+        except KeyError:
+            table = {k: i for i, k in enumerate(names)}
+            if len(cls._key_tables) < cls.MAX_KEY_TABLES:
+                cls._key_tables[names] = table
+            return table
+
+    def _set_a_values(self, props):
+        """ :param props: the not yet typed values, see _group_a_tags()
+        """
+        names = tuple(props)
+        self._a_keys = self._get_key_table(names)
+        # most values are repeated over the objects (TRUE, COS ids...)
+        self._a_values = tuple(
+            [utils.share(i) for i in props[k]] if isinstance(props[k], list)
+            else utils.share(props[k])
+            for k in names)
+
+    def _import_attributes(self, dic):
+        # XML attributes only, not the child tags
+        for k, v in dic.items():
+            if k != '_content' and not isinstance(v, (dict, list)):
+                setattr(self, k, v)
+
+    def _get_a_tag(self, k):
+        return self._type_a_value(k, self._a_values[self._a_keys[k]])
+
+    @property
+    def _a_tags(self):
+        """ A new dict of all the <a> tags, see _parse_a_tags()
+        """
+        return {k: self._type_a_value(k, self._a_values[i])
+                for k, i in self._a_keys.items()}
+
+    @_a_tags.setter
+    def _a_tags(self, props):
+        self._set_a_values(
+            {k: self._untype_a_value(v) for k, v in props.items()})
+
+    def __setitem__(self, k, v):
+        props = {k: self._a_values[i] for k, i in self._a_keys.items()}
+        props[k] = self._untype_a_value(attrtypes.convert(k, v))
+        self._set_a_values(props)
+
+    def has_property(self, property_name):
+        return property_name in self._a_keys
+
+    def _get_untyped_a_tags(self):
+        return {k: self._a_values[i] for k, i in self._a_keys.items()}
+
+    def _set_untyped_a_tags(self, props):
+        self._set_a_values(props)
+
+    def get_full_data(self):
+        if self._full_data is not None:
+            return self._full_data
+
+        d = {}
+        for cls in type(self).__mro__:
+            for k in getattr(cls, '__slots__', ()):
+                if not k.startswith('_') and hasattr(self, k):
+                    d[k] = getattr(self, k)
+        d.update(getattr(self, '__dict__', {}))
+        a_tags = self._ungroup_a_tags(self._get_untyped_a_tags())
+        if a_tags:
+            d['a'] = a_tags
+        return d
+
+    def get_full_xml(self):
+        return self.get_full_data()
+
+
+class CompactAccount(Account, CompactZObject):
+    __slots__ = ('id', 'name')
+
+
+class CompactCalendarResource(CalendarResource, CompactZObject):
+    __slots__ = ('id', 'name')
+
+
+class CompactDomain(Domain, CompactZObject):
+    __slots__ = ('id', 'name')
+
+
+class CompactDistributionList(DistributionList, CompactZObject):
+    __slots__ = ('id', 'name', 'dynamic', 'members')
+
+
+class CompactMailbox(Mailbox, CompactZObject):
+    __slots__ = ('accountId', 'changeCheckPoint', 'contactCount', 'groupId',
+                 'id', 'indexVolumeId', 'itemIdCheckPoint', 'lastSoapAccess',
+                 'newMessages', 'sizeCheckPoint', 'trackingImap',
+                 'trackingSync')
+
+
+# The compact versions of the ZObjects, see CompactZObject
+COMPACT_CLASSES = {
+    Account: CompactAccount,
+    CalendarResource: CompactCalendarResource,
+    Domain: CompactDomain,
+    DistributionList: CompactDistributionList,
+    Mailbox: CompactMailbox,
+}
+
+
+def _snapshot_classes():
+    return {name: cls for name, cls in globals().items()
+            if isinstance(cls, type) and issubclass(cls, ZObject)}
+
+
+def dump_snapshot(objs, path):
+    """ Writes ZObjects to a compact snapshot file, to be loaded again with
+    load_snapshot(), see zimsoap.snapshot.
+
+    :param objs: an iterable of ZObjects, of the classes of this module
+    """
+    snapshot.dump(objs, path, _snapshot_classes())
+
+
+def load_snapshot(path, lazy=True):
+    """ Reads a snapshot file written by dump_snapshot()
+
+    :param lazy: if True, the file is memory-mapped, and the returned
+                 snapshot.Snapshot sequence builds each object when accessed
+                 (close it when done) ; else, a list of all the objects
+    """
+    return snapshot.load(path, _snapshot_classes(), lazy)